@@ -0,0 +1,226 @@
+# annotation.py
+
+import asyncio
+import os
+import re
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont
+from artifacts import temporary_path
+
+# Fonts tried in order for box labels before falling back to PIL's default
+FONT_PATHS = ("arial.ttf", "C:/Windows/Fonts/arial.ttf")
+FONT_SIZE = 20
+
+BOX_COLOR = (255, 0, 0)  # Red color for bounding boxes
+BOX_WIDTH = 5  # Thickness of the bounding box lines
+LABEL_COLOR = (255, 255, 255)  # White text
+
+# PNG zlib level for annotated images; 1 is several times faster to encode
+# than PIL's default of 6 for a slightly larger file
+DEFAULT_COMPRESS_LEVEL = 1
+
+# Location words the vision model is asked to use, as fractions of the
+# image size: (x_min, y_min, x_max, y_max)
+LOCATION_BOXES = {
+    'center': (0.25, 0.25, 0.75, 0.75),
+    'top': (0.2, 0.05, 0.8, 0.35),
+    'bottom': (0.2, 0.65, 0.8, 0.95),
+    'left': (0.05, 0.2, 0.45, 0.8),
+    'right': (0.55, 0.2, 0.95, 0.8),
+    'top-left': (0.05, 0.05, 0.45, 0.35),
+    'top-right': (0.55, 0.05, 0.95, 0.35),
+    'bottom-left': (0.05, 0.65, 0.45, 0.95),
+    'bottom-right': (0.55, 0.65, 0.95, 0.95),
+    'foreground': (0.15, 0.3, 0.85, 0.7),
+}
+
+# One pass over the text finds every location word delimited by spaces or
+# the ends of the text; "top" does not match inside "top-left"
+_LOCATION_PATTERN = re.compile(
+    r"(?<![^ ])("
+    + "|".join(re.escape(name) for name in
+               sorted(LOCATION_BOXES, key=len, reverse=True))
+    + r")(?![^ ])"
+)
+
+# What to draw: normalized boxes if known, otherwise the text to scan for
+# location words
+AnnotationJob = namedtuple(
+    "AnnotationJob", ["image_path", "output_path", "boxes", "location_info"])
+
+
+@lru_cache(maxsize=None)
+def get_font(size=FONT_SIZE):
+    """
+    Loads the label font once per process.
+
+    Returns:
+        ImageFont: Arial if available, otherwise PIL's default font.
+    """
+    for font_path in FONT_PATHS:
+        try:
+            return ImageFont.truetype(font_path, size)
+        except (OSError, IOError):
+            continue
+    return ImageFont.load_default()
+
+
+def location_boxes(location_info):
+    """
+    Maps location words in a vision response to normalized boxes.
+
+    Args:
+        location_info (str): Text describing where the defects are.
+
+    Returns:
+        list: (x_min, y_min, x_max, y_max) fractions, one per distinct
+            location mentioned, or the center box if none is.
+    """
+    found = set(_LOCATION_PATTERN.findall(location_info.lower()))
+    boxes = [box for name, box in LOCATION_BOXES.items() if name in found]
+    # Default to center for the main subject
+    return boxes or [LOCATION_BOXES['center']]
+
+
+def render(job, compress_level=None):
+    """
+    Draws a labelled bounding box for each defect and saves the image.
+
+    Args:
+        job (AnnotationJob): Image to annotate and where to save it.
+        compress_level (int, optional): PNG compression level, 0-9.
+            Defaults to ANNOTATION_COMPRESS_LEVEL from environment or 1.
+
+    Returns:
+        str: Path to the annotated image.
+    """
+    if compress_level is None:
+        compress_level = int(os.getenv('ANNOTATION_COMPRESS_LEVEL',
+                                       DEFAULT_COMPRESS_LEVEL))
+    boxes = job.boxes or location_boxes(job.location_info or "")
+    font = get_font()
+
+    with Image.open(job.image_path) as img:
+        img.load()
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGB")
+        draw = ImageDraw.Draw(img)
+        width, height = img.size
+
+        for i, (x1, y1, x2, y2) in enumerate(boxes):
+            x1, x2 = x1 * width, x2 * width
+            y1, y2 = y1 * height, y2 * height
+            draw.rectangle([x1, y1, x2, y2], outline=BOX_COLOR,
+                           width=BOX_WIDTH)
+
+            label = f"Defect Area {i+1}"
+            bbox = draw.textbbox((0, 0), label, font=font)
+            text_width = bbox[2] - bbox[0]
+            text_height = bbox[3] - bbox[1]
+
+            # Draw background for text, then the text
+            draw.rectangle(
+                [x1, y1 - text_height - 5, x1 + text_width + 10, y1],
+                fill=BOX_COLOR
+            )
+            draw.text((x1 + 5, y1 - text_height - 2), label,
+                      fill=LABEL_COLOR, font=font)
+
+        output_dir = os.path.dirname(job.output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        # Encode next to the destination, then swap it in atomically
+        tmp_path = temporary_path(job.output_path)
+        img.save(tmp_path, format="PNG", compress_level=compress_level)
+        os.replace(tmp_path, job.output_path)
+
+    return job.output_path
+
+
+def render_batch(jobs, max_workers=None):
+    """
+    Renders many annotations across a process pool.
+
+    Args:
+        jobs (list): AnnotationJob values.
+        max_workers (int, optional): Worker processes. Defaults to the
+            number of CPUs; 1 renders in this process.
+
+    Returns:
+        list: Annotated image paths, in the same order as jobs.
+    """
+    jobs = list(jobs)
+    if max_workers == 1 or len(jobs) <= 1:
+        return [render(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        chunksize = max(1, len(jobs) // ((max_workers or os.cpu_count()
+                                          or 1) * 4))
+        return list(executor.map(render, jobs, chunksize=chunksize))
+
+
+_pool = None
+_pool_size = None
+_pool_lock = threading.Lock()
+
+
+def set_process_pool_size(workers):
+    """
+    Sets how many worker processes render annotations for the pipeline,
+    replacing ANNOTATION_WORKERS from environment. 0 renders in the
+    calling thread.
+    """
+    global _pool_size
+    shutdown_process_pool()
+    with _pool_lock:
+        _pool_size = workers
+
+
+def get_process_pool():
+    """
+    Returns the shared annotation process pool, or None when rendering
+    runs in-process (ANNOTATION_WORKERS unset or 0, the default).
+    """
+    global _pool
+    with _pool_lock:
+        workers = _pool_size
+        if workers is None:
+            workers = int(os.getenv('ANNOTATION_WORKERS', 0))
+        if workers <= 0:
+            return None
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers)
+        return _pool
+
+
+def shutdown_process_pool():
+    """Stops the shared annotation process pool, if one was started."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+def render_offloaded(job):
+    """
+    Renders one annotation in the shared process pool if configured,
+    otherwise in the calling thread, and waits for the result.
+    """
+    pool = get_process_pool()
+    if pool is None:
+        return render(job)
+    return pool.submit(render, job).result()
+
+
+async def render_async(job):
+    """
+    Async counterpart of render_offloaded. Falls back to a worker thread
+    so the event loop is never blocked by drawing.
+    """
+    pool = get_process_pool()
+    if pool is None:
+        return await asyncio.to_thread(render, job)
+    return await asyncio.get_running_loop().run_in_executor(pool, render, job)
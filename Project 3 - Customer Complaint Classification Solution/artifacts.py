@@ -0,0 +1,137 @@
+# artifacts.py
+
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_ARTIFACT_ROOT = "output/runs"
+
+_writer = None
+_pending = set()
+_offload = None
+_lock = threading.Lock()
+
+
+def new_run_id():
+    """Returns a unique, time-ordered id such as 20250101-120000-1a2b3c4d."""
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+def run_directory(run_id=None, root=None):
+    """
+    Creates the directory holding one run's artifacts.
+
+    Args:
+        run_id (str, optional): Defaults to a new unique id.
+        root (str, optional): Parent directory. Defaults to ARTIFACT_ROOT
+            from environment or output/runs.
+
+    Returns:
+        tuple: (run_id, directory).
+    """
+    run_id = run_id or new_run_id()
+    root = root or os.getenv('ARTIFACT_ROOT', DEFAULT_ARTIFACT_ROOT)
+    directory = os.path.join(root, run_id)
+    os.makedirs(directory, exist_ok=True)
+    return run_id, directory
+
+
+def temporary_path(path):
+    """Returns a sibling path to write to before replacing `path`."""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def _write_now(path, data):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = temporary_path(path)
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def set_offload(enabled):
+    """
+    Turns offloaded writes on or off, replacing ARTIFACT_OFFLOAD from
+    environment.
+    """
+    global _offload
+    with _lock:
+        _offload = enabled
+
+
+def offload_enabled():
+    """
+    Returns whether artifact writes are handed to a background writer
+    (ARTIFACT_OFFLOAD=1) instead of blocking the calling stage.
+    """
+    with _lock:
+        enabled = _offload
+    if enabled is None:
+        value = os.getenv('ARTIFACT_OFFLOAD', '').strip().lower()
+        enabled = value in ("1", "true", "yes")
+    return enabled
+
+
+def write_bytes(path, data):
+    """
+    Writes a file atomically: readers see the old or the new contents,
+    never a partial file.
+
+    With offloading enabled the write happens on a background thread and
+    this returns at once; writes run in the order they were made, so the
+    last write to a path wins. Call flush() to wait for them.
+    """
+    if not offload_enabled():
+        _write_now(path, data)
+        return
+    global _writer
+    with _lock:
+        if _writer is None:
+            # One thread keeps writes to the same path in order
+            _writer = ThreadPoolExecutor(max_workers=1,
+                                         thread_name_prefix="artifacts")
+        future = _writer.submit(_write_now, path, data)
+        _pending.add(future)
+    future.add_done_callback(_forget)
+
+
+def _forget(future):
+    # Failed writes stay pending so flush() can report them
+    if future.exception() is None:
+        with _lock:
+            _pending.discard(future)
+
+
+def write_text(path, text):
+    """Writes text as UTF-8, see write_bytes."""
+    write_bytes(path, text.encode("utf-8"))
+
+
+def write_json(path, data, indent=2):
+    """Writes data as UTF-8 JSON, see write_bytes."""
+    write_text(path, json.dumps(data, indent=indent, ensure_ascii=False))
+
+
+def flush():
+    """
+    Waits for every offloaded write made so far, raising the first
+    error any of them hit.
+    """
+    with _lock:
+        pending = list(_pending)
+    for future in pending:
+        try:
+            future.result()
+        finally:
+            with _lock:
+                _pending.discard(future)
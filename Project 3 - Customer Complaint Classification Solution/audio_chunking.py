@@ -0,0 +1,299 @@
+# audio_chunking.py
+
+import io
+import os
+import re
+import shutil
+import struct
+import subprocess
+import time
+import wave
+import numpy as np
+
+DEFAULT_CHUNK_SECONDS = 120.0
+DEFAULT_OVERLAP_SECONDS = 1.5
+# Sample rate audio is decoded to when it is not already WAV; Whisper
+# resamples to 16 kHz internally
+DECODE_SAMPLE_RATE = 16000
+
+FRAME_SECONDS = 0.02
+# Window over which loudness is averaged when looking for a pause
+PAUSE_SECONDS = 0.3
+# Longest overlap, in words, considered when stitching chunk transcripts
+MAX_OVERLAP_WORDS = 40
+
+_WORD_PATTERN = re.compile(r"[^\w']+")
+
+
+def chunk_settings():
+    """
+    Reads the chunking settings from environment.
+
+    Returns:
+        tuple: (chunk_seconds, overlap_seconds) from WHISPER_CHUNK_SECONDS
+            and WHISPER_CHUNK_OVERLAP.
+    """
+    return (
+        float(os.getenv('WHISPER_CHUNK_SECONDS', DEFAULT_CHUNK_SECONDS)),
+        float(os.getenv('WHISPER_CHUNK_OVERLAP', DEFAULT_OVERLAP_SECONDS)),
+    )
+
+
+def load_pcm(audio_file_path):
+    """
+    Decodes an audio file to mono 16-bit samples.
+
+    WAV files are read with the standard library; other formats are
+    decoded with ffmpeg, which must be on PATH.
+
+    Returns:
+        tuple: (samples as an int16 array, sample rate).
+    """
+    if audio_file_path.lower().endswith(".wav"):
+        with wave.open(audio_file_path, "rb") as wav:
+            channels = wav.getnchannels()
+            width = wav.getsampwidth()
+            rate = wav.getframerate()
+            frames = wav.readframes(wav.getnframes())
+        return _mono_int16(frames, channels, width), rate
+
+    if shutil.which("ffmpeg") is None:
+        raise ValueError(
+            f"Decoding '{audio_file_path}' needs ffmpeg. Install ffmpeg "
+            "and make sure it is on PATH, or provide a WAV file."
+        )
+    result = subprocess.run(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", audio_file_path,
+         "-f", "s16le", "-ac", "1", "-ar", str(DECODE_SAMPLE_RATE), "-"],
+        capture_output=True, check=True
+    )
+    return np.frombuffer(result.stdout, dtype=np.int16), DECODE_SAMPLE_RATE
+
+
+def _mono_int16(frames, channels, width):
+    """Converts raw interleaved PCM frames to mono int16 samples."""
+    dtype = {1: np.uint8, 2: np.int16, 4: np.int32}.get(width)
+    if dtype is None:
+        raise ValueError(f"Unsupported WAV sample width: {width} bytes")
+    samples = np.frombuffer(frames, dtype=dtype).astype(np.float32)
+    if width == 1:
+        samples = (samples - 128.0) * 256.0
+    elif width == 4:
+        samples /= 65536.0
+    return samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+
+
+def find_split_points(samples, rate, chunk_seconds=DEFAULT_CHUNK_SECONDS):
+    """
+    Picks chunk boundaries at the quietest moment shortly before each
+    chunk_seconds mark, so words are rarely cut in half.
+
+    Returns:
+        list: Sample offsets, starting with 0 and ending with the length.
+    """
+    total = len(samples)
+    chunk = int(chunk_seconds * rate)
+    if total <= chunk:
+        return [0, total]
+
+    frame = max(1, int(FRAME_SECONDS * rate))
+    usable = total // frame * frame
+    energy = (samples[:usable].astype(np.float32) ** 2).reshape(
+        -1, frame).mean(axis=1)
+    width = max(1, int(PAUSE_SECONDS / FRAME_SECONDS))
+    loudness = np.convolve(energy, np.ones(width) / width, mode="same")
+
+    # Look for a pause in the last quarter of each chunk (at most 10s)
+    search = max(1, int(min(chunk_seconds / 4, 10.0) / FRAME_SECONDS))
+    points = [0]
+    while total - points[-1] > chunk:
+        target = (points[-1] + chunk) // frame
+        start = max(points[-1] // frame + 1, target - search)
+        window = loudness[start:target]
+        best = start + int(np.argmin(window)) if len(window) else target
+        points.append(best * frame)
+    points.append(total)
+    return points
+
+
+def wav_bytes(samples, rate):
+    """Encodes mono int16 samples as a 16-bit WAV file."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+def split_audio(audio_file_path, chunk_seconds=None, overlap_seconds=None):
+    """
+    Splits a recording into overlapping WAV chunks cut at pauses.
+
+    Args:
+        audio_file_path (str): Path to the audio file.
+        chunk_seconds (float, optional): Target chunk length.
+        overlap_seconds (float, optional): Audio shared by neighboring
+            chunks. Both default to chunk_settings().
+
+    Returns:
+        list: (file name, WAV bytes) per chunk, in order.
+    """
+    default_chunk, default_overlap = chunk_settings()
+    if chunk_seconds is None:
+        chunk_seconds = default_chunk
+    if overlap_seconds is None:
+        overlap_seconds = default_overlap
+
+    samples, rate = load_pcm(audio_file_path)
+    points = find_split_points(samples, rate, chunk_seconds)
+    overlap = int(overlap_seconds * rate)
+    stem = os.path.splitext(os.path.basename(audio_file_path))[0]
+
+    chunks = []
+    for i, (start, end) in enumerate(zip(points, points[1:])):
+        start = max(0, start - overlap)
+        end = min(len(samples), end + overlap)
+        chunks.append((f"{stem}_{i:03d}.wav",
+                       wav_bytes(samples[start:end], rate)))
+    return chunks
+
+
+def _normalize_words(words):
+    return [_WORD_PATTERN.sub("", word.lower()) for word in words]
+
+
+def _overlap_length(previous, following):
+    """
+    Returns how many leading words of `following` repeat the end of
+    `previous`. Up to two leading words may be skipped, since the first
+    word of a chunk is often cut off.
+    """
+    previous = _normalize_words(previous[-MAX_OVERLAP_WORDS:])
+    following = _normalize_words(following[:MAX_OVERLAP_WORDS + 2])
+    for length in range(min(len(previous), len(following)), 1, -1):
+        tail = previous[-length:]
+        for skip in range(3):
+            if following[skip:skip + length] == tail:
+                return skip + length
+    return 0
+
+
+def append_transcript(words, text):
+    """
+    Appends the words of the next chunk's transcript to `words` in place,
+    skipping those that repeat the end of it because the chunks overlap.
+    """
+    chunk_words = text.split()
+    if words:
+        chunk_words = chunk_words[_overlap_length(words, chunk_words):]
+    words.extend(chunk_words)
+
+
+def stitch_transcripts(texts):
+    """
+    Joins chunk transcripts in order, dropping words repeated because the
+    chunks overlap.
+
+    Returns:
+        str: The combined transcript.
+    """
+    words = []
+    for text in texts:
+        append_transcript(words, text)
+    return " ".join(words)
+
+
+def _wav_layout(audio_file_path):
+    """
+    Reads a WAV header without trusting its data size, which recorders
+    often leave unset until the file is closed.
+
+    Returns:
+        tuple: (channels, sample width in bytes, sample rate, offset of
+            the first sample), or None if the header is not written yet.
+    """
+    with open(audio_file_path, "rb") as f:
+        header = f.read(12)
+        if (len(header) < 12 or header[:4] != b"RIFF"
+                or header[8:12] != b"WAVE"):
+            return None
+        layout = None
+        # Walk the chunk headers, seeking past the bodies of chunks such
+        # as LIST, bext or JUNK however large they are
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                return None
+            chunk_id = chunk_header[:4]
+            (size,) = struct.unpack("<I", chunk_header[4:])
+            if chunk_id == b"data":
+                return layout + (f.tell(),) if layout else None
+            body_start = f.tell()
+            if chunk_id == b"fmt ":
+                fmt = f.read(16)
+                if len(fmt) < 16:
+                    return None
+                channels, rate = struct.unpack("<HI", fmt[2:8])
+                (bits,) = struct.unpack("<H", fmt[14:16])
+                layout = (channels, bits // 8, rate)
+            f.seek(body_start + size + (size & 1))
+
+
+def tail_wav(audio_file_path, window_seconds=10.0, overlap_seconds=1.0,
+             poll_seconds=0.5, idle_timeout=5.0):
+    """
+    Follows a WAV file that is still being recorded, yielding each new
+    window of audio as soon as it has been written.
+
+    Args:
+        audio_file_path (str): Path to the growing WAV file.
+        window_seconds (float): Audio per window.
+        overlap_seconds (float): Audio repeated from the previous window,
+            so words cut at the boundary are heard whole.
+        poll_seconds (float): How often to check the file for new audio.
+        idle_timeout (float): Stop once the file has not grown for this
+            long, after yielding whatever audio is left.
+
+    Yields:
+        tuple: (file name, mono 16-bit WAV bytes) per window.
+    """
+    deadline = time.monotonic() + idle_timeout
+    layout = None
+    while layout is None:
+        if os.path.exists(audio_file_path):
+            layout = _wav_layout(audio_file_path)
+        if layout is None:
+            if time.monotonic() > deadline:
+                return
+            time.sleep(poll_seconds)
+    channels, width, rate, position = layout
+
+    frame_bytes = channels * width
+    window_bytes = int(window_seconds * rate) * frame_bytes
+    overlap_bytes = int(overlap_seconds * rate) * frame_bytes
+    stem = os.path.splitext(os.path.basename(audio_file_path))[0]
+    carry = b""
+    index = 0
+    last_size = -1
+    last_growth = time.monotonic()
+    while True:
+        size = os.path.getsize(audio_file_path)
+        if size != last_size:
+            last_size, last_growth = size, time.monotonic()
+        idle = time.monotonic() - last_growth > idle_timeout
+        available = (size - position) // frame_bytes * frame_bytes
+        if available >= window_bytes or (idle and available > 0):
+            with open(audio_file_path, "rb") as f:
+                f.seek(position)
+                data = f.read(min(available, window_bytes))
+            position += len(data)
+            samples = _mono_int16(carry + data, channels, width)
+            yield f"{stem}_live_{index:04d}.wav", wav_bytes(samples, rate)
+            carry = data[-overlap_bytes:] if overlap_bytes else b""
+            index += 1
+        elif idle:
+            return
+        else:
+            time.sleep(poll_seconds)
@@ -0,0 +1,248 @@
+# audio_preprocessing.py
+
+import argparse
+import os
+import shutil
+import subprocess
+import threading
+import time
+import numpy as np
+from audio_chunking import load_pcm, wav_bytes
+
+DEFAULT_AUDIO_FORMAT = "original"
+DEFAULT_SAMPLE_RATE = 16000
+DEFAULT_SILENCE_DB = -45.0
+DEFAULT_UPLOAD_MBPS = 10.0
+
+# Silence kept around the speech when trimming
+TRIM_PADDING_SECONDS = 0.2
+TRIM_FRAME_SECONDS = 0.02
+
+# Output formats, their file extensions and ffmpeg encoder arguments
+# (None: encoded in pure Python)
+AUDIO_FORMATS = {
+    "wav": (".wav", None),
+    "flac": (".flac", ["-c:a", "flac"]),
+    "mp3": (".mp3", ["-c:a", "libmp3lame", "-b:a", "32k"]),
+    "opus": (".ogg", ["-c:a", "libopus", "-b:a", "24k",
+                      "-application", "voip"]),
+}
+
+_lock = threading.Lock()
+_stats = {
+    "files": 0,
+    "skipped": 0,
+    "bytes_in": 0,
+    "bytes_out": 0,
+    "seconds_trimmed": 0.0,
+    "processing_seconds": 0.0,
+}
+
+
+def preprocess_settings():
+    """
+    Reads the audio preprocessing settings from environment.
+
+    WHISPER_AUDIO_FORMAT is original (default, upload the file unchanged),
+    wav, flac, mp3 or opus. WHISPER_SAMPLE_RATE sets the output rate and
+    WHISPER_TRIM_SILENCE (default on) trims leading and trailing audio
+    quieter than WHISPER_SILENCE_DB.
+
+    Returns:
+        tuple: (audio_format, sample_rate, trim_silence, silence_db).
+    """
+    audio_format = os.getenv('WHISPER_AUDIO_FORMAT',
+                             DEFAULT_AUDIO_FORMAT).strip().lower()
+    if audio_format != "original" and audio_format not in AUDIO_FORMATS:
+        raise ValueError(
+            f"Unsupported WHISPER_AUDIO_FORMAT '{audio_format}'. "
+            f"Use one of: original, {', '.join(AUDIO_FORMATS)}."
+        )
+    sample_rate = int(os.getenv('WHISPER_SAMPLE_RATE', DEFAULT_SAMPLE_RATE))
+    trim = os.getenv('WHISPER_TRIM_SILENCE', '1').strip().lower()
+    silence_db = float(os.getenv('WHISPER_SILENCE_DB', DEFAULT_SILENCE_DB))
+    return (audio_format, sample_rate, trim not in ("0", "false", "no"),
+            silence_db)
+
+
+def resample(samples, rate, new_rate):
+    """
+    Band-limited resampling of mono samples via the FFT, so downsampling
+    does not alias.
+
+    Returns:
+        np.ndarray: int16 samples at new_rate.
+    """
+    if rate == new_rate or not len(samples):
+        return samples
+    length = int(round(len(samples) * new_rate / rate))
+    spectrum = np.fft.rfft(samples.astype(np.float64))
+    resampled = np.fft.irfft(spectrum[:length // 2 + 1], length)
+    resampled *= length / len(samples)
+    return np.clip(resampled, -32768, 32767).astype(np.int16)
+
+
+def trim_silence(samples, rate, silence_db=DEFAULT_SILENCE_DB):
+    """
+    Drops leading and trailing audio quieter than silence_db (relative to
+    full scale), keeping a short pad around the speech.
+
+    Returns:
+        np.ndarray: The trimmed samples.
+    """
+    frame = max(1, int(TRIM_FRAME_SECONDS * rate))
+    usable = len(samples) // frame * frame
+    if not usable:
+        return samples
+    frames = samples[:usable].astype(np.float32).reshape(-1, frame)
+    rms = np.sqrt((frames ** 2).mean(axis=1)) / 32768.0
+    loud = np.flatnonzero(rms > 10 ** (silence_db / 20.0))
+    if not len(loud):
+        return samples
+    pad = int(TRIM_PADDING_SECONDS * rate)
+    start = max(0, loud[0] * frame - pad)
+    end = min(len(samples), (loud[-1] + 1) * frame + pad)
+    return samples[start:end]
+
+
+def _encode(samples, rate, audio_format):
+    """Encodes mono int16 samples; formats other than wav need ffmpeg."""
+    _, encoder = AUDIO_FORMATS[audio_format]
+    if encoder is None:
+        return wav_bytes(samples, rate)
+    result = subprocess.run(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-f", "s16le",
+         "-ac", "1", "-ar", str(rate), "-i", "-", *encoder,
+         "-f", "ogg" if audio_format == "opus" else audio_format, "-"],
+        input=samples.tobytes(), capture_output=True, check=True
+    )
+    return result.stdout
+
+
+def _needs_ffmpeg(audio_file_path, audio_format):
+    return (not audio_file_path.lower().endswith(".wav")
+            or AUDIO_FORMATS[audio_format][1] is not None)
+
+
+def preprocess_audio(audio_file_path, audio_format="wav",
+                     sample_rate=DEFAULT_SAMPLE_RATE, trim=True,
+                     silence_db=DEFAULT_SILENCE_DB):
+    """
+    Shrinks a recording for upload: downmixes to mono, resamples, trims
+    leading and trailing silence and re-encodes it.
+
+    WAV input encoded to wav needs nothing beyond NumPy; other input or
+    output formats are decoded/encoded with ffmpeg.
+
+    Args:
+        audio_file_path (str): Path to the recording.
+        audio_format (str): "wav", "flac", "mp3" or "opus".
+        sample_rate (int): Output sample rate in Hz.
+        trim (bool): Trim leading and trailing silence.
+        silence_db (float): Loudness below which audio counts as silence.
+
+    Returns:
+        tuple: (encoded bytes, file extension, seconds trimmed).
+    """
+    samples, rate = load_pcm(audio_file_path)
+    samples = resample(samples, rate, sample_rate)
+    trimmed = 0.0
+    if trim:
+        kept = trim_silence(samples, sample_rate, silence_db)
+        trimmed = (len(samples) - len(kept)) / sample_rate
+        samples = kept
+    extension = AUDIO_FORMATS[audio_format][0]
+    return _encode(samples, sample_rate, audio_format), extension, trimmed
+
+
+def prepare_upload(audio_file_path, settings=None):
+    """
+    Returns the audio to send to Whisper, preprocessed with the
+    configured settings.
+
+    The original file is sent when preprocessing is off, when it would
+    need ffmpeg and ffmpeg is not installed, or when it would not make
+    the upload smaller.
+
+    Args:
+        audio_file_path (str): Path to the recording.
+        settings (tuple, optional): See preprocess_settings().
+
+    Returns:
+        tuple: (file name, audio bytes).
+    """
+    if settings is None:
+        settings = preprocess_settings()
+    audio_format, sample_rate, trim, silence_db = settings
+    file_name = os.path.basename(audio_file_path)
+    with open(audio_file_path, "rb") as audio_file:
+        original = audio_file.read()
+    if audio_format == "original":
+        return file_name, original
+
+    if (_needs_ffmpeg(audio_file_path, audio_format)
+            and shutil.which("ffmpeg") is None):
+        print(f"Warning: ffmpeg not found; uploading {file_name} "
+              f"without preprocessing")
+        _count_skipped()
+        return file_name, original
+
+    start = time.perf_counter()
+    encoded, extension, trimmed = preprocess_audio(
+        audio_file_path, audio_format, sample_rate, trim, silence_db)
+    elapsed = time.perf_counter() - start
+    if len(encoded) >= len(original):
+        _count_skipped()
+        return file_name, original
+
+    with _lock:
+        _stats["files"] += 1
+        _stats["bytes_in"] += len(original)
+        _stats["bytes_out"] += len(encoded)
+        _stats["seconds_trimmed"] += trimmed
+        _stats["processing_seconds"] += elapsed
+    return os.path.splitext(file_name)[0] + extension, encoded
+
+
+def _count_skipped():
+    with _lock:
+        _stats["skipped"] += 1
+
+
+def get_stats():
+    """
+    Returns how many recordings were preprocessed or sent unchanged
+    (skipped), the bytes before/after, and the upload time saved,
+    estimated at WHISPER_UPLOAD_MBPS megabits per second (default 10).
+    """
+    with _lock:
+        stats = dict(_stats)
+    stats["bytes_saved"] = stats["bytes_in"] - stats["bytes_out"]
+    mbps = float(os.getenv('WHISPER_UPLOAD_MBPS', DEFAULT_UPLOAD_MBPS))
+    stats["upload_seconds_saved"] = round(
+        stats["bytes_saved"] * 8 / (mbps * 1_000_000), 3)
+    stats["seconds_trimmed"] = round(stats["seconds_trimmed"], 3)
+    stats["processing_seconds"] = round(stats["processing_seconds"], 3)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark audio preprocessing offline: size before "
+                    "and after, and estimated upload time saved."
+    )
+    parser.add_argument("paths", nargs="+", help="Audio files to process")
+    parser.add_argument("--format", default="wav",
+                        choices=sorted(AUDIO_FORMATS),
+                        help="Output format (default: wav, no ffmpeg "
+                             "needed for WAV input)")
+    args = parser.parse_args()
+
+    _, rate, trim_enabled, threshold = preprocess_settings()
+    for path in args.paths:
+        name, data = prepare_upload(path, (args.format, rate, trim_enabled,
+                                           threshold))
+        print(f"{path}: {os.path.getsize(path)} -> {len(data)} bytes "
+              f"({name})")
+    for stat_name, value in get_stats().items():
+        print(f"{stat_name}: {value}")
@@ -0,0 +1,531 @@
+# batch.py
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from main import (
+    PROFILES, check_speculative, main as run_pipeline,
+    main_async as run_pipeline_async, wait_for_visuals
+)
+from cache import get_cache
+from utils import close_async_clients
+from resilience import get_stats as get_resilience_stats
+from image_preprocessing import get_stats as get_preprocessing_stats
+from annotation import set_process_pool_size, shutdown_process_pool
+from local_classifier import get_stats as get_local_classifier_stats
+from gpt import get_stats as get_classification_stats
+from audio_preprocessing import get_stats as get_audio_stats
+from metrics import summarize_latencies, write_prometheus
+from jobs import JobStore
+from artifacts import set_offload
+from results_sink import ResultsSink, set_sink
+
+# Audio formats accepted by the Whisper transcription endpoint
+AUDIO_EXTENSIONS = {
+    ".flac", ".m4a", ".mp3", ".mp4", ".mpeg", ".mpga", ".ogg", ".wav", ".webm"
+}
+
+DEFAULT_CONCURRENCY = 4
+
+
+def discover_audio_files(source):
+    """
+    Lists the audio files to process from a directory or a manifest.
+
+    Args:
+        source (str): Either a directory containing audio files, or a
+            manifest file listing one audio path per line. Blank lines and
+            lines starting with '#' are ignored, and relative paths are
+            resolved against the manifest's directory.
+
+    Returns:
+        list: Paths to the audio files, in a stable order.
+    """
+    if os.path.isdir(source):
+        return sorted(
+            os.path.join(source, name)
+            for name in os.listdir(source)
+            if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS
+        )
+
+    if not os.path.exists(source):
+        raise FileNotFoundError(f"Audio directory or manifest not found: "
+                                f"{source}")
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    audio_files = []
+    with open(source, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if not os.path.isabs(line):
+                line = os.path.join(base_dir, line)
+            audio_files.append(line)
+    return audio_files
+
+
+def _run_directories(audio_files, output_root):
+    """Maps each audio file to its own output directory."""
+    run_dirs = []
+    used = set()
+    for audio_file_path in audio_files:
+        stem = os.path.splitext(os.path.basename(audio_file_path))[0]
+        name = stem
+        suffix = 1
+        while name in used:
+            suffix += 1
+            name = f"{stem}_{suffix}"
+        used.add(name)
+        run_dirs.append(os.path.join(output_root, name))
+    return run_dirs
+
+
+def process_file(audio_file_path, output_dir, **pipeline_options):
+    """
+    Runs the complaint pipeline for one audio file.
+
+    Errors are captured in the returned record instead of being raised, so
+    one failing recording does not abort the rest of the batch. With the
+    "deferred-visuals" profile the record waits for the run's background
+    image stages, and their failure fails the record.
+
+    Args:
+        audio_file_path (str): Path to the audio complaint file.
+        output_dir (str): Directory for this file's intermediate results.
+        **pipeline_options: Extra keyword arguments for main.main.
+
+    Returns:
+        dict: The result record for this file.
+    """
+    record = {
+        "audio_file_path": audio_file_path,
+        "output_dir": output_dir,
+    }
+    start = time.perf_counter()
+    try:
+        results = run_pipeline(audio_file_path, output_dir=output_dir,
+                               verbose=False, **pipeline_options)
+        if results.get("visuals") == "pending":
+            results = wait_for_visuals(results["run_id"])
+        _record_results(record, results)
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["elapsed_seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+async def process_file_async(audio_file_path, output_dir,
+                             **pipeline_options):
+    """Async counterpart of process_file, using main.main_async."""
+    record = {
+        "audio_file_path": audio_file_path,
+        "output_dir": output_dir,
+    }
+    start = time.perf_counter()
+    try:
+        results = await run_pipeline_async(audio_file_path,
+                                           output_dir=output_dir,
+                                           verbose=False, **pipeline_options)
+        if results.get("visuals") == "pending":
+            results = await asyncio.to_thread(wait_for_visuals,
+                                              results["run_id"])
+        _record_results(record, results)
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["elapsed_seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def _record_results(record, results):
+    record.update(results)
+    if results.get("visuals") == "failed":
+        record["status"] = "error"
+        record["error"] = results["visuals_error"]
+    else:
+        record["status"] = "ok"
+
+
+def _prepare_batch(source, output_root, results_path, concurrency):
+    """Resolves batch settings and creates the output directories."""
+    if not concurrency:
+        concurrency = int(os.getenv('BATCH_CONCURRENCY',
+                                    DEFAULT_CONCURRENCY))
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+
+    audio_files = discover_audio_files(source)
+    run_dirs = _run_directories(audio_files, output_root)
+
+    os.makedirs(output_root, exist_ok=True)
+    if results_path is None:
+        results_path = os.path.join(output_root, "results.jsonl")
+    results_dir = os.path.dirname(results_path)
+    if results_dir:
+        os.makedirs(results_dir, exist_ok=True)
+
+    return audio_files, run_dirs, results_path, concurrency
+
+
+def _write_record(results_file, record):
+    results_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+    results_file.flush()
+    print(f"[{record['status']}] {record['audio_file_path']} "
+          f"({record['elapsed_seconds']}s)")
+
+
+def _print_summary(records, elapsed, results_path):
+    failed = sum(1 for record in records if record["status"] != "ok")
+    print("=" * 50)
+    print(f"BATCH COMPLETE: {len(records)} file(s), {failed} failed, "
+          f"{elapsed:.1f}s total")
+    latencies = summarize_latencies(
+        record["timings"] for record in records if record["status"] == "ok")
+    if latencies:
+        print("Stage latency (p50 / p95 / p99):")
+        for stage, summary in latencies.items():
+            print(f"  {stage}: {summary['p50']:.2f}s / "
+                  f"{summary['p95']:.2f}s / {summary['p99']:.2f}s "
+                  f"(n={summary['count']})")
+        latency_path = os.path.join(os.path.dirname(results_path),
+                                    "latency_summary.json")
+        with open(latency_path, "w", encoding="utf-8") as f:
+            json.dump(latencies, f, indent=2)
+    stats = get_resilience_stats()
+    print(f"Model calls: {stats['calls']}, retries: {stats['retries']}, "
+          f"429s: {stats['rate_limited']}, "
+          f"throttled: {stats['throttled_seconds']:.1f}s, "
+          f"backoff: {stats['backoff_seconds']:.1f}s")
+    audio_stats = get_audio_stats()
+    if audio_stats["files"]:
+        print(f"Audio uploads: {audio_stats['files']} recording(s) "
+              f"preprocessed, {audio_stats['bytes_saved'] / 1024:.0f} KiB "
+              f"saved (~{audio_stats['upload_seconds_saved']:.1f}s upload)")
+    image_stats = get_preprocessing_stats()
+    if image_stats["images"]:
+        print(f"Vision uploads: {image_stats['images']} image(s) encoded, "
+              f"{image_stats['cache_hits']} reused, "
+              f"{image_stats['bytes_saved'] / 1024:.0f} KiB saved")
+    paths = get_classification_stats()
+    print(f"Classification paths: {paths['local']} local, "
+          f"{paths['cached']} cached, {paths['structured']} structured, "
+          f"{paths['text']} text ({paths['fallback']} structured fallbacks)")
+    if paths["speculative_agreement"] is not None:
+        print(f"Speculative classification: {paths['speculative_agreed']} "
+              f"confirmed, {paths['speculative_revised']} revised by the "
+              f"image ({paths['speculative_agreement']:.0%} agreement)")
+    if paths["pruned_local"] or paths["pruned_gpt"]:
+        print(f"Candidate pruning: {paths['pruned_local']} local, "
+              f"{paths['pruned_gpt']} by category selection")
+    local_stats = get_local_classifier_stats()
+    if local_stats["predictions"]:
+        print(f"Local classifier: {local_stats['avoided']} of "
+              f"{local_stats['predictions']} GPT call(s) avoided "
+              f"({local_stats['avoided_fraction']:.0%})")
+    print(f"Results appended to {results_path}")
+
+
+def run_batch(source, output_root="output/batch", results_path=None,
+              concurrency=None, **pipeline_options):
+    """
+    Processes every audio file from a directory or manifest concurrently.
+
+    Each file runs the full transcribe -> generate -> describe/annotate ->
+    classify pipeline in its own output directory. One JSON record per file
+    is appended to the results file as soon as that file finishes.
+
+    Args:
+        source (str): Audio directory or manifest file
+            (see discover_audio_files).
+        output_root (str): Directory under which each file gets its own
+            output directory.
+        results_path (str, optional): JSONL file receiving one record per
+            file. Defaults to results.jsonl inside output_root.
+        concurrency (int, optional): Maximum number of pipelines in flight.
+            If not provided, uses BATCH_CONCURRENCY from environment or 4.
+        **pipeline_options: Extra keyword arguments for main.main, e.g.
+            combined_vision=True.
+
+    Returns:
+        list: Result records, in the same order as the input files.
+    """
+    audio_files, run_dirs, results_path, concurrency = _prepare_batch(
+        source, output_root, results_path, concurrency)
+
+    records = [None] * len(audio_files)
+    start = time.perf_counter()
+
+    try:
+        with open(results_path, "a", encoding="utf-8") as results_file, \
+                ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {
+                executor.submit(process_file, audio_file_path, run_dir,
+                                **pipeline_options): index
+                for index, (audio_file_path, run_dir)
+                in enumerate(zip(audio_files, run_dirs))
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                record = future.result()
+                records[index] = record
+                _write_record(results_file, record)
+    finally:
+        wait_for_visuals()
+        shutdown_process_pool()
+
+    _print_summary(records, time.perf_counter() - start, results_path)
+    return records
+
+
+async def run_batch_async(source, output_root="output/batch",
+                          results_path=None, concurrency=None,
+                          **pipeline_options):
+    """
+    Async counterpart of run_batch: one event loop drives every pipeline,
+    with at most `concurrency` complaints in flight at a time.
+
+    Args:
+        source (str): Audio directory or manifest file
+            (see discover_audio_files).
+        output_root (str): Directory under which each file gets its own
+            output directory.
+        results_path (str, optional): JSONL file receiving one record per
+            file. Defaults to results.jsonl inside output_root.
+        concurrency (int, optional): Maximum number of pipelines in flight.
+            If not provided, uses BATCH_CONCURRENCY from environment or 4.
+        **pipeline_options: Extra keyword arguments for main.main_async.
+
+    Returns:
+        list: Result records, in the same order as the input files.
+    """
+    audio_files, run_dirs, results_path, concurrency = _prepare_batch(
+        source, output_root, results_path, concurrency)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(index, audio_file_path, run_dir):
+        async with semaphore:
+            return index, await process_file_async(
+                audio_file_path, run_dir, **pipeline_options)
+
+    records = [None] * len(audio_files)
+    start = time.perf_counter()
+    try:
+        with open(results_path, "a", encoding="utf-8") as results_file:
+            tasks = [
+                limited(index, audio_file_path, run_dir)
+                for index, (audio_file_path, run_dir)
+                in enumerate(zip(audio_files, run_dirs))
+            ]
+            for next_done in asyncio.as_completed(tasks):
+                index, record = await next_done
+                records[index] = record
+                _write_record(results_file, record)
+    finally:
+        await close_async_clients()
+        await asyncio.to_thread(wait_for_visuals)
+        shutdown_process_pool()
+
+    _print_summary(records, time.perf_counter() - start, results_path)
+    return records
+
+
+def enqueue_files(job_store, audio_files, output_root="output/batch",
+                  **pipeline_options):
+    """
+    Queues recordings in a job store, each with its own output directory
+    under output_root. Files already queued keep their existing job.
+
+    Returns:
+        list: Job ids, in the same order as audio_files.
+    """
+    return [job_store.enqueue(audio_file_path, run_dir, pipeline_options)
+            for audio_file_path, run_dir
+            in zip(audio_files, _run_directories(audio_files, output_root))]
+
+
+def run_jobs(job_store, concurrency=None, results_path=None):
+    """
+    Works through a job store's queue until it is empty, checkpointing
+    every stage as it finishes. Jobs interrupted by an earlier crash (or
+    whose worker stopped renewing its lease) resume at their first
+    unfinished stage.
+
+    Args:
+        job_store (JobStore): Queue to work on.
+        concurrency (int, optional): Jobs in flight. If not provided, uses
+            BATCH_CONCURRENCY from environment or 4.
+        results_path (str, optional): JSONL file receiving one record per
+            job run. Defaults to results.jsonl next to the job store.
+
+    Returns:
+        list: Result records, in completion order.
+    """
+    if not concurrency:
+        concurrency = int(os.getenv('BATCH_CONCURRENCY',
+                                    DEFAULT_CONCURRENCY))
+    if results_path is None:
+        results_path = os.path.join(os.path.dirname(job_store.path),
+                                    "results.jsonl")
+    results_dir = os.path.dirname(results_path)
+    if results_dir:
+        os.makedirs(results_dir, exist_ok=True)
+
+    records = []
+    lock = threading.Lock()
+    start = time.perf_counter()
+
+    def work(worker):
+        while True:
+            job = job_store.claim(worker)
+            if job is None:
+                return
+            record = process_file(
+                job["audio_file_path"], job["output_dir"],
+                completed=job_store.completed_stages(job["id"]),
+                on_stage=job_store.checkpointer(job["id"]),
+                **job["options"])
+            record["job_id"] = job["id"]
+            record["attempt"] = job["attempts"]
+            if record["status"] == "ok":
+                job_store.finish(job["id"])
+            else:
+                job_store.fail(job["id"], record["error"])
+            with lock:
+                records.append(record)
+                _write_record(results_file, record)
+
+    worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+    try:
+        with open(results_path, "a", encoding="utf-8") as results_file, \
+                ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for future in [executor.submit(work, f"{worker_prefix}:{i}")
+                           for i in range(concurrency)]:
+                future.result()
+    finally:
+        wait_for_visuals()
+        shutdown_process_pool()
+
+    _print_summary(records, time.perf_counter() - start, results_path)
+    return records
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Classify a directory or manifest of audio complaints."
+    )
+    parser.add_argument(
+        "source",
+        help="Directory of audio files, or a manifest with one path per line"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=None,
+        help="Maximum pipelines in flight (default: BATCH_CONCURRENCY or 4)"
+    )
+    parser.add_argument(
+        "--output-root", default="output/batch",
+        help="Directory holding one output directory per audio file"
+    )
+    parser.add_argument(
+        "--results", default=None,
+        help="JSONL file receiving one record per audio file"
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="Call every model again instead of reusing cached results"
+    )
+    parser.add_argument(
+        "--async", dest="use_async", action="store_true",
+        help="Drive all pipelines from one asyncio event loop"
+    )
+    parser.add_argument(
+        "--combined-vision", action="store_true",
+        help="Describe and locate defects with one structured vision call"
+    )
+    parser.add_argument(
+        "--profile", choices=PROFILES, default=None,
+        help="full, text-only (transcribe and classify) or "
+             "deferred-visuals (classify first, images in the background); "
+             "default: PIPELINE_PROFILE or full"
+    )
+    parser.add_argument(
+        "--speculative", action="store_true", default=None,
+        help="With --profile deferred-visuals, return the classification "
+             "from the transcription at once, and report how often the "
+             "image changes the answer (default: CLASSIFICATION_SPECULATIVE)"
+    )
+    parser.add_argument(
+        "--offload-writes", action="store_true",
+        help="Write intermediate files on a background thread "
+             "(default: ARTIFACT_OFFLOAD)"
+    )
+    parser.add_argument(
+        "--job-store", default=None, metavar="PATH",
+        help="Queue the files in this SQLite job store and checkpoint "
+             "every stage, so rerunning the same command resumes where an "
+             "interrupted batch stopped"
+    )
+    parser.add_argument(
+        "--sink-jsonl", default=None, metavar="PATH",
+        help="Also append one flat row per complaint to this JSONL file "
+             "(default: RESULTS_SINK_JSONL)"
+    )
+    parser.add_argument(
+        "--sink-parquet", default=None, metavar="DIR",
+        help="Also write one flat row per complaint to a Parquet part "
+             "file in DIR (default: RESULTS_SINK_PARQUET; needs pyarrow)"
+    )
+    parser.add_argument(
+        "--prometheus", default=None, metavar="PATH",
+        help="Write the run's counters and stage latency histograms to "
+             "PATH in the Prometheus text format"
+    )
+    parser.add_argument(
+        "--annotation-workers", type=int, default=None,
+        help="Processes rendering annotated images "
+             "(default: ANNOTATION_WORKERS or 0, in-process)"
+    )
+    args = parser.parse_args()
+    try:
+        check_speculative(args.profile, args.speculative)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.no_cache:
+        get_cache().bypass = True
+    if args.annotation_workers is not None:
+        set_process_pool_size(args.annotation_workers)
+    if args.offload_writes:
+        set_offload(True)
+    if args.sink_jsonl or args.sink_parquet:
+        set_sink(ResultsSink(args.sink_jsonl, args.sink_parquet))
+    pipeline_options = {"combined_vision": args.combined_vision,
+                        "profile": args.profile,
+                        "speculative": args.speculative}
+    if args.job_store:
+        if args.use_async:
+            parser.error("--job-store cannot be combined with --async")
+        store = JobStore(args.job_store)
+        enqueue_files(store, discover_audio_files(args.source),
+                      args.output_root, **pipeline_options)
+        run_jobs(store, concurrency=args.concurrency,
+                 results_path=args.results or os.path.join(
+                     args.output_root, "results.jsonl"))
+    elif args.use_async:
+        asyncio.run(run_batch_async(
+            args.source, output_root=args.output_root,
+            results_path=args.results, concurrency=args.concurrency,
+            **pipeline_options))
+    else:
+        run_batch(args.source, output_root=args.output_root,
+                  results_path=args.results, concurrency=args.concurrency,
+                  **pipeline_options)
+    if args.prometheus:
+        write_prometheus(args.prometheus)
+        print(f"Prometheus metrics written to {args.prometheus}")
@@ -0,0 +1,302 @@
+# benchmark.py
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from audio_chunking import wav_bytes
+from mock_server import MockServer, load_config, placeholder_png
+from metrics import QUANTILES, percentile, summarize_latencies
+from resilience import get_stats as get_resilience_stats
+from utils import close_async_clients
+from main import (
+    PROFILES, main as run_pipeline, main_async as run_pipeline_async,
+    wait_for_visuals
+)
+from whisper import transcribe_audio
+from dalle import generate_image
+from vision import describe_image
+from gpt import classify_with_gpt
+
+DEFAULT_CONCURRENCY_LEVELS = "1,4,16"
+DEFAULT_REQUESTS = 32
+
+# Environment pointing every client at the mock server; the result cache
+# and the local classifier are disabled so every request reaches it
+MOCK_ENVIRONMENT = {
+    "AZURE_OPENAI_API_KEY": "mock-key",
+    "WHISPER_API_KEY": "mock-key",
+    "GPT_DEPLOYMENT": "gpt-mock",
+    "DALLE_DEPLOYMENT": "dalle-mock",
+    "WHISPER_DEPLOYMENT": "whisper-mock",
+    "RESULT_CACHE_BYPASS": "1",
+    "LOCAL_CLASSIFIER": "0",
+}
+
+SAMPLE_DESCRIPTION = ("A smartphone with a large crack across the center of "
+                      "its screen.")
+SAMPLE_TRANSCRIPTION = ("The phone I ordered arrived with a cracked screen "
+                        "and will not turn on.")
+
+
+def _write_fixtures(work_dir):
+    """Writes the sample recording and image the targets run on."""
+    os.makedirs(work_dir, exist_ok=True)
+    audio_path = os.path.join(work_dir, "complaint.wav")
+    rate = 16000
+    tone = 3000 * np.sin(2 * np.pi * 220 * np.arange(5 * rate) / rate)
+    with open(audio_path, "wb") as f:
+        f.write(wav_bytes(tone.astype(np.int16), rate))
+    image_path = os.path.join(work_dir, "image.png")
+    with open(image_path, "wb") as f:
+        f.write(placeholder_png())
+    return audio_path, image_path
+
+
+def benchmark_targets(audio_path, image_path, profile=None):
+    """
+    Returns the callables that can be benchmarked, each taking the output
+    directory of one request: the whole pipeline (run with `profile`) or
+    a single stage.
+    """
+    return {
+        "pipeline": lambda output_dir: run_pipeline(
+            audio_path, output_dir=output_dir, verbose=False,
+            profile=profile),
+        "transcription": lambda output_dir: transcribe_audio(
+            audio_path, output_dir=output_dir),
+        "image": lambda output_dir: generate_image(
+            f"Customer complaint: {SAMPLE_TRANSCRIPTION}",
+            output_dir=output_dir),
+        "vision": lambda output_dir: describe_image(
+            image_path, output_dir=output_dir),
+        "classification": lambda output_dir: classify_with_gpt(
+            SAMPLE_DESCRIPTION, SAMPLE_TRANSCRIPTION, output_dir=output_dir),
+    }
+
+
+def _timed(func, output_dir):
+    start = time.perf_counter()
+    try:
+        result = func(output_dir)
+        error = None
+    except Exception as e:
+        result = None
+        error = f"{type(e).__name__}: {e}"
+    return time.perf_counter() - start, result, error
+
+
+def run_level(func, concurrency, requests, work_dir):
+    """
+    Sends `requests` calls of a target with `concurrency` in flight.
+
+    Returns:
+        list: (seconds, result, error) per request.
+    """
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(
+            lambda i: _timed(func, os.path.join(work_dir, f"run_{i:04d}")),
+            range(requests)))
+
+
+async def run_level_async(audio_path, concurrency, requests, work_dir,
+                          profile=None):
+    """Async counterpart of run_level for the pipeline target."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                result = await run_pipeline_async(
+                    audio_path, output_dir=os.path.join(work_dir,
+                                                        f"run_{i:04d}"),
+                    verbose=False, profile=profile)
+                error = None
+            except Exception as e:
+                result = None
+                error = f"{type(e).__name__}: {e}"
+            return time.perf_counter() - start, result, error
+
+    try:
+        return await asyncio.gather(*(one(i) for i in range(requests)))
+    finally:
+        await close_async_clients()
+
+
+def summarize_level(target, concurrency, outcomes, elapsed, retries):
+    """
+    Computes throughput and tail latency for one concurrency level.
+
+    Returns:
+        dict: The level's report.
+    """
+    latencies = [seconds for seconds, _, error in outcomes if error is None]
+    errors = [error for _, _, error in outcomes if error is not None]
+    report = {
+        "target": target,
+        "concurrency": concurrency,
+        "requests": len(outcomes),
+        "ok": len(latencies),
+        "failed": len(errors),
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_per_second": round(len(latencies) / elapsed, 3)
+        if elapsed else None,
+        "retries": retries,
+    }
+    for q in QUANTILES:
+        value = percentile(latencies, q)
+        report[f"p{q}_seconds"] = round(value, 3) if value is not None \
+            else None
+    report["max_seconds"] = round(max(latencies), 3) if latencies else None
+    if target == "pipeline":
+        report["stages"] = summarize_latencies(
+            result["timings"] for _, result, error in outcomes
+            if error is None)
+    if errors:
+        report["first_error"] = errors[0]
+    return report
+
+
+def run_benchmark(target="pipeline", concurrency_levels=(1, 4, 16),
+                  requests=DEFAULT_REQUESTS, use_async=False,
+                  endpoint=None, config=None, work_dir=None, seed=None,
+                  profile=None):
+    """
+    Benchmarks a target against the mock server at each concurrency
+    level.
+
+    Args:
+        target (str): "pipeline" (main.main) or one stage: "transcription",
+            "image", "vision" or "classification".
+        concurrency_levels (iterable): Requests in flight per level.
+        requests (int): Requests sent per level.
+        use_async (bool): Drive the pipeline with main.main_async on one
+            event loop instead of a thread pool.
+        endpoint (str, optional): URL of an already running mock (or
+            real) endpoint. By default a MockServer is started in-process.
+        config (dict, optional): Mock server configuration, see
+            mock_server.load_config.
+        work_dir (str, optional): Directory for fixtures and per-request
+            outputs. Defaults to a temporary directory.
+        seed (int, optional): Seed for the mock's latency and errors.
+        profile (str, optional): Pipeline profile, see main.main. With
+            "deferred-visuals" the latency is that of the classification;
+            each level waits for its background image stages before the
+            next one starts.
+
+    Returns:
+        list: One report per concurrency level.
+    """
+    if use_async and target != "pipeline":
+        raise ValueError("--async is only supported for the pipeline target")
+    work_dir = work_dir or tempfile.mkdtemp(prefix="complaint-benchmark-")
+    audio_path, image_path = _write_fixtures(work_dir)
+    func = benchmark_targets(audio_path, image_path, profile)[target]
+
+    server = None
+    if endpoint is None:
+        server = MockServer(config, seed=seed).start()
+        endpoint = server.url
+    os.environ.update(MOCK_ENVIRONMENT)
+    os.environ["AZURE_OPENAI_ENDPOINT"] = endpoint
+    os.environ["WHISPER_ENDPOINT"] = endpoint
+
+    reports = []
+    try:
+        for concurrency in concurrency_levels:
+            level_dir = os.path.join(work_dir, f"{target}_c{concurrency}")
+            retries_before = get_resilience_stats()["retries"]
+            start = time.perf_counter()
+            if use_async:
+                outcomes = asyncio.run(run_level_async(
+                    audio_path, concurrency, requests, level_dir, profile))
+            else:
+                outcomes = run_level(func, concurrency, requests, level_dir)
+            elapsed = time.perf_counter() - start
+            wait_for_visuals()
+            retries = get_resilience_stats()["retries"] - retries_before
+            report = summarize_level(target, concurrency, outcomes, elapsed,
+                                     retries)
+            reports.append(report)
+            _print_level(report)
+    finally:
+        if server is not None:
+            server.stop()
+    return reports
+
+
+def _print_level(report):
+    print(f"[{report['target']}] concurrency {report['concurrency']:>3}: "
+          f"{report['throughput_per_second']}/s, "
+          f"p50 {report['p50_seconds']}s, p95 {report['p95_seconds']}s, "
+          f"p99 {report['p99_seconds']}s, "
+          f"{report['failed']} failed, {report['retries']} retries")
+    if "first_error" in report:
+        print(f"    first error: {report['first_error']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the complaint pipeline or one of its stages "
+                    "against a local mock Azure OpenAI server."
+    )
+    parser.add_argument(
+        "--target", default="pipeline",
+        choices=["pipeline", "transcription", "image", "vision",
+                 "classification"],
+        help="What to benchmark (default: the whole pipeline)")
+    parser.add_argument(
+        "--profile", choices=PROFILES, default=None,
+        help="Pipeline profile for the pipeline target "
+             "(default: PIPELINE_PROFILE or full)")
+    parser.add_argument(
+        "--concurrency", default=DEFAULT_CONCURRENCY_LEVELS,
+        help=f"Comma-separated concurrency levels "
+             f"(default: {DEFAULT_CONCURRENCY_LEVELS})")
+    parser.add_argument(
+        "--requests", type=int, default=DEFAULT_REQUESTS,
+        help=f"Requests per level (default: {DEFAULT_REQUESTS})")
+    parser.add_argument(
+        "--async", dest="use_async", action="store_true",
+        help="Drive the pipeline from one asyncio event loop")
+    parser.add_argument(
+        "--endpoint", default=None,
+        help="Use a mock server that is already running "
+             "(python mock_server.py) instead of starting one")
+    parser.add_argument("--config", default=None,
+                        help="Mock server configuration JSON file")
+    parser.add_argument("--latency-scale", type=float, default=None,
+                        help="Multiply every mock latency (e.g. 0.1)")
+    parser.add_argument("--error-rate", type=float, default=None,
+                        help="Fraction of mock requests failing with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=None,
+                        help="Fraction of mock requests failing with 429")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--work-dir", default=None,
+                        help="Directory for fixtures and outputs "
+                             "(default: a temporary directory)")
+    parser.add_argument("--output", default=None,
+                        help="Write the reports to this JSON file")
+    args = parser.parse_args()
+
+    overrides = {}
+    if args.latency_scale is not None:
+        overrides["latency_scale"] = args.latency_scale
+    if args.error_rate is not None:
+        overrides["error_rate"] = args.error_rate
+    if args.rate_limit_rate is not None:
+        overrides["rate_limit_rate"] = args.rate_limit_rate
+    levels = [int(level) for level in args.concurrency.split(",") if level]
+    benchmark_reports = run_benchmark(
+        args.target, levels, args.requests, args.use_async, args.endpoint,
+        load_config(args.config, overrides), args.work_dir, args.seed,
+        args.profile)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(benchmark_reports, f, indent=2)
+        print(f"Reports written to {args.output}")
@@ -0,0 +1,321 @@
+# cache.py
+
+import argparse
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from metrics import record
+
+DEFAULT_CACHE_DIR = ".cache/results"
+DEFAULT_CACHE_MAX_MB = 512
+
+
+def hash_key(*parts):
+    """
+    Builds a content hash from strings and bytes.
+
+    Each part is length-prefixed so that ("ab", "c") and ("a", "bc")
+    produce different keys.
+
+    Args:
+        *parts: str or bytes values identifying a result.
+
+    Returns:
+        str: Hex SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if part is None:
+            part = b""
+        elif isinstance(part, str):
+            part = part.encode("utf-8")
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """Returns the hex SHA-256 digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Disk-backed cache of stage results, evicted least-recently-used first
+    once the total size exceeds max_bytes.
+
+    Entries live at <directory>/<namespace>/<key> and are written
+    atomically. Recency is kept in the file modification time, so it
+    survives restarts.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR,
+                 max_bytes=DEFAULT_CACHE_MAX_MB * 1024 * 1024,
+                 bypass=False):
+        """
+        Args:
+            directory (str): Root directory of the cache.
+            max_bytes (int): Total size above which entries are evicted.
+            bypass (bool): If True, get() always misses and put() does
+                nothing, so every stage calls the model.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = None  # OrderedDict of path -> size, oldest first
+        self._total_bytes = 0
+
+    def _load_index(self):
+        """Scans the cache directory once to rebuild the LRU order."""
+        if self._entries is not None:
+            return
+        found = []
+        if os.path.isdir(self.directory):
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if name.endswith(".tmp"):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    found.append((stat.st_mtime, path, stat.st_size))
+        found.sort()
+        self._entries = OrderedDict(
+            (path, size) for _, path, size in found)
+        self._total_bytes = sum(self._entries.values())
+
+    def _path(self, namespace, key):
+        return os.path.join(self.directory, namespace, key)
+
+    def get(self, namespace, key):
+        """
+        Looks up a cached result.
+
+        Args:
+            namespace (str): Stage name, e.g. "transcription".
+            key (str): Content hash from hash_key().
+
+        Returns:
+            bytes: The cached value, or None on a miss.
+        """
+        if self.bypass:
+            return None
+        path = self._path(namespace, key)
+        try:
+            with open(path, "rb") as f:
+                value = f.read()
+            os.utime(path)
+        except OSError:
+            self._miss(path)
+            return None
+        self._hit(path, len(value))
+        return value
+
+    def put(self, namespace, key, value):
+        """
+        Stores a result, evicting the least recently used entries if the
+        cache grows beyond max_bytes.
+
+        Args:
+            namespace (str): Stage name, e.g. "transcription".
+            key (str): Content hash from hash_key().
+            value (bytes): Result to store.
+        """
+        if self.bypass:
+            return
+        path = self._path(namespace, key)
+
+        def write(tmp_path):
+            with open(tmp_path, "wb") as f:
+                f.write(value)
+        self._write(path, write)
+        self._stored(path, len(value))
+
+    def get_file(self, namespace, key, dest_path):
+        """
+        Copies a cached result to dest_path without loading it into memory.
+
+        Returns:
+            bool: True on a hit, False on a miss.
+        """
+        if self.bypass:
+            return False
+        path = self._path(namespace, key)
+        try:
+            shutil.copyfile(path, dest_path)
+            os.utime(path)
+        except OSError:
+            self._miss(path)
+            return False
+        self._hit(path, os.path.getsize(dest_path))
+        return True
+
+    def put_file(self, namespace, key, src_path):
+        """Stores a copy of the file at src_path as a cached result."""
+        if self.bypass:
+            return
+        path = self._path(namespace, key)
+        self._write(path, lambda tmp_path: shutil.copyfile(src_path,
+                                                           tmp_path))
+        self._stored(path, os.path.getsize(src_path))
+
+    @staticmethod
+    def _write(path, write):
+        """
+        Writes an entry through a temporary file unique to this process and
+        thread, then moves it into place, so readers and other writers
+        (threads or processes) never see a partial entry. File I/O happens
+        outside the lock; only the index updates take it.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _hit(self, path, size):
+        with self._lock:
+            self._load_index()
+            if path not in self._entries:
+                self._entries[path] = size
+                self._total_bytes += size
+            self._entries.move_to_end(path)
+            self.hits += 1
+        record(cache_hits=1)
+
+    def _miss(self, path):
+        with self._lock:
+            self._load_index()
+            self._total_bytes -= self._entries.pop(path, 0)
+            self.misses += 1
+        record(cache_misses=1)
+
+    def _stored(self, path, size):
+        with self._lock:
+            self._load_index()
+            self._total_bytes -= self._entries.pop(path, 0)
+            self._entries[path] = size
+            self._total_bytes += size
+            self._evict()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            path, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get_text(self, namespace, key):
+        """Like get(), decoding the cached value as UTF-8 text."""
+        value = self.get(namespace, key)
+        return value.decode("utf-8") if value is not None else None
+
+    def put_text(self, namespace, key, text):
+        """Like put(), encoding text as UTF-8."""
+        self.put(namespace, key, text.encode("utf-8"))
+
+    def invalidate(self, namespace=None):
+        """
+        Removes cached results.
+
+        Args:
+            namespace (str, optional): Only clear this stage's results.
+                If not provided, clears the whole cache.
+
+        Returns:
+            int: Number of entries removed.
+        """
+        prefix = (os.path.join(self.directory, namespace) + os.sep
+                  if namespace else self.directory)
+        with self._lock:
+            self._load_index()
+            removed = [path for path in self._entries
+                       if path.startswith(prefix)]
+            for path in removed:
+                self._total_bytes -= self._entries.pop(path)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        return len(removed)
+
+    def stats(self):
+        """Returns entry count, total size and hit/miss counters."""
+        with self._lock:
+            self._load_index()
+            return {
+                "directory": self.directory,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "bypass": self.bypass,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Returns the process-wide result cache, configured from environment.
+
+    Reads RESULT_CACHE_DIR, RESULT_CACHE_MAX_MB and RESULT_CACHE_BYPASS
+    (set to 1/true/yes to skip the cache entirely).
+
+    Returns:
+        ResultCache: The shared cache instance.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            bypass = os.getenv('RESULT_CACHE_BYPASS', '').strip().lower()
+            _cache = ResultCache(
+                directory=os.getenv('RESULT_CACHE_DIR', DEFAULT_CACHE_DIR),
+                max_bytes=int(float(os.getenv(
+                    'RESULT_CACHE_MAX_MB', DEFAULT_CACHE_MAX_MB))
+                    * 1024 * 1024),
+                bypass=bypass in ("1", "true", "yes"),
+            )
+        return _cache
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Inspect or clear the stage result cache."
+    )
+    parser.add_argument("command", choices=["stats", "clear"])
+    parser.add_argument(
+        "namespace", nargs="?", default=None,
+        help="Stage to clear: transcription, image, vision or classification"
+    )
+    args = parser.parse_args()
+
+    cache = get_cache()
+    if args.command == "clear":
+        removed = cache.invalidate(args.namespace)
+        print(f"Removed {removed} cached result(s)")
+    else:
+        for name, value in cache.stats().items():
+            print(f"{name}: {value}")
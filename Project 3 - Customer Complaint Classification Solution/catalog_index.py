@@ -0,0 +1,160 @@
+# catalog_index.py
+
+import re
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+# Fuzzy matches scoring below this (Dice coefficient over trigrams) are
+# rejected
+DEFAULT_MIN_SCORE = 0.6
+# Weight of a name that contains the whole query, e.g. "Shoes" within
+# "Shoes & Accessories", relative to an exact match
+CONTAINMENT_WEIGHT = 0.75
+
+_NON_WORD_PATTERN = re.compile(r"[^a-z0-9]+")
+
+
+def normalize(name):
+    """
+    Normalizes a category name for comparison: lowercase, "&" spelled as
+    "and", punctuation dropped and whitespace collapsed.
+    """
+    name = name.lower().replace("&", " and ")
+    return " ".join(_NON_WORD_PATTERN.sub(" ", name).split())
+
+
+def trigrams(text):
+    """
+    Returns the character trigrams of normalized text, padded at the
+    edges so short names still produce some.
+    """
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _TrigramIndex:
+    """Inverted index from trigram to the names containing it."""
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.exact = {}
+        self.sizes = []
+        self.postings = defaultdict(list)
+        for i, name in enumerate(self.names):
+            key = normalize(name)
+            self.exact.setdefault(key, i)
+            grams = trigrams(key)
+            self.sizes.append(len(grams))
+            for gram in grams:
+                self.postings[gram].append(i)
+
+    def best(self, text, candidates=None):
+        """
+        Returns (index, score) of the closest name, or (None, 0.0).
+
+        Args:
+            text (str): Name to look up.
+            candidates (set, optional): Restrict matches to these indexes.
+        """
+        key = normalize(text)
+        exact = self.exact.get(key)
+        if exact is not None and (candidates is None or exact in candidates):
+            return exact, 1.0
+
+        grams = trigrams(key)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+        best_index, best_score = None, 0.0
+        for i, count in shared.items():
+            if candidates is not None and i not in candidates:
+                continue
+            score = max(2.0 * count / (len(grams) + self.sizes[i]),
+                        CONTAINMENT_WEIGHT * count / len(grams))
+            if score > best_score:
+                best_index, best_score = i, score
+        return best_index, best_score
+
+
+class CatalogIndex:
+    """
+    Prebuilt lookup over every category and subcategory name, resolving
+    near-misses such as "Mobile Phones and Accessories" to the catalog's
+    exact names along with a match confidence.
+
+    Building the index is proportional to the catalog size; lookups touch
+    only the names sharing trigrams with the query and are memoized.
+    """
+
+    def __init__(self, categories, min_score=DEFAULT_MIN_SCORE):
+        """
+        Args:
+            categories (dict): Category name -> list of subcategories.
+            min_score (float): Lowest fuzzy score accepted as a match.
+        """
+        self.categories = categories
+        self.min_score = min_score
+        self._categories = _TrigramIndex(categories)
+        self._labels = [(category, subcategory)
+                        for category, subcategories in categories.items()
+                        for subcategory in subcategories]
+        self._subcategories = _TrigramIndex(
+            subcategory for _, subcategory in self._labels)
+        self._by_category = defaultdict(set)
+        for i, (category, _) in enumerate(self._labels):
+            self._by_category[category].add(i)
+        self.resolve = lru_cache(maxsize=4096)(self._resolve)
+
+    def match_category(self, name):
+        """
+        Returns (category, confidence) for the closest category name, or
+        (None, 0.0) if nothing scores at least min_score.
+        """
+        i, score = self._categories.best(name)
+        if i is None or score < self.min_score:
+            return None, 0.0
+        return self._categories.names[i], score
+
+    def match_subcategory(self, name, category=None):
+        """
+        Returns ((category, subcategory), confidence) for the closest
+        subcategory, optionally within one category, or (None, 0.0).
+        """
+        candidates = (self._by_category.get(category, set())
+                      if category is not None else None)
+        i, score = self._subcategories.best(name, candidates)
+        if i is None or score < self.min_score:
+            return None, 0.0
+        return self._labels[i], score
+
+    def _resolve(self, category, subcategory):
+        """
+        Resolves a model's answer to an exact catalog label.
+
+        Args:
+            category (str): Category as written by the model, or None.
+            subcategory (str): Subcategory as written by the model.
+
+        Returns:
+            tuple: ((category, subcategory), confidence), or (None, 0.0)
+                if the answer cannot be matched.
+        """
+        if not subcategory:
+            return None, 0.0
+        matched_category, category_score = (
+            self.match_category(category) if category else (None, 0.0))
+        if matched_category is not None:
+            label, score = self.match_subcategory(subcategory,
+                                                  matched_category)
+            if label is not None:
+                return label, category_score * score
+
+        # The subcategory alone may identify the label, e.g. when the
+        # model put it under the wrong category
+        label, score = self.match_subcategory(subcategory)
+        if label is None:
+            return None, 0.0
+        if category and label[0] != matched_category:
+            # Penalize disagreeing with the stated category
+            score *= 0.8
+        return label, score
@@ -1,17 +1,30 @@
 # dalle.py
 
-import requests
+import asyncio
+import base64
 import os
 from utils import (
     create_azure_openai_client,
-    generate_image as utils_generate_image
+    create_async_azure_openai_client,
+    get_async_http_client,
+    get_http_client,
+    generate_image as utils_generate_image,
+    generate_image_async as utils_generate_image_async
 )
+from cache import get_cache, hash_key
+from artifacts import temporary_path, write_text
+
+RESPONSE_FORMATS = ("url", "b64_json")
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Multiple of 4 so each base64 chunk decodes on its own
+B64_CHUNK_SIZE = 64 * 1024
 
 # Function to generate an image representing the customer complaint
 
 
 def generate_image(prompt, model=None, size="1024x1024",
-                   quality="standard", style="vivid"):
+                   quality="standard", style="vivid", output_dir="output",
+                   use_cache=True, response_format=None):
     """
     Generates an image based on a prompt using Azure OpenAI's DALL-E model.
 
@@ -23,13 +36,119 @@ def generate_image(prompt, model=None, size="1024x1024",
         size (str): Image size (default: "1024x1024").
         quality (str): Image quality (default: "standard").
         style (str): Image style (default: "vivid").
+        output_dir (str): Directory where the image and prompt are saved.
+        use_cache (bool): Reuse a cached image generated from the same
+            prompt and settings instead of calling DALL-E again.
+        response_format (str, optional): "b64_json" to receive the image
+            in the response and skip the download, or "url" to download
+            it afterwards. Defaults to DALLE_RESPONSE_FORMAT from
+            environment, then "url".
+
+    Returns:
+        str: The path to the generated image.
+    """
+    enhanced_prompt = _enhance_prompt(prompt)
+    model = _resolve_model(model)
+    response_format = _resolve_response_format(response_format)
+    image_path = _image_path(output_dir)
+
+    # Reuse an image generated earlier from the same prompt and settings
+    cache = get_cache() if use_cache else None
+    if cache:
+        cache_key = hash_key(enhanced_prompt, model, size, quality, style)
+        if cache.get_file("image", cache_key, image_path):
+            return _save_prompt(image_path, enhanced_prompt, output_dir)
+
+    # Create Azure OpenAI client with DALL-E API version
+    client = create_azure_openai_client(api_version=_dalle_api_version())
+
+    # Use utility function to generate the image
+    image_data = utils_generate_image(
+        client=client,
+        prompt=enhanced_prompt,
+        model=model,
+        size=size,
+        quality=quality,
+        style=style,
+        response_format=response_format
+    )
+
+    if response_format == "b64_json":
+        _write_b64_image(image_data, image_path)
+    else:
+        _download_image(image_data, image_path)
+    if cache:
+        cache.put_file("image", cache_key, image_path)
+
+    return _save_prompt(image_path, enhanced_prompt, output_dir)
+
+
+async def generate_image_async(prompt, model=None, size="1024x1024",
+                               quality="standard", style="vivid",
+                               output_dir="output", use_cache=True,
+                               response_format=None):
+    """
+    Async counterpart of generate_image. URL responses are streamed
+    through the event loop's shared async HTTP client.
+
+    Args:
+        prompt (str): The prompt describing the customer complaint
+            to visualize.
+        model (str, optional): DALL-E deployment name.
+            If not provided, uses DALLE_DEPLOYMENT from environment.
+        size (str): Image size (default: "1024x1024").
+        quality (str): Image quality (default: "standard").
+        style (str): Image style (default: "vivid").
+        output_dir (str): Directory where the image and prompt are saved.
+        use_cache (bool): Reuse a cached image generated from the same
+            prompt and settings instead of calling DALL-E again.
+        response_format (str, optional): "b64_json" or "url"; see
+            generate_image.
 
     Returns:
         str: The path to the generated image.
     """
+    enhanced_prompt = _enhance_prompt(prompt)
+    model = _resolve_model(model)
+    response_format = _resolve_response_format(response_format)
+    image_path = _image_path(output_dir)
+
+    cache = get_cache() if use_cache else None
+    if cache:
+        cache_key = hash_key(enhanced_prompt, model, size, quality, style)
+        if await asyncio.to_thread(cache.get_file, "image", cache_key,
+                                   image_path):
+            return await asyncio.to_thread(_save_prompt, image_path,
+                                           enhanced_prompt, output_dir)
+
+    client = create_async_azure_openai_client(
+        api_version=_dalle_api_version())
+    image_data = await utils_generate_image_async(
+        client=client,
+        prompt=enhanced_prompt,
+        model=model,
+        size=size,
+        quality=quality,
+        style=style,
+        response_format=response_format
+    )
+
+    if response_format == "b64_json":
+        await asyncio.to_thread(_write_b64_image, image_data, image_path)
+    else:
+        await _download_image_async(image_data, image_path)
+    if cache:
+        await asyncio.to_thread(cache.put_file, "image", cache_key,
+                                image_path)
+
+    return await asyncio.to_thread(_save_prompt, image_path,
+                                   enhanced_prompt, output_dir)
+
+
+def _enhance_prompt(prompt):
     # Create a detailed, specific prompt to ensure accurate visual representation
     # Extract key defect details from the complaint
-    enhanced_prompt = (
+    return (
         f"Create a clear, detailed, realistic illustration showing the exact "
         f"customer complaint: {prompt}. "
         f"The image must accurately and clearly show: "
@@ -43,6 +162,8 @@ def generate_image(prompt, model=None, size="1024x1024",
         f"The image should be photorealistic and clearly show the complaint issue."
     )
 
+
+def _resolve_model(model):
     # Use deployment name from environment if not provided
     if not model:
         model = os.getenv('DALLE_DEPLOYMENT')
@@ -51,40 +172,95 @@ def generate_image(prompt, model=None, size="1024x1024",
                 "DALLE_DEPLOYMENT environment variable not set. "
                 "Please set it in your .env file or provide model parameter."
             )
+    return model
+
 
+def _dalle_api_version():
     # Use DALL-E-specific API version if available
     # Default to 2024-02-01 if not set (based on endpoint URL)
-    dalle_api_version = (
+    return (
         os.getenv('DALLE_VERSION') or
         os.getenv('GPT_VERSION') or
         '2024-02-01'  # Default API version for DALL-E
     )
 
-    # Create Azure OpenAI client with DALL-E API version
-    client = create_azure_openai_client(api_version=dalle_api_version)
 
-    # Use utility function to generate the image
-    image_url = utils_generate_image(
-        client=client,
-        prompt=enhanced_prompt,
-        model=model,
-        size=size,
-        quality=quality,
-        style=style
-    )
+def _resolve_response_format(response_format):
+    if not response_format:
+        response_format = os.getenv('DALLE_RESPONSE_FORMAT', 'url')
+    response_format = response_format.strip().lower()
+    if response_format not in RESPONSE_FORMATS:
+        raise ValueError(
+            f"Unsupported DALL-E response format '{response_format}'. "
+            f"Use one of: {', '.join(RESPONSE_FORMATS)}."
+        )
+    return response_format
+
+
+def _image_path(output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    return os.path.join(output_dir, "generated_image.png")
+
+
+def _write_b64_image(image_b64, image_path):
+    """Decodes a base64 image to disk in chunks, replacing it atomically."""
+    tmp_path = temporary_path(image_path)
+    try:
+        with open(tmp_path, "wb") as f:
+            for start in range(0, len(image_b64), B64_CHUNK_SIZE):
+                f.write(base64.b64decode(
+                    image_b64[start:start + B64_CHUNK_SIZE]))
+        os.replace(tmp_path, image_path)
+    except BaseException:
+        _discard(tmp_path)
+        raise
+
+
+def _download_image(image_url, image_path):
+    """
+    Streams an image to disk over the shared keep-alive connection pool.
+    Raises httpx.HTTPStatusError if the download fails.
+    """
+    tmp_path = temporary_path(image_path)
+    try:
+        with get_http_client().stream("GET", image_url,
+                                      timeout=30) as response:
+            response.raise_for_status()
+            with open(tmp_path, "wb") as f:
+                for chunk in response.iter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+        os.replace(tmp_path, image_path)
+    except BaseException:
+        _discard(tmp_path)
+        raise
+
+
+async def _download_image_async(image_url, image_path):
+    """Async counterpart of _download_image."""
+    tmp_path = temporary_path(image_path)
+    try:
+        async with get_async_http_client().stream("GET", image_url,
+                                                  timeout=30) as response:
+            response.raise_for_status()
+            with open(tmp_path, "wb") as f:
+                async for chunk in response.aiter_bytes(
+                        DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+        os.replace(tmp_path, image_path)
+    except BaseException:
+        _discard(tmp_path)
+        raise
+
 
-    # Download and save the image
-    os.makedirs("output", exist_ok=True)
-    image_path = "output/generated_image.png"
+def _discard(tmp_path):
+    """Removes a partially written image, if any."""
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
 
-    img_response = requests.get(image_url, timeout=30)
-    if img_response.status_code == 200:
-        with open(image_path, "wb") as f:
-            f.write(img_response.content)
 
-    # Save the prompt used
-    with open("output/image_prompt.txt", "w", encoding="utf-8") as f:
-        f.write(enhanced_prompt)
+def _save_prompt(image_path, enhanced_prompt, output_dir):
+    """Saves the prompt used to create the image and returns image_path."""
+    write_text(os.path.join(output_dir, "image_prompt.txt"), enhanced_prompt)
 
     return image_path
 
@@ -1,71 +1,739 @@
 # gpt.py
 
+import asyncio
 import json
 import os
+import threading
+from openai import BadRequestError
 from utils import (
     create_azure_openai_client,
-    chat
+    create_async_azure_openai_client,
+    chat,
+    chat_async
 )
+from cache import get_cache, hash_key
+from local_classifier import (
+    classify_locally, get_local_classifier, parse_label
+)
+from catalog_index import CatalogIndex
+from artifacts import write_text
+import metrics
+
+# Create system message for classification
+SYSTEM_MESSAGE = (
+    "You are a helpful assistant that classifies customer complaints "
+    "into appropriate categories."
+)
+
+DEFAULT_CATEGORIES_PATH = "categories.json"
+
+# Completion limits: the free-text answer vs. the schema-constrained JSON.
+# The structured limit is sized from the longest answer the schema allows,
+# at no more than STRUCTURED_CHARS_PER_TOKEN characters per token
+TEXT_MAX_TOKENS = 200
+STRUCTURED_MIN_TOKENS = 40
+STRUCTURED_CHARS_PER_TOKEN = 2
+CATEGORY_SELECTION_MAX_TOKENS = 60
+
+# Hierarchical mode: top-level categories picked by GPT, or subcategories
+# kept by the local similarity index, before the final prompt
+DEFAULT_TOP_CATEGORIES = 3
+DEFAULT_CANDIDATES = 20
+
+# Streaming mode: new transcription words before classifying again
+DEFAULT_STREAM_WORDS = 25
+
+# Rules shared by every classification prompt
+CLASSIFICATION_RULES = (
+    "CRITICAL REQUIREMENTS:\n"
+    "1. You MUST use EXACTLY one of the category names from the catalog "
+    "above (case-sensitive)\n"
+    "2. You MUST use EXACTLY one of the subcategory names from within "
+    "that category (case-sensitive)\n"
+    "3. Do NOT use generic terms like 'Product issue' or 'General'\n"
+    "4. Do NOT create new categories or subcategories\n"
+    "5. Choose the most specific and accurate match\n\n"
+)
+
+# Answer format for the free-text path, parsed by validate_classification
+TEXT_ANSWER_FORMAT = (
+    "Respond with ONLY the category and subcategory in this EXACT format:\n"
+    "Category: [exact category name from the catalog]\n"
+    "Subcategory: [exact subcategory name from that category]\n\n"
+    "Example:\n"
+    "Category: Electronics\n"
+    "Subcategory: Mobile Phones & Accessories\n\n"
+)
+
+# Answer format for the structured path, constrained by the JSON schema
+STRUCTURED_ANSWER_FORMAT = (
+    "Respond with a JSON object of this form:\n"
+    '{"classification": {"category": "Electronics", '
+    '"subcategory": "Mobile Phones & Accessories"}}\n\n'
+)
+
+_stats_lock = threading.Lock()
+_stats = {
+    "local": 0,
+    "cached": 0,
+    "structured": 0,
+    "text": 0,
+    "fallback": 0,
+    "pruned_local": 0,
+    "pruned_gpt": 0,
+    "speculative_agreed": 0,
+    "speculative_revised": 0,
+}
+
+# Deployments that rejected a JSON schema response format
+_structured_unsupported = set()
+
+
+def get_stats():
+    """
+    Returns how many classifications took each path: local (local
+    classifier), cached, structured (JSON schema), text (free-text
+    prompt) and fallback (structured attempts that fell back to text).
+    In hierarchical mode, pruned_local and pruned_gpt count how the
+    candidate subcategories were chosen. speculative_agreed and
+    speculative_revised count how often the image-based classification
+    confirmed or revised the speculative one (see
+    record_speculative_outcome), and speculative_agreement is the
+    fraction confirmed.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    compared = stats["speculative_agreed"] + stats["speculative_revised"]
+    stats["speculative_agreement"] = (
+        round(stats["speculative_agreed"] / compared, 3)
+        if compared else None)
+    return stats
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+class ClassifierContext:
+    """
+    Category catalog and prompt prefix shared by classification calls.
+
+    The catalog is parsed and minified once and reloaded only when the
+    file changes. Every prompt starts with the same instructions, catalog
+    and rules, with the complaint itself last, so the service can reuse
+    its cached prompt prefix across calls. Create one per catalog and
+    pass it to classify_with_gpt, or use get_classifier_context().
+    """
+
+    def __init__(self, categories_path=DEFAULT_CATEGORIES_PATH,
+                 system_message=SYSTEM_MESSAGE):
+        """
+        Args:
+            categories_path (str): Path to the category catalog JSON.
+            system_message (str): System message sent with each prompt.
+        """
+        self.categories_path = categories_path
+        self.system_message = system_message
+        self._lock = threading.Lock()
+        self._signature = None
+        self._index = None
+        self._prefixes = None
+        self._response_format = None
+        self._structured_max_tokens = None
+
+    def _refresh(self):
+        """Reloads the catalog if the file changed since the last load."""
+        stat = os.stat(self.categories_path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if signature != self._signature:
+                with open(self.categories_path, "r", encoding="utf-8") as f:
+                    categories = json.load(f)
+                self._index = CatalogIndex(categories)
+                self._prefixes = {
+                    False: _build_prefix(categories, TEXT_ANSWER_FORMAT),
+                    True: _build_prefix(categories, STRUCTURED_ANSWER_FORMAT),
+                    "categories": _build_category_prefix(categories),
+                }
+                self._response_format = _classification_schema(categories)
+                self._structured_max_tokens = structured_max_tokens(
+                    categories)
+                self._signature = signature
+            return (self._index, self._prefixes, self._response_format,
+                    self._structured_max_tokens)
+
+    @property
+    def categories(self):
+        """dict: Category name -> list of subcategory names."""
+        return self._refresh()[0].categories
+
+    @property
+    def index(self):
+        """CatalogIndex: Fuzzy lookup over the current catalog."""
+        return self._refresh()[0]
+
+    @property
+    def response_format(self):
+        """dict: JSON schema allowing only the catalog's pairs."""
+        return self._refresh()[2]
+
+    @property
+    def structured_max_tokens(self):
+        """int: Completion limit fitting any structured answer."""
+        return self._refresh()[3]
+
+    def build_prompt(self, image_description, transcription=None,
+                     structured=False, candidates=None):
+        """
+        Builds the classification prompt for one complaint.
+
+        Args:
+            image_description (str): Description of the generated image.
+            transcription (str, optional): The original transcription text.
+            structured (bool): Ask for the JSON answer of the structured
+                path instead of the free-text format.
+            candidates (dict, optional): Subset of the catalog to offer
+                instead of the whole catalog (hierarchical mode).
+
+        Returns:
+            tuple: (prompt, CatalogIndex) for the current catalog.
+        """
+        index, prefixes = self._refresh()[:2]
+        if candidates is None:
+            prefix = prefixes[structured]
+        else:
+            prefix = _build_prefix(candidates, STRUCTURED_ANSWER_FORMAT
+                                   if structured else TEXT_ANSWER_FORMAT)
+        prompt = prefix + _complaint_text(image_description, transcription)
+        prompt += "\nNow classify the complaint:"
+        return prompt, index
+
+    def build_category_prompt(self, image_description, transcription=None):
+        """
+        Builds the first-stage prompt of hierarchical mode, which offers
+        only the top-level category names.
+
+        Returns:
+            tuple: (prompt, CatalogIndex) for the current catalog.
+        """
+        index, prefixes = self._refresh()[:2]
+        prompt = (prefixes["categories"]
+                  + _complaint_text(image_description, transcription)
+                  + "\nNow list the categories:")
+        return prompt, index
+
+
+def _complaint_text(image_description, transcription):
+    """Formats the complaint-specific end of a prompt."""
+    text = ""
+    if image_description:
+        text += f"Image Description: {image_description}\n"
+    if transcription:
+        if text:
+            text += "\n"
+        text += f"Original Complaint Transcription: {transcription}\n"
+    return text
+
+
+def _build_prefix(categories, answer_format):
+    """Builds the static start of every prompt for a catalog."""
+    # Minified JSON carries the same catalog in far fewer tokens
+    categories_text = json.dumps(categories, separators=(",", ":"),
+                                 ensure_ascii=False)
+    return (
+        "You are a customer service classification system. Classify the "
+        "customer complaint at the end of this message into the MOST "
+        "APPROPRIATE category and subcategory from the EXACT catalog "
+        "provided below, based on its image description and complaint "
+        "details.\n\n"
+        "Available Categories and Subcategories (category: [subcategories]):"
+        f"\n{categories_text}\n\n"
+        + CLASSIFICATION_RULES
+        + answer_format
+        + "Complaint to classify:\n"
+    )
+
+
+def _build_category_prefix(categories):
+    """Builds the static start of the category selection prompt."""
+    names_text = json.dumps(list(categories), ensure_ascii=False)
+    return (
+        "You are a customer service classification system. Pick the "
+        f"top-level categories, at most {_top_categories()}, that the "
+        "customer complaint at the end of this message most likely belongs "
+        "to, from the EXACT list below.\n\n"
+        f"Available Categories:\n{names_text}\n\n"
+        "Respond with ONLY the category names, one per line, most likely "
+        "first, using the EXACT names from the list.\n\n"
+        "Complaint to classify:\n"
+    )
+
+
+def _classification_schema(categories):
+    """
+    Builds a strict JSON schema response format whose only valid answers
+    are the catalog's (category, subcategory) pairs.
+    """
+    choices = [
+        {
+            "type": "object",
+            "properties": {
+                "category": {"type": "string", "enum": [category]},
+                "subcategory": {"type": "string", "enum": subcategories},
+            },
+            "required": ["category", "subcategory"],
+            "additionalProperties": False,
+        }
+        for category, subcategories in categories.items() if subcategories
+    ]
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "complaint_classification",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {"classification": {"anyOf": choices}},
+                "required": ["classification"],
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+def structured_max_tokens(categories):
+    """
+    Returns a completion limit that fits the longest JSON answer the
+    structured schema of `categories` allows, so no valid answer is cut
+    off.
+    """
+    longest = max(
+        (len(json.dumps({"classification": {"category": category,
+                                            "subcategory": subcategory}},
+                        ensure_ascii=False))
+         for category, subcategories in categories.items()
+         for subcategory in subcategories),
+        default=0)
+    return max(STRUCTURED_MIN_TOKENS,
+               -(-longest // STRUCTURED_CHARS_PER_TOKEN))
+
+
+_default_context = None
+_default_context_lock = threading.Lock()
+
+
+def get_classifier_context():
+    """Returns the shared ClassifierContext for categories.json."""
+    global _default_context
+    with _default_context_lock:
+        if _default_context is None:
+            _default_context = ClassifierContext()
+        return _default_context
 
 # Function to classify the customer complaint based on the image description
 
 
 def classify_with_gpt(image_description, transcription=None,
-                      deployment_name=None):
+                      deployment_name=None, output_dir="output",
+                      use_cache=True, context=None, use_local=True,
+                      structured=None, hierarchical=None):
     """
     Classifies the customer complaint into a category/subcategory based on
     the image description.
 
     Args:
-        image_description (str): Description of the generated image.
+        image_description (str): Description of the generated image, or
+            None to classify from the transcription alone, e.g. a partial
+            one while the call is still going on.
         transcription (str, optional): The original transcription text.
         deployment_name (str, optional): Model/deployment name for GPT API.
             If not provided, uses GPT_DEPLOYMENT from environment.
+        output_dir (str): Directory where the classification is saved,
+            or None to not save it.
+        use_cache (bool): Reuse a cached classification of the same
+            description, transcription and catalog instead of calling GPT.
+        context (ClassifierContext, optional): Catalog and prompt prefix
+            to use. Defaults to get_classifier_context().
+        use_local (bool): Answer from the local classifier, without
+            calling GPT, when it is confident about the transcription.
+        structured (bool, optional): Constrain the answer with a JSON
+            schema of the catalog's pairs, falling back to the free-text
+            prompt if the deployment rejects it. Defaults to
+            CLASSIFICATION_MODE=structured in environment.
+        hierarchical (bool, optional): Offer the model only candidate
+            subcategories, chosen by the local similarity index or by a
+            first GPT call picking top-level categories. Defaults to
+            CLASSIFICATION_HIERARCHICAL from environment.
 
     Returns:
         str: The category and subcategory of the complaint.
     """
-    # Create a prompt that includes the image description and other details.
-    # Load categories
-    with open("categories.json", "r", encoding="utf-8") as f:
-        categories = json.load(f)
+    classification = _run_calls(
+        _classification_calls(image_description, transcription,
+                              deployment_name, use_cache, context,
+                              use_local, structured, hierarchical),
+        lambda request: chat(gpt_client=create_azure_openai_client(),
+                             **request))
+    _save_classification(classification, output_dir)
+    return classification
 
-    # Format categories for the prompt
-    categories_text = json.dumps(categories, indent=2)
 
-    prompt = (
-        "You are a customer service classification system. Based on the "
-        "following image description and complaint details, classify the "
-        "customer complaint into the MOST APPROPRIATE category and "
-        "subcategory from the EXACT catalog provided below.\n\n"
-        f"Image Description: {image_description}\n"
-    )
+async def classify_with_gpt_async(image_description, transcription=None,
+                                  deployment_name=None, output_dir="output",
+                                  use_cache=True, context=None,
+                                  use_local=True, structured=None,
+                                  hierarchical=None):
+    """
+    Async counterpart of classify_with_gpt, using the async GPT client.
+
+    Args:
+        image_description (str): Description of the generated image, or
+            None to classify from the transcription alone, e.g. a partial
+            one while the call is still going on.
+        transcription (str, optional): The original transcription text.
+        deployment_name (str, optional): Model/deployment name for GPT API.
+            If not provided, uses GPT_DEPLOYMENT from environment.
+        output_dir (str): Directory where the classification is saved,
+            or None to not save it.
+        use_cache (bool): Reuse a cached classification of the same
+            description, transcription and catalog instead of calling GPT.
+        context (ClassifierContext, optional): Catalog and prompt prefix
+            to use. Defaults to get_classifier_context().
+        use_local (bool): Answer from the local classifier, without
+            calling GPT, when it is confident about the transcription.
+        structured (bool, optional): Constrain the answer with a JSON
+            schema of the catalog's pairs, falling back to the free-text
+            prompt if the deployment rejects it. Defaults to
+            CLASSIFICATION_MODE=structured in environment.
+        hierarchical (bool, optional): Offer the model only candidate
+            subcategories, chosen by the local similarity index or by a
+            first GPT call picking top-level categories. Defaults to
+            CLASSIFICATION_HIERARCHICAL from environment.
+
+    Returns:
+        str: The category and subcategory of the complaint.
+    """
+    classification = await _run_calls_async(
+        _classification_calls(image_description, transcription,
+                              deployment_name, use_cache, context,
+                              use_local, structured, hierarchical),
+        lambda request: chat_async(
+            gpt_client=create_async_azure_openai_client(), **request))
+    await asyncio.to_thread(_save_classification, classification, output_dir)
+    return classification
+
+
+def _classification_calls(image_description, transcription, deployment_name,
+                          use_cache, context, use_local, structured,
+                          hierarchical):
+    """
+    Request building and response handling of classify_with_gpt, shared
+    with classify_with_gpt_async (see their arguments). A generator: it
+    yields the keyword arguments of chat() / chat_async(), without the
+    client, for each model call; it is sent the response, or has the
+    call's exception thrown into it.
+
+    Returns:
+        str: The category and subcategory of the complaint.
+    """
+    context = context or get_classifier_context()
+    if use_local:
+        classification = classify_locally(transcription, context.categories)
+        if classification is not None:
+            _count_source("local")
+            return classification
+
+    deployment_name = _resolve_deployment(deployment_name)
+    structured = _use_structured(structured, deployment_name)
+    candidates = None
+    if _use_hierarchical(hierarchical):
+        candidates = _local_candidates(context, image_description,
+                                       transcription)
+        if candidates is None:
+            candidates = yield from _category_selection_calls(
+                context, image_description, transcription, deployment_name,
+                use_cache)
+    prompt, index = context.build_prompt(image_description, transcription,
+                                         structured, candidates)
+
+    # The prompt embeds the description, transcription and full catalog,
+    # so any change to one of them produces a new cache key
+    cache = get_cache() if use_cache else None
+    classification = None
+    if cache:
+        cache_key = hash_key(prompt, context.system_message, deployment_name)
+        classification = cache.get_text("classification", cache_key)
+        if classification is not None:
+            _count_source("cached")
+
+    if classification is None:
+        if structured:
+            try:
+                response = yield dict(
+                    deployment_name=deployment_name,
+                    prompt=prompt,
+                    system_message=context.system_message,
+                    temperature=0,
+                    max_tokens=_structured_max_tokens(context, candidates),
+                    response_format=_response_format(context, candidates)
+                )
+                classification = _parse_structured(response, index)
+            except BadRequestError as e:
+                # Anything but a rejected response format (content
+                # filtering, context length, ...) is about this complaint
+                if not _rejects_structured(e):
+                    raise
+                _structured_rejected(deployment_name, e)
+            _count_structured(classification)
+
+        if classification is None:
+            if structured:
+                prompt, index = context.build_prompt(
+                    image_description, transcription, candidates=candidates)
+            classification = yield dict(
+                deployment_name=deployment_name,
+                prompt=prompt,
+                system_message=context.system_message,
+                temperature=0.1,  # Lower temperature for consistent results
+                max_tokens=TEXT_MAX_TOKENS
+            )
+
+            # Validate and parse classification
+            classification = validate_classification(
+                classification, index.categories, index)
+            _count_source("text")
+        if cache:
+            cache.put_text("classification", cache_key, classification)
+    return classification
+
+
+def _run_calls(calls, call):
+    """
+    Drives a generator of model requests (see _classification_calls)
+    with a blocking call, and returns its result.
+    """
+    response, error = None, None
+    while True:
+        try:
+            request = calls.throw(error) if error else calls.send(response)
+        except StopIteration as done:
+            return done.value
+        try:
+            response, error = call(request), None
+        except Exception as e:
+            response, error = None, e
+
+
+async def _run_calls_async(calls, call):
+    """Async counterpart of _run_calls, awaiting each call."""
+    response, error = None, None
+    while True:
+        try:
+            request = calls.throw(error) if error else calls.send(response)
+        except StopIteration as done:
+            return done.value
+        try:
+            response, error = await call(request), None
+        except Exception as e:
+            response, error = None, e
+
+
+def classify_stream(partials, min_new_words=None, **kwargs):
+    """
+    Classifies a call early from its partial transcription, reclassifying
+    as enough new words arrive.
+
+    Args:
+        partials (iterable): Growing transcriptions, e.g. from
+            whisper.transcribe_stream.
+        min_new_words (int, optional): Words that must be added since the
+            last classification before classifying again. Defaults to
+            CLASSIFICATION_STREAM_WORDS from environment or 25. The final
+            transcription is always classified.
+        **kwargs: Passed to classify_with_gpt.
+
+    Yields:
+        tuple: (partial transcription, classification).
+    """
+    if min_new_words is None:
+        min_new_words = int(os.getenv('CLASSIFICATION_STREAM_WORDS',
+                                      DEFAULT_STREAM_WORDS))
+    classified_words = 0
+    partial = None
+    for partial in partials:
+        words = len(partial.split())
+        if words and words - classified_words >= min_new_words:
+            classified_words = words
+            yield partial, classify_with_gpt(None, partial, **kwargs)
+    if partial and len(partial.split()) != classified_words:
+        yield partial, classify_with_gpt(None, partial, **kwargs)
+
+
+def _use_structured(structured, deployment_name):
+    """Decides whether to try the structured path for this call."""
+    if structured is None:
+        mode = os.getenv('CLASSIFICATION_MODE', 'text').strip().lower()
+        structured = mode == "structured"
+    return structured and deployment_name not in _structured_unsupported
+
+
+def _use_hierarchical(hierarchical):
+    if hierarchical is None:
+        value = os.getenv('CLASSIFICATION_HIERARCHICAL', '').strip().lower()
+        hierarchical = value in ("1", "true", "yes")
+    return hierarchical
+
+
+def _top_categories():
+    return int(os.getenv('CLASSIFICATION_TOP_CATEGORIES',
+                         DEFAULT_TOP_CATEGORIES))
+
+
+def _response_format(context, candidates):
+    if candidates is None:
+        return context.response_format
+    return _classification_schema(candidates)
+
+
+def _structured_max_tokens(context, candidates):
+    if candidates is None:
+        return context.structured_max_tokens
+    return structured_max_tokens(candidates)
+
+
+def _candidate_catalog(categories, labels):
+    """
+    Groups (category, subcategory) labels into a catalog subset, in
+    catalog order.
+    """
+    wanted = set(labels)
+    candidates = {}
+    for category, subcategories in categories.items():
+        kept = [subcategory for subcategory in subcategories
+                if (category, subcategory) in wanted]
+        if kept:
+            candidates[category] = kept
+    return candidates or None
+
+
+def _local_candidates(context, image_description, transcription):
+    """
+    Keeps the subcategories most similar to the complaint according to
+    the trained local classifier, or returns None if there is no model
+    or nothing in the complaint matches its vocabulary.
+    """
+    model = get_local_classifier()
+    if model is None:
+        return None
+    limit = int(os.getenv('CLASSIFICATION_CANDIDATES', DEFAULT_CANDIDATES))
+    ranked = model.rank(
+        f"{transcription or ''} {image_description or ''}", limit)
+    labels = [label for label, similarity in ranked if similarity > 0]
+    candidates = _candidate_catalog(context.categories, labels)
+    if candidates is not None:
+        _count("pruned_local")
+    return candidates
+
+
+def _category_candidates(index, response_text):
+    """Maps the first-stage answer to the chosen categories' subtrees."""
+    chosen = []
+    for line in response_text.splitlines():
+        name = line.strip().lstrip("-*0123456789.) ").strip()
+        category, _ = index.match_category(name) if name else (None, 0.0)
+        if category is not None and category not in chosen:
+            chosen.append(category)
+    chosen = chosen[:_top_categories()]
+    if not chosen:
+        return None
+    _count("pruned_gpt")
+    categories = index.categories
+    return {category: categories[category] for category in chosen}
+
+
+def _category_selection_calls(context, image_description, transcription,
+                              deployment_name, use_cache=True):
+    """
+    First stage of hierarchical mode: asks GPT for the likely top-level
+    categories and returns their part of the catalog, or None to offer
+    the whole catalog. A generator of model requests, see
+    _classification_calls.
+    """
+    prompt, index = context.build_category_prompt(image_description,
+                                                  transcription)
+    cache = get_cache() if use_cache else None
+    response = None
+    if cache:
+        cache_key = hash_key(prompt, context.system_message, deployment_name)
+        response = cache.get_text("category_selection", cache_key)
+    if response is None:
+        response = yield dict(
+            deployment_name=deployment_name,
+            prompt=prompt,
+            system_message=context.system_message,
+            temperature=0,
+            max_tokens=CATEGORY_SELECTION_MAX_TOKENS
+        )
+        if cache:
+            cache.put_text("category_selection", cache_key, response)
+    return _category_candidates(index, response)
+
+
+def _parse_structured(response_text, index):
+    """
+    Reads the JSON answer of the structured path.
+
+    Returns:
+        str: "Category: ...\nSubcategory: ..." text, or None if the answer
+            is not a catalog pair.
+    """
+    try:
+        answer = json.loads(response_text)["classification"]
+        category, subcategory = answer["category"], answer["subcategory"]
+    except (TypeError, ValueError, KeyError):
+        return None
+    if subcategory not in index.categories.get(category, ()):
+        return None
+    return f"Category: {category}\nSubcategory: {subcategory}"
+
+
+def _rejects_structured(error):
+    """
+    Returns whether a BadRequestError rejects the JSON schema response
+    format itself, e.g. on an API version without structured output.
+    """
+    text = " ".join(str(part) for part in (
+        getattr(error, "code", None), getattr(error, "param", None),
+        error) if part).lower()
+    return any(marker in text for marker in
+               ("response_format", "json_schema", "structured output"))
+
+
+def _structured_rejected(deployment_name, error):
+    """Stops trying the structured path on a deployment that rejects it."""
+    _structured_unsupported.add(deployment_name)
+    print(f"Warning: {deployment_name} rejected structured output, "
+          f"using text classification instead: {error}")
 
-    if transcription:
-        prompt += f"\nOriginal Complaint Transcription: {transcription}\n"
-
-    prompt += (
-        f"\nAvailable Categories and Subcategories:\n{categories_text}\n\n"
-        "CRITICAL REQUIREMENTS:\n"
-        "1. You MUST use EXACTLY one of the category names from the list "
-        "above (case-sensitive)\n"
-        "2. You MUST use EXACTLY one of the subcategory names from within "
-        "that category (case-sensitive)\n"
-        "3. Do NOT use generic terms like 'Product issue' or 'General'\n"
-        "4. Do NOT create new categories or subcategories\n"
-        "5. Choose the most specific and accurate match\n\n"
-        "Respond with ONLY the category and subcategory in this EXACT format:\n"
-        "Category: [exact category name from the catalog]\n"
-        "Subcategory: [exact subcategory name from that category]\n\n"
-        "Example:\n"
-        "Category: Electronics\n"
-        "Subcategory: Mobile Phones & Accessories\n\n"
-        "Now classify the complaint:"
-    )
 
-    # Create Azure OpenAI client
-    client = create_azure_openai_client()
+def _count_structured(classification):
+    if classification is not None:
+        _count_source("structured")
+    else:
+        _count("fallback")
 
+
+def _count_source(source):
+    """
+    Counts the path a classification took (see get_stats) and notes it
+    on the current pipeline stage as its classification_source.
+    """
+    _count(source)
+    metrics.annotate(classification_source=source)
+
+
+def _resolve_deployment(deployment_name):
     # Use deployment name from environment if not provided
     if not deployment_name:
         deployment_name = os.getenv('GPT_DEPLOYMENT')
@@ -74,35 +742,47 @@ def classify_with_gpt(image_description, transcription=None,
                 "GPT_DEPLOYMENT environment variable not set. "
                 "Please set it in your .env file or provide deployment_name."
             )
+    return deployment_name
 
-    # Create system message for classification
-    system_message = (
-        "You are a helpful assistant that classifies customer complaints "
-        "into appropriate categories."
-    )
 
-    # Use utility function for chat with custom system message
-    classification = chat(
-        gpt_client=client,
-        deployment_name=deployment_name,
-        prompt=prompt,
-        system_message=system_message,
-        temperature=0.1,  # Lower temperature for more consistent results
-        max_tokens=200
-    )
+def compare_classifications(speculative, final):
+    """
+    Checks whether the image-based classification of a complaint
+    confirms its speculative, transcription-only one.
 
-    # Validate and parse classification
-    classification = validate_classification(classification, categories)
+    Args:
+        speculative (str): Classification from the transcription alone.
+        final (str): Classification using the image description.
 
-    # Save intermediate result
-    os.makedirs("output", exist_ok=True)
-    with open("output/classification.txt", "w", encoding="utf-8") as f:
-        f.write(classification)
+    Returns:
+        bool: True if both name the same category and subcategory.
+    """
+    labels = []
+    for classification in (speculative, final):
+        label = parse_label(classification)
+        labels.append(tuple(part.lower() for part in label) if label
+                      else (classification or "").strip().lower())
+    return labels[0] == labels[1]
 
-    return classification
+
+def record_speculative_outcome(agreed):
+    """
+    Counts whether an image-based classification confirmed the
+    speculative one (see get_stats). Call once per image-based
+    classification, when it is made.
+    """
+    _count("speculative_agreed" if agreed else "speculative_revised")
 
 
-def validate_classification(classification_text, categories):
+def _save_classification(classification, output_dir):
+    if output_dir is None:
+        return
+    # Save intermediate result
+    write_text(os.path.join(output_dir, "classification.txt"),
+               classification)
+
+
+def validate_classification(classification_text, categories, index=None):
     """
     Validates that the classification uses exact category/subcategory
     from the catalog.
@@ -110,10 +790,34 @@ def validate_classification(classification_text, categories):
     Args:
         classification_text (str): Raw classification text from GPT.
         categories (dict): Dictionary of categories and subcategories.
+        index (CatalogIndex, optional): Prebuilt index over categories.
+            Built on the fly if not provided.
 
     Returns:
         str: Validated classification text.
     """
+    return match_classification(classification_text, categories, index)[0]
+
+
+def match_classification(classification_text, categories, index=None):
+    """
+    Maps a classification to the closest exact catalog names, resolving
+    near-misses such as "Mobile Phones and Accessories".
+
+    Args:
+        classification_text (str): Raw classification text from GPT.
+        categories (dict): Dictionary of categories and subcategories.
+        index (CatalogIndex, optional): Prebuilt index over categories.
+            Built on the fly if not provided.
+
+    Returns:
+        tuple: (classification text, confidence). Confidence is 1.0 for
+            an exact match and 0.0 if nothing in the catalog matched, in
+            which case the original text is returned unchanged.
+    """
+    if index is None:
+        index = CatalogIndex(categories)
+
     lines = classification_text.strip().split('\n')
     category = None
     subcategory = None
@@ -126,30 +830,14 @@ def validate_classification(classification_text, categories):
         elif line_lower.startswith('subcategory:'):
             subcategory = line.split(':', 1)[1].strip()
 
-    # Validate against catalog
-    if category and category in categories:
-        valid_subcategories = categories[category]
-        if subcategory and subcategory in valid_subcategories:
-            # Return formatted classification
-            return f"Category: {category}\nSubcategory: {subcategory}"
-        else:
-            # If subcategory is invalid, use first one from category
-            if valid_subcategories:
-                return (f"Category: {category}\n"
-                        f"Subcategory: {valid_subcategories[0]}")
-    elif category:
-        # Category not found, try to find closest match
-        category_lower = category.lower()
-        for cat in categories.keys():
-            if cat.lower() == category_lower:
-                valid_subcategories = categories[cat]
-                if valid_subcategories:
-                    return (f"Category: {cat}\n"
-                            f"Subcategory: {valid_subcategories[0]}")
-                break
-
-    # If validation fails, return original but log warning
-    return classification_text
+    label, confidence = index.resolve(category, subcategory)
+    if label is None:
+        # If validation fails, return original but log warning
+        print(f"Warning: classification not found in catalog: "
+              f"{classification_text!r}")
+        return classification_text, 0.0
+    return (f"Category: {label[0]}\nSubcategory: {label[1]}",
+            round(confidence, 3))
 
 # Example Usage (for testing purposes, remove/comment when deploying):
 # if __name__ == "__main__":
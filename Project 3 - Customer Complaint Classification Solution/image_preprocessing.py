@@ -0,0 +1,155 @@
+# image_preprocessing.py
+
+import base64
+import io
+import os
+import threading
+from collections import OrderedDict
+from PIL import Image
+from cache import file_digest
+
+DEFAULT_IMAGE_FORMAT = "jpeg"
+DEFAULT_MAX_EDGE = 1024
+DEFAULT_QUALITY = 85
+DEFAULT_DATA_URL_CACHE_SIZE = 64
+
+# Formats the preprocessing stage can produce, and their MIME types
+IMAGE_FORMATS = {
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+    "png": "image/png",
+}
+
+_lock = threading.Lock()
+_data_urls = OrderedDict()  # (digest, settings) -> data URL
+_stats = {
+    "images": 0,
+    "cache_hits": 0,
+    "bytes_in": 0,
+    "bytes_out": 0,
+}
+
+
+def preprocess_settings():
+    """
+    Reads the vision preprocessing settings from environment.
+
+    VISION_IMAGE_FORMAT is jpeg (default), webp, png or original (send
+    the file unchanged). VISION_MAX_EDGE limits the longest side in
+    pixels and VISION_IMAGE_QUALITY sets the JPEG/WebP quality.
+
+    Returns:
+        tuple: (image_format, max_edge, quality).
+    """
+    image_format = os.getenv('VISION_IMAGE_FORMAT',
+                             DEFAULT_IMAGE_FORMAT).strip().lower()
+    if image_format == "jpg":
+        image_format = "jpeg"
+    if image_format != "original" and image_format not in IMAGE_FORMATS:
+        raise ValueError(
+            f"Unsupported VISION_IMAGE_FORMAT '{image_format}'. "
+            f"Use one of: original, {', '.join(IMAGE_FORMATS)}."
+        )
+    max_edge = int(os.getenv('VISION_MAX_EDGE', DEFAULT_MAX_EDGE))
+    quality = int(os.getenv('VISION_IMAGE_QUALITY', DEFAULT_QUALITY))
+    return image_format, max_edge, quality
+
+
+def preprocess_image(image_path, image_format=DEFAULT_IMAGE_FORMAT,
+                     max_edge=DEFAULT_MAX_EDGE, quality=DEFAULT_QUALITY):
+    """
+    Re-encodes an image for upload: downscales it so its longest side is
+    at most max_edge, drops metadata and converts it to a compact format.
+
+    Args:
+        image_path (str): Path to the source image.
+        image_format (str): "jpeg", "webp" or "png".
+        max_edge (int): Maximum width/height in pixels (0 for no limit).
+        quality (int): JPEG/WebP quality, 1-100.
+
+    Returns:
+        tuple: (encoded bytes, MIME type).
+    """
+    with Image.open(image_path) as img:
+        img.load()
+        if max_edge and max(img.size) > max_edge:
+            img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        if image_format == "jpeg":
+            # JPEG has no alpha channel; flatten onto white
+            if img.mode in ("RGBA", "LA", "P"):
+                img = img.convert("RGBA")
+                background = Image.new("RGB", img.size, (255, 255, 255))
+                background.paste(img, mask=img.getchannel("A"))
+                img = background
+            elif img.mode != "RGB":
+                img = img.convert("RGB")
+
+        # Saving without exif/pnginfo arguments strips the metadata
+        buffer = io.BytesIO()
+        save_options = {}
+        if image_format in ("jpeg", "webp"):
+            save_options["quality"] = quality
+        if image_format == "jpeg":
+            save_options["optimize"] = True
+        img.save(buffer, format=image_format.upper(), **save_options)
+
+    return buffer.getvalue(), IMAGE_FORMATS[image_format]
+
+
+def image_data_url(image_path, settings=None):
+    """
+    Returns the data URL to upload for an image, preprocessing it with
+    the configured settings.
+
+    Encoded URLs are kept in a small in-memory LRU keyed by the image's
+    content hash, so repeated vision calls on the same image reuse them.
+    Set the cache size with VISION_DATA_URL_CACHE_SIZE.
+
+    Args:
+        image_path (str): Path to the image.
+        settings (tuple, optional): (image_format, max_edge, quality).
+            Defaults to preprocess_settings().
+
+    Returns:
+        str: data:<mime>;base64,<data> URL.
+    """
+    if settings is None:
+        settings = preprocess_settings()
+    cache_key = (file_digest(image_path), settings)
+
+    with _lock:
+        data_url = _data_urls.get(cache_key)
+        if data_url is not None:
+            _data_urls.move_to_end(cache_key)
+            _stats["cache_hits"] += 1
+            return data_url
+
+    image_format, max_edge, quality = settings
+    bytes_in = os.path.getsize(image_path)
+    encoded, mime_type = preprocess_image(image_path, image_format,
+                                          max_edge, quality)
+    data_url = (f"data:{mime_type};base64,"
+                f"{base64.b64encode(encoded).decode('utf-8')}")
+
+    cache_size = int(os.getenv('VISION_DATA_URL_CACHE_SIZE',
+                               DEFAULT_DATA_URL_CACHE_SIZE))
+    with _lock:
+        _stats["images"] += 1
+        _stats["bytes_in"] += bytes_in
+        _stats["bytes_out"] += len(encoded)
+        _data_urls[cache_key] = data_url
+        while len(_data_urls) > cache_size:
+            _data_urls.popitem(last=False)
+    return data_url
+
+
+def get_stats():
+    """
+    Returns how many images were preprocessed, how many data URLs were
+    served from cache, and the bytes before/after preprocessing.
+    """
+    with _lock:
+        stats = dict(_stats)
+    stats["bytes_saved"] = stats["bytes_in"] - stats["bytes_out"]
+    return stats
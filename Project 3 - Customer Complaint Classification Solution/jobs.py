@@ -0,0 +1,347 @@
+# jobs.py
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+DEFAULT_JOB_STORE = "output/jobs.db"
+DEFAULT_MAX_ATTEMPTS = 3
+# A running job whose worker has not checkpointed a stage for this long is
+# assumed dead and handed to another worker
+DEFAULT_LEASE_SECONDS = 900
+
+STATUSES = ("queued", "running", "done", "failed")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    audio_file_path TEXT NOT NULL,
+    output_dir TEXT NOT NULL,
+    options TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    heartbeat_at REAL,
+    finished_at REAL,
+    UNIQUE (audio_file_path, output_dir)
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+CREATE TABLE IF NOT EXISTS stage_results (
+    job_id INTEGER NOT NULL REFERENCES jobs (id),
+    stage TEXT NOT NULL,
+    value TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    completed_at REAL NOT NULL,
+    PRIMARY KEY (job_id, stage)
+);
+"""
+
+
+class JobStore:
+    """
+    SQLite-backed queue of complaints to process, with every finished
+    stage's result checkpointed so an interrupted run resumes at the
+    first unfinished stage.
+
+    Each method opens its own connection, so one store can be shared by
+    worker threads, and several worker processes can use the same file.
+    """
+
+    def __init__(self, path=None, max_attempts=None, lease_seconds=None):
+        """
+        Args:
+            path (str, optional): Database file. Defaults to JOB_STORE
+                from environment or output/jobs.db.
+            max_attempts (int, optional): Runs of a job before it is
+                marked failed. Defaults to JOB_MAX_ATTEMPTS or 3.
+            lease_seconds (float, optional): See DEFAULT_LEASE_SECONDS.
+                Defaults to JOB_LEASE_SECONDS or 900.
+        """
+        self.path = path or os.getenv('JOB_STORE', DEFAULT_JOB_STORE)
+        self.max_attempts = max_attempts or int(
+            os.getenv('JOB_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS))
+        self.lease_seconds = lease_seconds or float(
+            os.getenv('JOB_LEASE_SECONDS', DEFAULT_LEASE_SECONDS))
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+
+    def _connect(self):
+        # Autocommit; multi-statement updates use explicit transactions
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def enqueue(self, audio_file_path, output_dir, options=None):
+        """
+        Adds a complaint to the queue, unless the same file and output
+        directory are already queued, in which case the existing job (and
+        its checkpoints) is kept.
+
+        Returns:
+            int: The job id.
+        """
+        with closing(self._connect()) as db:
+            db.execute(
+                "INSERT OR IGNORE INTO jobs (audio_file_path, output_dir, "
+                "options, created_at) VALUES (?, ?, ?, ?)",
+                (audio_file_path, output_dir, json.dumps(options or {}),
+                 time.time()))
+            row = db.execute(
+                "SELECT id FROM jobs WHERE audio_file_path = ? "
+                "AND output_dir = ?", (audio_file_path, output_dir)
+            ).fetchone()
+        return row["id"]
+
+    def claim(self, worker):
+        """
+        Takes the oldest queued job, or a running job whose lease has
+        expired, and marks it running for `worker`.
+
+        Returns:
+            dict: The job (with options decoded), or None if there is
+                nothing to do.
+        """
+        now = time.time()
+        with closing(self._connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = db.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' "
+                    "OR (status = 'running' AND heartbeat_at < ?) "
+                    "ORDER BY id LIMIT 1", (now - self.lease_seconds,)
+                ).fetchone()
+                if row is not None:
+                    db.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, "
+                        "attempts = attempts + 1, heartbeat_at = ? "
+                        "WHERE id = ?", (worker, now, row["id"]))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job = dict(row)
+        job["options"] = json.loads(job["options"])
+        job["attempts"] += 1
+        return job
+
+    def save_stage(self, job_id, stage, value, seconds):
+        """Checkpoints one finished stage and renews the job's lease."""
+        now = time.time()
+        with closing(self._connect()) as db:
+            db.execute(
+                "INSERT OR REPLACE INTO stage_results "
+                "(job_id, stage, value, seconds, completed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (job_id, stage, json.dumps(value, ensure_ascii=False),
+                 seconds, now))
+            db.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?",
+                       (now, job_id))
+
+    def checkpointer(self, job_id):
+        """Returns an on_stage callback for main.main saving to this job."""
+        def on_stage(name, value, seconds):
+            self.save_stage(job_id, name, value, seconds)
+        return on_stage
+
+    def completed_stages(self, job_id):
+        """
+        Returns the checkpointed results of a job, for main.main's
+        `completed` argument. Stages whose result is a file path that no
+        longer exists (e.g. a deleted image) are left out so they run
+        again; main.run_stages then also reruns every stage depending on
+        them.
+
+        Returns:
+            dict: Stage name -> result.
+        """
+        with closing(self._connect()) as db:
+            rows = db.execute(
+                "SELECT stage, value FROM stage_results WHERE job_id = ?",
+                (job_id,)).fetchall()
+        completed = {}
+        for row in rows:
+            value = json.loads(row["value"])
+            if (row["stage"].endswith("_path") and isinstance(value, str)
+                    and not os.path.exists(value)):
+                continue
+            completed[row["stage"]] = value
+        return completed
+
+    def finish(self, job_id):
+        """Marks a job done."""
+        with closing(self._connect()) as db:
+            db.execute(
+                "UPDATE jobs SET status = 'done', error = NULL, "
+                "finished_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def fail(self, job_id, error):
+        """
+        Records a failed run: the job is queued again, keeping its
+        checkpoints, until it has been tried max_attempts times.
+
+        Returns:
+            str: The job's new status, "queued" or "failed".
+        """
+        with closing(self._connect()) as db:
+            db.execute(
+                "UPDATE jobs SET error = ?, status = CASE WHEN attempts < ? "
+                "THEN 'queued' ELSE 'failed' END WHERE id = ?",
+                (error, self.max_attempts, job_id))
+            row = db.execute("SELECT status FROM jobs WHERE id = ?",
+                             (job_id,)).fetchone()
+        return row["status"]
+
+    def retry_failed(self):
+        """
+        Queues every failed job again with a fresh attempt count.
+
+        Returns:
+            int: Number of jobs queued.
+        """
+        with closing(self._connect()) as db:
+            return db.execute(
+                "UPDATE jobs SET status = 'queued', attempts = 0 "
+                "WHERE status = 'failed'").rowcount
+
+    def progress(self):
+        """
+        Summarizes the queue.
+
+        Returns:
+            dict: "jobs" counts jobs per status, "stages" counts
+                checkpointed results per stage.
+        """
+        with closing(self._connect()) as db:
+            jobs = dict(db.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+            ).fetchall())
+            stages = dict(db.execute(
+                "SELECT stage, COUNT(*) FROM stage_results GROUP BY stage"
+            ).fetchall())
+        return {"jobs": {status: jobs.get(status, 0) for status in STATUSES},
+                "stages": stages}
+
+    def list_jobs(self, status=None, limit=None):
+        """
+        Lists jobs, oldest first, with the number of checkpointed stages.
+
+        Returns:
+            list: One dict per job.
+        """
+        query = ("SELECT jobs.*, COUNT(stage_results.stage) AS stages "
+                 "FROM jobs LEFT JOIN stage_results "
+                 "ON stage_results.job_id = jobs.id")
+        params = []
+        if status:
+            query += " WHERE jobs.status = ?"
+            params.append(status)
+        query += " GROUP BY jobs.id ORDER BY jobs.id"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        with closing(self._connect()) as db:
+            return [dict(row) for row in db.execute(query, params)]
+
+    def job_stages(self, job_id):
+        """Returns (stage, seconds, completed_at) rows for one job."""
+        with closing(self._connect()) as db:
+            return [tuple(row) for row in db.execute(
+                "SELECT stage, seconds, completed_at FROM stage_results "
+                "WHERE job_id = ? ORDER BY completed_at", (job_id,))]
+
+
+def _print_progress(store, status=None, job_id=None):
+    if job_id is not None:
+        for stage, seconds, completed_at in store.job_stages(job_id):
+            finished = time.strftime("%Y-%m-%d %H:%M:%S",
+                                     time.localtime(completed_at))
+            print(f"{stage}: {seconds:.2f}s, finished {finished}")
+        return
+    progress = store.progress()
+    print(", ".join(f"{count} {name}"
+                    for name, count in progress["jobs"].items()))
+    for stage, count in sorted(progress["stages"].items()):
+        print(f"  {stage}: {count} checkpointed")
+    if status:
+        for job in store.list_jobs(status):
+            line = (f"#{job['id']} {job['audio_file_path']} "
+                    f"({job['stages']} stage(s), {job['attempts']} "
+                    f"attempt(s))")
+            if job["error"]:
+                line += f": {job['error']}"
+            print(line)
+
+
+if __name__ == "__main__":
+    # Imported here: batch uses JobStore from this module
+    from batch import discover_audio_files, enqueue_files, run_jobs
+    from main import PROFILES, check_speculative
+
+    parser = argparse.ArgumentParser(
+        description="Durable complaint queue: enqueue recordings, run "
+                    "workers that resume interrupted pipelines, and "
+                    "inspect progress."
+    )
+    parser.add_argument("--store", default=None,
+                        help=f"Job database (default: JOB_STORE or "
+                             f"{DEFAULT_JOB_STORE})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue_parser = commands.add_parser(
+        "enqueue", help="Queue a directory or manifest of recordings")
+    enqueue_parser.add_argument("source")
+    enqueue_parser.add_argument("--output-root", default="output/batch")
+    enqueue_parser.add_argument("--combined-vision", action="store_true")
+    enqueue_parser.add_argument("--profile", default=None,
+                                choices=PROFILES)
+    enqueue_parser.add_argument("--speculative", action="store_true",
+                                default=None)
+
+    work_parser = commands.add_parser(
+        "work", help="Process queued jobs until the queue is empty")
+    work_parser.add_argument("--concurrency", type=int, default=None,
+                             help="Jobs in flight (default: "
+                                  "BATCH_CONCURRENCY or 4)")
+    work_parser.add_argument("--results", default=None,
+                             help="JSONL file receiving one record per job")
+
+    status_parser = commands.add_parser(
+        "status", help="Show job counts and checkpointed stages")
+    status_parser.add_argument("--list", choices=STATUSES, default=None,
+                               help="Also list jobs with this status")
+    status_parser.add_argument("--job", type=int, default=None,
+                               help="Show the checkpoints of one job")
+
+    commands.add_parser("retry", help="Queue failed jobs again")
+
+    args = parser.parse_args()
+    job_store = JobStore(args.store)
+    if args.command == "enqueue":
+        try:
+            check_speculative(args.profile, args.speculative)
+        except ValueError as e:
+            parser.error(str(e))
+        audio_files = discover_audio_files(args.source)
+        job_ids = enqueue_files(job_store, audio_files, args.output_root,
+                                combined_vision=args.combined_vision,
+                                profile=args.profile,
+                                speculative=args.speculative)
+        print(f"Queued {len(job_ids)} job(s) in {job_store.path}")
+    elif args.command == "work":
+        run_jobs(job_store, concurrency=args.concurrency,
+                 results_path=args.results)
+    elif args.command == "status":
+        _print_progress(job_store, args.list, args.job)
+    else:
+        print(f"Queued {job_store.retry_failed()} failed job(s) again")
@@ -0,0 +1,418 @@
+# local_classifier.py
+
+import argparse
+import json
+import math
+import os
+import re
+import threading
+import zlib
+from collections import Counter
+import numpy as np
+
+DEFAULT_MODEL_PATH = ".cache/local_classifier.npz"
+DEFAULT_THRESHOLD = 0.8
+# Softmax temperature turning cosine similarities into a confidence
+DEFAULT_TEMPERATURE = 0.05
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+_LABEL_PATTERN = re.compile(
+    r"^\s*category:\s*(?P<category>.+?)\s*$\s*^\s*subcategory:\s*"
+    r"(?P<subcategory>.+?)\s*$",
+    re.IGNORECASE | re.MULTILINE
+)
+STOP_WORDS = frozenset(
+    "a an and are as at be but by for from had has have i im in is it "
+    "its me my of on or so that the this to was were with you".split()
+)
+
+_stats_lock = threading.Lock()
+_stats = {
+    "predictions": 0,
+    "avoided": 0,
+    "escalated": 0,
+}
+
+
+def get_stats():
+    """
+    Returns how many complaints the local classifier scored, how many it
+    answered itself (avoided GPT calls) and how many it escalated.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["avoided_fraction"] = (
+        round(stats["avoided"] / stats["predictions"], 3)
+        if stats["predictions"] else 0.0)
+    return stats
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def tokenize(text):
+    """Returns lowercase word unigrams and bigrams, without stop words."""
+    words = [word for word in _TOKEN_PATTERN.findall(text.lower())
+             if word not in STOP_WORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def parse_label(classification_text):
+    """
+    Extracts (category, subcategory) from "Category: ...\\nSubcategory: ..."
+    text, or returns None.
+    """
+    match = _LABEL_PATTERN.search(classification_text or "")
+    if not match:
+        return None
+    return match.group("category"), match.group("subcategory")
+
+
+def format_label(category, subcategory):
+    """Formats a label the way classify_with_gpt returns it."""
+    return f"Category: {category}\nSubcategory: {subcategory}"
+
+
+class LocalClassifier:
+    """
+    Nearest-centroid TF-IDF classifier over complaint transcriptions.
+
+    Every subcategory in the catalog has a centroid, seeded from its
+    category and subcategory names and sharpened by labeled past
+    complaints.
+    """
+
+    def __init__(self, vocabulary, idf, centroids, labels, temperature=None):
+        """
+        Args:
+            vocabulary (dict): Term -> column index.
+            idf (np.ndarray): Inverse document frequency per term.
+            centroids (np.ndarray): L2-normalized centroid per label.
+            labels (list): (category, subcategory) per centroid row.
+            temperature (float, optional): Softmax temperature for
+                confidences. Defaults to LOCAL_CLASSIFIER_TEMPERATURE
+                from environment or 0.05.
+        """
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.centroids = centroids
+        self.labels = labels
+        if temperature is None:
+            temperature = float(os.getenv('LOCAL_CLASSIFIER_TEMPERATURE',
+                                          DEFAULT_TEMPERATURE))
+        self.temperature = temperature
+
+    @classmethod
+    def train(cls, categories, examples=()):
+        """
+        Builds a classifier from the catalog and labeled examples.
+
+        Args:
+            categories (dict): Category name -> list of subcategories.
+            examples (iterable): (text, category, subcategory) tuples.
+                Examples whose label is not in the catalog are skipped.
+
+        Returns:
+            LocalClassifier: The trained classifier.
+        """
+        labels = [(category, subcategory)
+                  for category, subcategories in categories.items()
+                  for subcategory in subcategories]
+        label_index = {label: i for i, label in enumerate(labels)}
+
+        documents = [(f"{category} {subcategory}", i)
+                     for i, (category, subcategory) in enumerate(labels)]
+        for text, category, subcategory in examples:
+            if (category, subcategory) in label_index and text:
+                documents.append(
+                    (text, label_index[(category, subcategory)]))
+
+        token_counts = [Counter(tokenize(text)) for text, _ in documents]
+        document_frequency = Counter()
+        for counts in token_counts:
+            document_frequency.update(counts.keys())
+        vocabulary = {term: i for i, term in
+                      enumerate(sorted(document_frequency))}
+        idf = np.ones(len(vocabulary), dtype=np.float32)
+        for term, df in document_frequency.items():
+            idf[vocabulary[term]] = (
+                math.log((1 + len(documents)) / (1 + df)) + 1.0)
+
+        model = cls(vocabulary, idf,
+                    np.zeros((len(labels), len(vocabulary)),
+                             dtype=np.float32),
+                    labels)
+        for counts, (_, label) in zip(token_counts, documents):
+            model.centroids[label] += model._vectorize(counts)
+        norms = np.linalg.norm(model.centroids, axis=1, keepdims=True)
+        model.centroids /= np.maximum(norms, 1e-12)
+        return model
+
+    def _vectorize(self, counts):
+        vector = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for term, count in counts.items():
+            column = self.vocabulary.get(term)
+            if column is not None:
+                # Sublinear term frequency
+                vector[column] = (1.0 + math.log(count)) * self.idf[column]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def predict(self, text):
+        """
+        Scores a complaint against every subcategory.
+
+        Args:
+            text (str): Complaint transcription.
+
+        Returns:
+            tuple: ((category, subcategory), confidence between 0 and 1).
+        """
+        vector = self._vectorize(Counter(tokenize(text)))
+        similarities = self.centroids @ vector
+        scaled = (similarities - similarities.max()) / self.temperature
+        probabilities = np.exp(scaled)
+        probabilities /= probabilities.sum()
+        best = int(np.argmax(probabilities))
+        return self.labels[best], float(probabilities[best])
+
+    def rank(self, text, limit=None):
+        """
+        Ranks subcategories by cosine similarity to a complaint.
+
+        Args:
+            text (str): Complaint text.
+            limit (int, optional): Number of labels to return.
+
+        Returns:
+            list: ((category, subcategory), similarity) pairs, most
+                similar first.
+        """
+        vector = self._vectorize(Counter(tokenize(text)))
+        similarities = self.centroids @ vector
+        order = np.argsort(-similarities, kind="stable")[:limit]
+        return [(self.labels[i], float(similarities[i])) for i in order]
+
+    def save(self, path):
+        """Saves the classifier as a compressed NumPy archive."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            terms=np.array(terms, dtype=str),
+            idf=self.idf,
+            centroids=self.centroids,
+            labels=np.array([json.dumps(label) for label in self.labels],
+                            dtype=str),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Loads a classifier saved with save()."""
+        with np.load(path) as data:
+            vocabulary = {str(term): i
+                          for i, term in enumerate(data["terms"])}
+            labels = [tuple(json.loads(str(label)))
+                      for label in data["labels"]]
+            return cls(vocabulary, data["idf"], data["centroids"], labels)
+
+
+_model = None
+_model_signature = None
+_model_lock = threading.Lock()
+
+
+def _model_path():
+    return os.getenv('LOCAL_CLASSIFIER_MODEL', DEFAULT_MODEL_PATH)
+
+
+def get_local_classifier():
+    """
+    Returns the trained classifier, reloading it when the model file
+    changes, or None if no model has been trained or LOCAL_CLASSIFIER is
+    set to 0/false/no.
+    """
+    global _model, _model_signature
+    enabled = os.getenv('LOCAL_CLASSIFIER', '1').strip().lower()
+    if enabled in ("0", "false", "no"):
+        return None
+    path = _model_path()
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    signature = (path, stat.st_mtime_ns, stat.st_size)
+    with _model_lock:
+        if signature != _model_signature:
+            _model = LocalClassifier.load(path)
+            _model_signature = signature
+        return _model
+
+
+def confidence_threshold():
+    """Returns LOCAL_CLASSIFIER_THRESHOLD from environment, default 0.8."""
+    return float(os.getenv('LOCAL_CLASSIFIER_THRESHOLD', DEFAULT_THRESHOLD))
+
+
+def classify_locally(transcription, categories):
+    """
+    Classifies a complaint without GPT if the local model is confident.
+
+    Args:
+        transcription (str): Complaint transcription.
+        categories (dict): Current catalog; labels missing from it are
+            escalated.
+
+    Returns:
+        str: "Category: ...\\nSubcategory: ..." text, or None to escalate
+            to GPT.
+    """
+    model = get_local_classifier()
+    if model is None or not transcription:
+        return None
+    (category, subcategory), confidence = model.predict(transcription)
+    _count("predictions")
+    if (confidence >= confidence_threshold()
+            and subcategory in categories.get(category, ())):
+        _count("avoided")
+        return format_label(category, subcategory)
+    _count("escalated")
+    return None
+
+
+def load_examples(sources):
+    """
+    Reads labeled complaints from past pipeline results.
+
+    Complaints answered by the local classifier itself
+    (classification_source "local") are skipped, so the model is never
+    trained or evaluated on its own output. Results written before the
+    source was recorded are all treated as GPT labels.
+
+    Args:
+        sources (list): results.jsonl files written by batch.py,
+            results_summary.json files written by main.py, or directories
+            searched recursively for both.
+
+    Returns:
+        list: (transcription, category, subcategory) tuples.
+    """
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            for root, _, files in os.walk(source):
+                paths.extend(os.path.join(root, name) for name in sorted(files)
+                             if name == "results_summary.json"
+                             or name.endswith(".jsonl"))
+        else:
+            paths.append(source)
+
+    examples = []
+    seen = set()
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            if path.endswith(".jsonl"):
+                records = [json.loads(line) for line in f if line.strip()]
+            else:
+                records = [json.load(f)]
+        for record in records:
+            if record.get("classification_source") == "local":
+                continue
+            label = parse_label(record.get("classification"))
+            text = record.get("transcription")
+            if label and text and (text, label) not in seen:
+                seen.add((text, label))
+                examples.append((text, *label))
+    return examples
+
+
+def split_examples(examples, holdout):
+    """
+    Splits examples into (train, held_out), putting about a `holdout`
+    fraction of them in held_out. The split hashes each transcription,
+    so the same complaint always lands on the same side and separate
+    train and evaluate runs agree on it.
+    """
+    train, held_out = [], []
+    for example in examples:
+        bucket = zlib.crc32(example[0].encode("utf-8")) % 10000
+        (held_out if bucket < holdout * 10000 else train).append(example)
+    return train, held_out
+
+
+def evaluate(model, examples, threshold):
+    """
+    Compares local predictions with the GPT labels of past complaints.
+
+    Returns:
+        dict: examples, accuracy over all of them, avoided_fraction (share
+            at or above threshold) and avoided_accuracy on that share.
+    """
+    correct = avoided = avoided_correct = 0
+    for text, category, subcategory in examples:
+        label, confidence = model.predict(text)
+        hit = label == (category, subcategory)
+        correct += hit
+        if confidence >= threshold:
+            avoided += 1
+            avoided_correct += hit
+    total = len(examples)
+    return {
+        "examples": total,
+        "threshold": threshold,
+        "accuracy": round(correct / total, 3) if total else None,
+        "avoided_fraction": round(avoided / total, 3) if total else None,
+        "avoided_accuracy": (round(avoided_correct / avoided, 3)
+                             if avoided else None),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Train or evaluate the local fast-path classifier."
+    )
+    parser.add_argument("command", choices=["train", "evaluate"])
+    parser.add_argument(
+        "sources", nargs="*",
+        help="results.jsonl / results_summary.json files or directories "
+             "holding labeled past results"
+    )
+    parser.add_argument("--categories", default="categories.json",
+                        help="Category catalog (default: categories.json)")
+    parser.add_argument("--model", default=None,
+                        help="Model file (default: LOCAL_CLASSIFIER_MODEL "
+                             f"or {DEFAULT_MODEL_PATH})")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="Confidence threshold to evaluate "
+                             "(default: LOCAL_CLASSIFIER_THRESHOLD or 0.8)")
+    parser.add_argument("--holdout", type=float, default=0.0,
+                        help="Fraction of complaints kept out of training "
+                             "and used for evaluation; pass the same value "
+                             "to train and evaluate (default: 0, all)")
+    args = parser.parse_args()
+
+    model_path = args.model or _model_path()
+    examples = load_examples(args.sources)
+    if args.holdout:
+        train_examples, held_out = split_examples(examples, args.holdout)
+        examples = (train_examples if args.command == "train"
+                    else held_out)
+    if args.command == "train":
+        with open(args.categories, "r", encoding="utf-8") as f:
+            catalog = json.load(f)
+        LocalClassifier.train(catalog, examples).save(model_path)
+        print(f"Trained on {len(examples)} labeled complaint(s); "
+              f"saved to {model_path}")
+    else:
+        threshold = (args.threshold if args.threshold is not None
+                     else confidence_threshold())
+        report = evaluate(LocalClassifier.load(model_path), examples,
+                          threshold)
+        for name, value in report.items():
+            print(f"{name}: {value}")
@@ -1,17 +1,269 @@
 # main.py
 
 # Import functions from other modules
-from whisper import transcribe_audio
-from dalle import generate_image
-from vision import describe_image, annotate_image
-from gpt import classify_with_gpt
+from whisper import transcribe_audio, transcribe_audio_async
+from dalle import generate_image, generate_image_async
+from vision import (
+    describe_image, annotate_image, analyze_image,
+    describe_image_async, annotate_image_async, analyze_image_async
+)
+from gpt import (
+    classify_with_gpt, classify_with_gpt_async, compare_classifications,
+    record_speculative_outcome
+)
+import artifacts
+import metrics
+import results_sink
+from collections import namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import argparse
+import asyncio
+import contextvars
+import inspect
 import os
-import json
+import threading
+import time
+
+# A pipeline stage: `func` is called with the results of `deps` as keyword
+# arguments, and its return value is stored under `name`.
+Stage = namedtuple("Stage", ["name", "func", "deps"])
+
+# "full" runs every stage. "text-only" classifies from the transcription
+# alone, and "deferred-visuals" does the same, then generates, describes
+# and annotates the image in the background
+PROFILES = ("full", "text-only", "deferred-visuals")
+DEFAULT_PROFILE = "full"
+DEFAULT_VISUALS_WORKERS = 4
+
+# Result keys produced by the image stages
+VISUAL_KEYS = ("prompt", "image_path", "image_analysis", "image_description",
+               "annotated_image_path")
+
+_visuals_lock = threading.Lock()
+_visuals_executor = None
+_visuals = {}  # run_id -> Future of the run's final results
+
+
+def run_stages(stages, max_workers=None, on_complete=None, completed=None):
+    """
+    Runs a dependency graph of stages, starting each one as soon as all of
+    its dependencies have finished.
+
+    Args:
+        stages (list): Stage tuples. Every dependency must name another
+            stage in the list.
+        max_workers (int, optional): Maximum number of stages running at
+            once. Defaults to the number of stages.
+        on_complete (callable, optional): Called as
+            on_complete(name, result, seconds) after each stage finishes.
+        completed (dict, optional): Results of stages finished by an
+            earlier, interrupted run. These stages are not run again.
+
+    Returns:
+        tuple: (results, timings) where results maps stage names to their
+            return values and timings holds per-stage durations, the wall
+            time and the critical path through the graph.
+    """
+    _check_stages(stages)
+
+    results, durations = _restored_results(stages, completed)
+    restored = sorted(results)
+    pending = [stage for stage in stages if stage.name not in results]
+    running = {}
+
+    def timed_call(stage, kwargs):
+        start = time.perf_counter()
+        with metrics.stage(stage.name):
+            value = stage.func(**kwargs)
+        return value, time.perf_counter() - start
+
+    run_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers or len(stages)) \
+            as executor:
+        while pending or running:
+            ready = [stage for stage in pending
+                     if all(dep in results for dep in stage.deps)]
+            for stage in ready:
+                pending.remove(stage)
+                kwargs = {dep: results[dep] for dep in stage.deps}
+                # Run in a copy of the caller's context so the stage's
+                # metrics reach the caller's run
+                running[executor.submit(contextvars.copy_context().run,
+                                        timed_call, stage, kwargs)] = stage
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                try:
+                    value, seconds = future.result()
+                except Exception:
+                    # Don't start anything new; let running stages finish
+                    for other in running:
+                        other.cancel()
+                    raise
+                results[stage.name] = value
+                durations[stage.name] = seconds
+                if on_complete:
+                    on_complete(stage.name, value, seconds)
+    wall_seconds = time.perf_counter() - run_start
+
+    return results, _stage_timings(stages, durations, wall_seconds,
+                                   restored)
+
+
+async def run_stages_async(stages, on_complete=None, completed=None):
+    """
+    Async counterpart of run_stages: every stage runs as a task on the
+    current event loop as soon as its dependencies have finished.
+
+    Stage functions may be coroutine functions or plain functions; plain
+    functions run inline, so they should be quick.
+
+    Args:
+        stages (list): Stage tuples. Every dependency must name another
+            stage in the list.
+        on_complete (callable, optional): Called as
+            on_complete(name, result, seconds) after each stage finishes.
+        completed (dict, optional): Results of stages finished by an
+            earlier, interrupted run. These stages are not run again.
+
+    Returns:
+        tuple: (results, timings), as returned by run_stages.
+    """
+    _check_stages(stages)
+
+    results, durations = _restored_results(stages, completed)
+    restored = sorted(results)
+    tasks = {}
+
+    async def run(stage):
+        if stage.name in results:
+            return
+        for dep in stage.deps:
+            await tasks[dep]
+        kwargs = {dep: results[dep] for dep in stage.deps}
+        start = time.perf_counter()
+        with metrics.stage(stage.name):
+            value = stage.func(**kwargs)
+            if inspect.isawaitable(value):
+                value = await value
+        durations[stage.name] = time.perf_counter() - start
+        results[stage.name] = value
+        if on_complete:
+            on_complete(stage.name, value, durations[stage.name])
+
+    run_start = time.perf_counter()
+    for stage in stages:
+        tasks[stage.name] = asyncio.ensure_future(run(stage))
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+    wall_seconds = time.perf_counter() - run_start
+
+    return results, _stage_timings(stages, durations, wall_seconds,
+                                   restored)
+
+
+def _restored_results(stages, completed):
+    """
+    Returns (results, durations) seeded with the completed stages that
+    are part of this graph; restored stages count as taking no time.
+
+    A result is only reused together with the inputs it was computed
+    from: a completed stage depending, directly or not, on a stage that
+    runs again (e.g. an image whose file was deleted) runs again too.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    results = {name: value for name, value in (completed or {}).items()
+               if name in by_name}
+    while True:
+        stale = [name for name in results
+                 if any(dep not in results for dep in by_name[name].deps)]
+        if not stale:
+            break
+        for name in stale:
+            del results[name]
+    return results, dict.fromkeys(results, 0.0)
+
+
+def _check_stages(stages):
+    """Raises ValueError for duplicate names, unknown deps or cycles."""
+    by_name = {stage.name: stage for stage in stages}
+    if len(by_name) != len(stages):
+        raise ValueError("Stage names must be unique")
+    for stage in stages:
+        missing = [dep for dep in stage.deps if dep not in by_name]
+        if missing:
+            raise ValueError(
+                f"Stage '{stage.name}' depends on unknown stage(s): "
+                f"{', '.join(missing)}"
+            )
+
+    # Repeatedly remove stages whose dependencies are all satisfied;
+    # anything left over is part of a cycle
+    done = set()
+    remaining = list(stages)
+    while remaining:
+        ready = [stage for stage in remaining
+                 if all(dep in done for dep in stage.deps)]
+        if not ready:
+            raise ValueError(
+                "Stage graph has a cycle between: "
+                f"{', '.join(stage.name for stage in remaining)}"
+            )
+        for stage in ready:
+            remaining.remove(stage)
+            done.add(stage.name)
+
+
+def _stage_timings(stages, durations, wall_seconds, restored=()):
+    """Computes the critical (longest-duration) path through the stages."""
+    by_name = {stage.name: stage for stage in stages}
+    path_seconds = {}
+    path_prev = {}
+
+    def longest_path_to(name):
+        if name not in path_seconds:
+            best_dep = None
+            best_seconds = 0.0
+            for dep in by_name[name].deps:
+                if longest_path_to(dep) > best_seconds:
+                    best_dep, best_seconds = dep, path_seconds[dep]
+            path_seconds[name] = best_seconds + durations[name]
+            path_prev[name] = best_dep
+        return path_seconds[name]
+
+    last = max(by_name, key=longest_path_to)
+    critical_path = []
+    while last is not None:
+        critical_path.append(last)
+        last = path_prev[last]
+    critical_path.reverse()
+
+    timings = {
+        "stages": {name: round(seconds, 3)
+                   for name, seconds in durations.items()},
+        "critical_path": critical_path,
+        "critical_path_seconds": round(
+            path_seconds[critical_path[-1]], 3),
+        "wall_seconds": round(wall_seconds, 3),
+    }
+    if restored:
+        # Stages reused from an interrupted run, reported as taking 0s
+        timings["restored_stages"] = list(restored)
+    return timings
+
 
 # Main function to orchestrate the workflow
 
 
-def main(audio_file_path="audio/complaint.mp3"):
+def main(audio_file_path="audio/complaint.mp3", output_dir=None,
+         verbose=True, combined_vision=False, completed=None,
+         on_stage=None, profile=None, speculative=None):
     """
     Orchestrates the workflow for handling customer complaints.
 
@@ -23,73 +275,588 @@ def main(audio_file_path="audio/complaint.mp3"):
     5. Annotate the reported issue in the image.
     6. Classify the complaint into a category/subcategory pair.
 
+    Steps 4 and 5 only need the generated image, so they run in parallel.
+    Every step starts as soon as the results it needs are available.
+    Every run, finished or failed, is also appended as one row to the
+    results sink when one is configured (see results_sink.get_sink).
+
     Args:
         audio_file_path (str): Path to the audio complaint file.
+        output_dir (str, optional): Directory where intermediate and final
+            results are saved. Defaults to a new directory per run under
+            ARTIFACT_ROOT (output/runs/<run id>), so concurrent runs never
+            overwrite each other.
+        verbose (bool): Whether to print progress for each step.
+        combined_vision (bool): Describe the image and locate its defects
+            with one structured vision call (vision.analyze_image) instead
+            of two separate ones.
+        completed (dict, optional): Stage results saved by an earlier,
+            interrupted run of this complaint; those stages are skipped.
+        on_stage (callable, optional): Called as
+            on_stage(name, result, seconds) as soon as each stage
+            finishes, e.g. to checkpoint it (see jobs.JobStore).
+        profile (str, optional): One of PROFILES. "text-only" skips the
+            image stages and classifies from the transcription alone;
+            "deferred-visuals" returns that classification at once and
+            runs the image stages in the background (see
+            wait_for_visuals). Defaults to PIPELINE_PROFILE from
+            environment or "full".
+        speculative (bool, optional): Also classify from the
+            transcription as soon as it is available, while the image
+            stages run; the image-based answer is compared with it and
+            "classification_revised" records whether it changed. Only
+            "deferred-visuals" returns the early answer: main returns it
+            at once and the image-based one revises it in the background.
+            With "full", main still returns after the image stages, and
+            the early answer only reaches on_stage, as
+            "speculative_classification". Defaults to
+            CLASSIFICATION_SPECULATIVE from environment.
 
     Returns:
-        dict: Dictionary containing all intermediate and final results.
+        dict: Dictionary containing all intermediate and final results,
+            plus per-stage and critical-path timings and the run's
+            metrics (see metrics.RunMetrics.as_dict). Image results are
+            None when the profile skips or defers them.
     """
+    log = print if verbose else (lambda *args, **kwargs: None)
+    profile = resolve_profile(profile)
+    speculative = _use_speculative(speculative)
+    run_id, output_dir = _run_output(output_dir)
+
+    stages = pipeline_stages(audio_file_path, output_dir,
+                             combined_vision=combined_vision,
+                             profile=profile, speculative=speculative)
+
+    early_completed, early_on_stage = _early_checkpoints(
+        completed, on_stage, profile, speculative)
+
+    log(f"Running complaint workflow ({profile})...\n")
+    with metrics.collect() as run_metrics, \
+            _sink_failures(audio_file_path, run_id, output_dir):
+        results, timings = run_stages(
+            stages, on_complete=_stage_reporter(log, early_on_stage),
+            completed=early_completed)
+
+    summary = _finish_run(results, timings, run_metrics, run_id,
+                          output_dir, audio_file_path, profile, log)
+    if profile == "deferred-visuals":
+        _defer_visuals(summary, run_metrics, audio_file_path,
+                       combined_vision, speculative, completed, log,
+                       on_stage)
+    return summary
+
+
+async def main_async(audio_file_path="audio/complaint.mp3",
+                     output_dir=None, verbose=True,
+                     combined_vision=False, completed=None, on_stage=None,
+                     profile=None, speculative=None):
+    """
+    Async counterpart of main: runs the same stage graph on the current
+    event loop using the async model clients, so many complaints can be
+    processed concurrently without a thread per request.
+
+    Args:
+        audio_file_path (str): Path to the audio complaint file.
+        output_dir (str, optional): Directory where intermediate and final
+            results are saved. Defaults to a new directory per run, see
+            main.
+        verbose (bool): Whether to print progress for each step.
+        combined_vision (bool): Use one structured vision call for the
+            description and the defect boxes.
+        completed (dict, optional): Stage results to reuse, see main.
+        on_stage (callable, optional): Called after each stage, see main.
+        profile (str, optional): One of PROFILES, see main. Deferred
+            visuals run on the same background threads as for main, so
+            they outlive the event loop.
+        speculative (bool, optional): Classify from the transcription
+            while the image stages run, see main.
+
+    Returns:
+        dict: Dictionary containing all intermediate and final results,
+            plus per-stage and critical-path timings and the run's
+            metrics (see metrics.RunMetrics.as_dict).
+    """
+    log = print if verbose else (lambda *args, **kwargs: None)
+    profile = resolve_profile(profile)
+    speculative = _use_speculative(speculative)
+    run_id, output_dir = _run_output(output_dir)
+
+    stages = pipeline_stages(audio_file_path, output_dir, use_async=True,
+                             combined_vision=combined_vision,
+                             profile=profile, speculative=speculative)
+
+    early_completed, early_on_stage = _early_checkpoints(
+        completed, on_stage, profile, speculative)
+
+    log(f"Running complaint workflow ({profile})...\n")
+    with metrics.collect() as run_metrics, \
+            _sink_failures(audio_file_path, run_id, output_dir):
+        results, timings = await run_stages_async(
+            stages, on_complete=_stage_reporter(log, early_on_stage),
+            completed=early_completed)
+
+    summary = await asyncio.to_thread(_finish_run, results, timings,
+                                      run_metrics, run_id, output_dir,
+                                      audio_file_path, profile, log)
+    if profile == "deferred-visuals":
+        _defer_visuals(summary, run_metrics, audio_file_path,
+                       combined_vision, speculative, completed, log,
+                       on_stage)
+    return summary
+
+
+def resolve_profile(profile=None):
+    """
+    Returns profile, defaulting to PIPELINE_PROFILE from environment or
+    "full".
+
+    Raises:
+        ValueError: If the profile is not one of PROFILES.
+    """
+    profile = profile or os.getenv('PIPELINE_PROFILE', DEFAULT_PROFILE)
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown pipeline profile '{profile}'; choose "
+                         f"one of: {', '.join(PROFILES)}")
+    return profile
+
+
+def check_speculative(profile=None, speculative=None):
+    """
+    Rejects speculative classification with the "full" profile, which
+    runs the early classification but only returns after the image
+    stages. Used by the command lines; call main with "deferred-visuals"
+    to get the early answer back at once.
+
+    Raises:
+        ValueError: If speculative resolves to True and profile to "full".
+    """
+    if resolve_profile(profile) == "full" and _use_speculative(speculative):
+        raise ValueError("Speculative classification only returns an early "
+                         "answer with the deferred-visuals profile; pass "
+                         "--profile deferred-visuals")
+
+
+def _use_speculative(speculative):
+    if speculative is None:
+        value = os.getenv('CLASSIFICATION_SPECULATIVE', '').strip().lower()
+        speculative = value in ("1", "true", "yes")
+    return speculative
+
+
+def _run_output(output_dir):
+    """
+    Returns (run_id, output_dir): a new run directory when output_dir is
+    None, otherwise the given directory. Either way the run gets a new
+    unique id, so re-runs into the same directory stay apart.
+    """
+    if output_dir is None:
+        return artifacts.run_directory()
+    return artifacts.new_run_id(), output_dir
+
+
+def pipeline_stages(audio_file_path, output_dir, use_async=False,
+                    combined_vision=False, profile="full",
+                    speculative=False):
+    """
+    Builds the complaint workflow as a stage graph.
+
+    Args:
+        audio_file_path (str): Path to the audio complaint file.
+        output_dir (str): Directory where intermediate results are saved.
+        use_async (bool): Use the async stage functions, for
+            run_stages_async.
+        combined_vision (bool): Add an image_analysis stage whose single
+            vision call feeds both the description and the annotation.
+        profile (str): "full" for every stage. Other profiles keep only
+            the transcription and a classification from it; see
+            visual_stages for the rest.
+        speculative (bool): With the "full" profile, add a
+            speculative_classification stage classifying from the
+            transcription alone, in parallel with the image stages. The
+            image-based classification then always asks the model, so
+            that comparing the two measures the image path.
+
+    Returns:
+        list: Stage tuples, named after the result keys they produce.
+    """
+    if use_async:
+        transcribe, generate, analyze, describe, annotate, classify = (
+            transcribe_audio_async, generate_image_async,
+            analyze_image_async, describe_image_async, annotate_image_async,
+            classify_with_gpt_async
+        )
+    else:
+        transcribe, generate, analyze, describe, annotate, classify = (
+            transcribe_audio, generate_image, analyze_image, describe_image,
+            annotate_image, classify_with_gpt
+        )
+
+    if combined_vision:
+        # Steps 4 and 5 share one structured vision call
+        vision_stages = [
+            Stage("image_analysis",
+                  lambda image_path: analyze(image_path,
+                                             output_dir=output_dir),
+                  ("image_path",)),
+            Stage("image_description",
+                  lambda image_path, image_analysis: describe(
+                      image_path, output_dir=output_dir,
+                      analysis=image_analysis),
+                  ("image_path", "image_analysis")),
+            Stage("annotated_image_path",
+                  lambda image_path, image_analysis: annotate(
+                      image_path=image_path, output_dir=output_dir,
+                      analysis=image_analysis),
+                  ("image_path", "image_analysis")),
+        ]
+    else:
+        vision_stages = [
+            # Step 4: Describe the generated image
+            Stage("image_description",
+                  lambda image_path: describe(image_path,
+                                              output_dir=output_dir),
+                  ("image_path",)),
+            # Step 5: Annotate the reported issue in the image with
+            # bounding boxes
+            Stage("annotated_image_path",
+                  lambda image_path: annotate(image_path=image_path,
+                                              output_dir=output_dir),
+                  ("image_path",)),
+        ]
+
     # Step 1: Transcribe the audio complaint
-    print("Step 1: Transcribing audio complaint...")
-    transcription = transcribe_audio(audio_file_path)
-    print(f"Transcription: {transcription}\n")
-
-    # Step 2: Create a prompt from the transcription
-    print("Step 2: Creating prompt from transcription...")
-    prompt = f"Customer complaint: {transcription}"
-    print(f"Prompt created: {prompt}\n")
-
-    # Step 3: Generate an image based on the prompt
-    print("Step 3: Generating image representing the issue...")
-    image_path = generate_image(prompt)
-    print(f"Image generated and saved at: {image_path}\n")
-
-    # Step 4: Describe the generated image
-    print("Step 4: Describing the generated image...")
-    image_description = describe_image(image_path)
-    print(f"Image description: {image_description}\n")
-
-    # Step 5: Annotate the reported issue in the image with bounding boxes
-    print("Step 5: Annotating the reported issue in the image...")
-    annotated_image_path = annotate_image(image_path=image_path)
-    print(f"Annotated image saved at: {annotated_image_path}\n")
-
-    # Step 6: Classify the complaint based on the image description
-    print("Step 6: Classifying the complaint...")
-    classification = classify_with_gpt(image_description, transcription)
-    print(f"Classification result:\n{classification}\n")
+    transcription_stage = Stage(
+        "transcription",
+        lambda: transcribe(audio_file_path, output_dir=output_dir), ())
+    if profile != "full":
+        # Classify from the transcription alone, without waiting for an
+        # image
+        return [
+            transcription_stage,
+            Stage("classification",
+                  lambda transcription: classify(
+                      None, transcription, output_dir=output_dir),
+                  ("transcription",)),
+        ]
+
+    speculative_stages = []
+    if speculative:
+        # Classify early from the transcription while the image stages
+        # run; saved with the results summary, not as classification.txt
+        speculative_stages.append(
+            Stage("speculative_classification",
+                  lambda transcription: classify(None, transcription,
+                                                 output_dir=None),
+                  ("transcription",)))
+
+    return [
+        transcription_stage,
+        *speculative_stages,
+        # Step 2: Create a prompt from the transcription
+        Stage("prompt",
+              lambda transcription: f"Customer complaint: {transcription}",
+              ("transcription",)),
+        # Step 3: Generate an image based on the prompt
+        Stage("image_path",
+              lambda prompt: generate(prompt, output_dir=output_dir),
+              ("prompt",)),
+        *vision_stages,
+        # Step 6: Classify the complaint based on the image description
+        # (the local classifier only reads the transcription, so it would
+        # just repeat the speculative answer)
+        Stage("classification",
+              lambda image_description, transcription: classify(
+                  image_description, transcription, output_dir=output_dir,
+                  use_local=not speculative),
+              ("image_description", "transcription")),
+    ]
+
+
+def visual_stages(audio_file_path, output_dir, combined_vision=False,
+                  speculative=False):
+    """
+    Returns the stages a deferred-visuals run leaves for the background:
+    the full graph without classification, or with the image-based
+    classification when the run is speculative. Its transcription stage
+    is passed as completed, so only the image stages run.
+    """
+    return [stage for stage in pipeline_stages(
+                audio_file_path, output_dir,
+                combined_vision=combined_vision, speculative=speculative)
+            if stage.name != "speculative_classification"
+            and (speculative or stage.name != "classification")]
+
+
+STAGE_MESSAGES = {
+    "transcription": "Step 1: Transcription: {}\n",
+    "prompt": "Step 2: Prompt created: {}\n",
+    "image_path": "Step 3: Image generated and saved at: {}\n",
+    "image_analysis": "Steps 4-5: Image analyzed in one vision call\n",
+    "image_description": "Step 4: Image description: {}\n",
+    "annotated_image_path": "Step 5: Annotated image saved at: {}\n",
+    "speculative_classification":
+        "Early classification (transcription only):\n{}\n",
+    "classification": "Step 6: Classification result:\n{}\n",
+}
+
+
+def _stage_reporter(log, on_stage=None):
+    def report(name, value, seconds):
+        log(f"[{seconds:.2f}s] " + STAGE_MESSAGES[name].format(value))
+        if on_stage:
+            on_stage(name, value, seconds)
+    return report
 
+
+@contextmanager
+def _sink_failures(audio_file_path, run_id, output_dir):
+    """Appends a failed run to the results sink, if one is configured."""
+    try:
+        yield
+    except Exception as e:
+        sink = results_sink.get_sink()
+        if sink is not None:
+            sink.append(results_sink.build_record(
+                audio_file_path=audio_file_path, run_id=run_id,
+                output_dir=output_dir, error=f"{type(e).__name__}: {e}"))
+        raise
+
+
+def _finish_run(stage_results, timings, run_metrics, run_id, output_dir,
+                audio_file_path, profile, log):
+    """Saves the results summary and prints the completion report."""
+    timings["profile"] = profile
+    metrics.finish_run(run_metrics, timings)
     # Step 7: Store all results
     results = {
-        "transcription": transcription,
-        "prompt": prompt,
-        "image_path": image_path,
-        "annotated_image_path": annotated_image_path,
-        "image_description": image_description,
-        "classification": classification
+        "run_id": run_id,
+        "output_dir": output_dir,
+        "profile": profile,
+        "transcription": stage_results["transcription"],
+        "prompt": stage_results.get("prompt"),
+        "image_path": stage_results.get("image_path"),
+        "annotated_image_path": stage_results.get("annotated_image_path"),
+        "image_description": stage_results.get("image_description"),
+        "classification": stage_results["classification"],
+        # Where the label came from: local, cached, structured or text
+        # (None if it was restored from a checkpoint)
+        "classification_source": run_metrics.stage_value(
+            "classification", "classification_source"),
+        "timings": timings,
+        "metrics": run_metrics.as_dict()
     }
+    if "image_analysis" in stage_results:
+        results["image_analysis"] = stage_results["image_analysis"]
+    if "speculative_classification" in stage_results:
+        results["speculative_classification"] = \
+            stage_results["speculative_classification"]
+        results["classification_revised"] = _revised(
+            results["speculative_classification"],
+            results["classification"], timings)
+    if profile == "deferred-visuals":
+        results["visuals"] = "pending"
 
-    os.makedirs("output", exist_ok=True)
-    with open("output/results_summary.json", "w", encoding="utf-8") as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
-
-    print("=" * 50)
-    print("WORKFLOW COMPLETE")
-    print("=" * 50)
-    print("\nAll results saved to output/ directory:")
-    print("  - transcription.txt")
-    print("  - image_prompt.txt")
-    print("  - generated_image.png")
-    print("  - annotated_image.png")
-    print("  - image_description.txt")
-    print("  - classification.txt")
-    print("  - results_summary.json")
-    print("\nFinal Classification:")
-    print(classification)
+    _save_results(results)
+    sink = results_sink.get_sink()
+    # A deferred-visuals run is recorded by _run_visuals, once its image
+    # stages (and image-based classification) have finished
+    if sink is not None and profile != "deferred-visuals":
+        sink.append(results_sink.build_record(results, audio_file_path))
+
+    log("=" * 50)
+    log("WORKFLOW COMPLETE")
+    log("=" * 50)
+    log(f"\nAll results saved to {output_dir}/ directory:")
+    log("  - transcription.txt")
+    if profile == "full":
+        log("  - image_prompt.txt")
+        log("  - generated_image.png")
+        log("  - annotated_image.png")
+        log("  - image_description.txt")
+    log("  - classification.txt")
+    log("  - results_summary.json")
+    log("  - metrics.json")
+    if profile == "deferred-visuals":
+        log("Image files follow in the background.")
+    log(f"\nCritical path: {' -> '.join(timings['critical_path'])} "
+        f"({timings['critical_path_seconds']:.2f}s, "
+        f"wall {timings['wall_seconds']:.2f}s)")
+    log("\nFinal Classification:")
+    log(results["classification"])
+    if results.get("classification_revised"):
+        log("(revised from the early, transcription-only classification)")
 
     return results
 
 
+def _revised(speculative, final, timings):
+    """
+    Returns whether the image-based classification revised the
+    speculative one. The outcome is counted once, by the run that made
+    the image-based classification, not again when a resumed run
+    restores it from a checkpoint.
+    """
+    agreed = compare_classifications(speculative, final)
+    if "classification" not in timings.get("restored_stages", ()):
+        record_speculative_outcome(agreed)
+    return not agreed
+
+
+def _save_results(results):
+    output_dir = results["output_dir"]
+    artifacts.write_json(os.path.join(output_dir, "results_summary.json"),
+                         results)
+    artifacts.write_json(os.path.join(output_dir, "metrics.json"),
+                         results["metrics"])
+    # The run is only complete once its offloaded writes are on disk
+    artifacts.flush()
+
+
+def _early_checkpoints(completed, on_stage, profile, speculative):
+    """
+    Returns the completed results and on_stage callback for the stages a
+    run returns with. In a speculative deferred-visuals run these
+    classify from the transcription, and the background stages later
+    checkpoint the image-based classification as "classification". The
+    early label is therefore checkpointed, and restored, as
+    "speculative_classification" instead.
+    """
+    if profile != "deferred-visuals" or not speculative:
+        return completed, on_stage
+    completed = dict(completed or {})
+    completed.pop("classification", None)
+    if "speculative_classification" in completed:
+        completed["classification"] = completed.pop(
+            "speculative_classification")
+    if on_stage is None:
+        return completed, None
+
+    def early_on_stage(name, value, seconds):
+        if name == "classification":
+            name = "speculative_classification"
+        on_stage(name, value, seconds)
+    return completed, early_on_stage
+
+
+def _defer_visuals(summary, run_metrics, audio_file_path, combined_vision,
+                   speculative, completed, log, on_stage):
+    """Starts the image stages of a deferred-visuals run in the background."""
+    global _visuals_executor
+    stages = visual_stages(audio_file_path, summary["output_dir"],
+                           combined_vision=combined_vision,
+                           speculative=speculative)
+    # A checkpointed "classification" is the image-based one, see
+    # _early_checkpoints
+    completed = dict(completed or {}, transcription=summary["transcription"])
+    with _visuals_lock:
+        if _visuals_executor is None:
+            _visuals_executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv('VISUALS_WORKERS',
+                                          DEFAULT_VISUALS_WORKERS)),
+                thread_name_prefix="visuals")
+        _visuals[summary["run_id"]] = _visuals_executor.submit(
+            _run_visuals, stages, summary, run_metrics, completed,
+            _stage_reporter(log, on_stage), audio_file_path, speculative)
+
+
+def _run_visuals(stages, summary, run_metrics, completed, on_complete,
+                 audio_file_path, speculative):
+    """
+    Runs the image stages of a deferred-visuals run and rewrites its
+    results summary with them.
+
+    Returns:
+        dict: The run's final results. "visuals" is "done", or "failed"
+            with the reason in "visuals_error". A speculative run's
+            classification is replaced by the image-based one, see
+            main. The run is only then appended to the results sink.
+    """
+    results = dict(summary)
+    try:
+        with metrics.collect(run_metrics):
+            visual_results, visual_timings = run_stages(
+                stages, on_complete=on_complete, completed=completed)
+    except Exception as e:
+        results["visuals"] = "failed"
+        results["visuals_error"] = f"{type(e).__name__}: {e}"
+        print(f"Warning: image stages of run {summary['run_id']} failed: "
+              f"{results['visuals_error']}")
+    else:
+        metrics.finish_background(run_metrics, "visuals", visual_timings)
+        for key in VISUAL_KEYS:
+            if key in visual_results:
+                results[key] = visual_results[key]
+        if "classification" in visual_results:
+            results["speculative_classification"] = summary["classification"]
+            results["classification"] = visual_results["classification"]
+            results["classification_source"] = run_metrics.stage_value(
+                "classification", "classification_source")
+            results["classification_revised"] = _revised(
+                summary["classification"], results["classification"],
+                visual_timings)
+        results["visuals"] = "done"
+        results["timings"] = dict(summary["timings"],
+                                  visuals=visual_timings)
+    results["metrics"] = run_metrics.as_dict()
+    _save_results(results)
+    sink = results_sink.get_sink()
+    if sink is not None:
+        sink.append(results_sink.build_record(
+            results, audio_file_path, error=results.get("visuals_error")))
+    return results
+
+
+def wait_for_visuals(run_id=None, timeout=None):
+    """
+    Waits for the background image stages of deferred-visuals runs.
+
+    Args:
+        run_id (str, optional): Wait for this run only. By default waits
+            for every run started so far.
+        timeout (float, optional): Seconds to wait per run.
+
+    Returns:
+        dict or list: The final results of the run (as saved to its
+            results_summary.json), or a list of them for every run.
+
+    Raises:
+        KeyError: If run_id is not a deferred-visuals run, or has already
+            been waited for.
+    """
+    with _visuals_lock:
+        if run_id is not None:
+            futures = {run_id: _visuals[run_id]}
+        else:
+            futures = dict(_visuals)
+    finished = []
+    for pending_run_id, future in futures.items():
+        finished.append(future.result(timeout))
+        with _visuals_lock:
+            _visuals.pop(pending_run_id, None)
+    return finished[0] if run_id is not None else finished
+
+
 # Example Usage (for testing purposes, remove/comment when deploying):
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(
+        description="Classify one audio complaint.")
+    parser.add_argument("audio_file_path", nargs="?",
+                        default="audio/complaint.mp3")
+    parser.add_argument("--output-dir", default=None)
+    parser.add_argument("--profile", choices=PROFILES, default=None,
+                        help="Stages to run (default: PIPELINE_PROFILE or "
+                             "full)")
+    parser.add_argument("--combined-vision", action="store_true")
+    parser.add_argument("--speculative", action="store_true", default=None,
+                        help="With --profile deferred-visuals, return "
+                             "the classification from the transcription "
+                             "at once")
+    args = parser.parse_args()
+    try:
+        check_speculative(args.profile, args.speculative)
+    except ValueError as e:
+        parser.error(str(e))
+    main(args.audio_file_path, output_dir=args.output_dir,
+         combined_vision=args.combined_vision, profile=args.profile,
+         speculative=args.speculative)
+    wait_for_visuals()
@@ -0,0 +1,434 @@
+# metrics.py
+
+import contextvars
+import math
+import httpx
+import os
+import threading
+from contextlib import contextmanager
+
+# Per-stage counters collected for every run
+COUNTERS = (
+    "calls",
+    "retries",
+    "request_bytes",
+    "response_bytes",
+    "prompt_tokens",
+    "completion_tokens",
+    "cache_hits",
+    "cache_misses",
+)
+
+# Upper bounds, in seconds, of the stage latency histogram buckets
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 60.0, 120.0,
+                   300.0)
+QUANTILES = (50, 95, 99)
+
+# Stage name for work done outside any pipeline stage
+UNATTRIBUTED = "unattributed"
+
+_current_run = contextvars.ContextVar("metrics_run", default=None)
+_current_stage = contextvars.ContextVar("metrics_stage", default=None)
+
+_lock = threading.Lock()
+_totals = {}  # stage -> counter -> value, across every run in the process
+_histograms = {}  # stage -> [count per bucket..., +Inf count, sum]
+
+
+class RunMetrics:
+    """Counters and stage durations of one pipeline run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.wall_seconds = None
+
+    def add(self, stage, counter, amount):
+        with self._lock:
+            counters = self.stages.setdefault(stage, _empty_counters())
+            counters[counter] += amount
+
+    def annotate(self, stage, values):
+        with self._lock:
+            counters = self.stages.setdefault(stage, _empty_counters())
+            counters.update(values)
+
+    def stage_value(self, stage, key):
+        """Returns a value recorded for a stage, or None."""
+        with self._lock:
+            return self.stages.get(stage, {}).get(key)
+
+    def set_seconds(self, stage, seconds):
+        with self._lock:
+            counters = self.stages.setdefault(stage, _empty_counters())
+            counters["seconds"] = round(seconds, 3)
+
+    def as_dict(self):
+        """
+        Returns the run's metrics as JSON-serializable data.
+
+        Returns:
+            dict: "stages" maps each stage to its seconds and counters,
+                "totals" sums the counters over all stages and
+                "wall_seconds" is the run's wall time.
+        """
+        with self._lock:
+            stages = {name: dict(counters)
+                      for name, counters in self.stages.items()}
+        totals = {counter: sum(counters[counter]
+                               for counters in stages.values())
+                  for counter in COUNTERS}
+        return {"stages": stages, "totals": totals,
+                "wall_seconds": self.wall_seconds}
+
+
+def _empty_counters():
+    counters = {"seconds": None}
+    counters.update((counter, 0) for counter in COUNTERS)
+    return counters
+
+
+@contextmanager
+def collect(run=None):
+    """
+    Collects the metrics recorded by the current thread or task, and by
+    the stages it starts, into a new RunMetrics, or into `run` to add to
+    an earlier part of the same run.
+
+    Yields:
+        RunMetrics: The run's metrics, filled in as the run progresses.
+    """
+    run = run or RunMetrics()
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        _current_run.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """Attributes everything recorded inside the block to stage `name`."""
+    token = _current_stage.set(name)
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)
+
+
+def record(**amounts):
+    """
+    Adds to counters of the current stage and run, e.g.
+    record(calls=1, prompt_tokens=120). Counters recorded outside a stage
+    count towards "unattributed".
+    """
+    _add(_current_stage.get() or UNATTRIBUTED, _current_run.get(), amounts)
+
+
+def _add(stage_name, run, amounts):
+    with _lock:
+        totals = _totals.setdefault(stage_name,
+                                    dict.fromkeys(COUNTERS, 0))
+        for counter, amount in amounts.items():
+            totals[counter] += amount
+    if run is not None:
+        for counter, amount in amounts.items():
+            run.add(stage_name, counter, amount)
+
+
+def annotate(**values):
+    """
+    Attaches non-counter values to the current stage of the current run,
+    e.g. annotate(classification_source="local"). They appear next to
+    the stage's counters in RunMetrics.as_dict.
+    """
+    run = _current_run.get()
+    if run is not None:
+        run.annotate(_current_stage.get() or UNATTRIBUTED, values)
+
+
+def record_usage(response):
+    """Records the token usage reported by a model response, if any."""
+    usage = getattr(response, "usage", None)
+    tokens = {}
+    for counter in ("prompt_tokens", "completion_tokens"):
+        value = getattr(usage, counter, None)
+        if isinstance(value, int):
+            tokens[counter] = value
+    if tokens:
+        record(**tokens)
+
+
+class _CountingStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    """
+    Wraps a request or response body without a Content-Length, counting
+    its bytes as they are sent or read. They are attributed to the stage
+    and run that made the request, wherever the body is consumed.
+    """
+
+    def __init__(self, stream, counter):
+        self._stream = stream
+        self._counter = counter
+        self._stage = _current_stage.get() or UNATTRIBUTED
+        self._run = _current_run.get()
+
+    def _count(self, chunk):
+        if chunk:
+            _add(self._stage, self._run, {self._counter: len(chunk)})
+
+    def __iter__(self):
+        for chunk in self._stream:
+            self._count(chunk)
+            yield chunk
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            self._count(chunk)
+            yield chunk
+
+    def close(self):
+        self._stream.close()
+
+    async def aclose(self):
+        await self._stream.aclose()
+
+
+def record_request(request):
+    """
+    httpx request hook: records the size of the request body, from its
+    Content-Length, its content, or as a streamed body is sent.
+    """
+    length = request.headers.get("content-length")
+    if length and length.isdigit():
+        record(request_bytes=int(length))
+        return
+    try:
+        content = request.content
+    except httpx.RequestNotRead:
+        request.stream = _CountingStream(request.stream, "request_bytes")
+        return
+    if content:
+        record(request_bytes=len(content))
+
+
+def record_response(response):
+    """
+    httpx response hook: records the size of the response body, from its
+    Content-Length or, for chunked and streamed bodies, as it is read.
+    """
+    length = response.headers.get("content-length")
+    if length and length.isdigit():
+        record(response_bytes=int(length))
+    else:
+        response.stream = _CountingStream(response.stream, "response_bytes")
+
+
+async def record_request_async(request):
+    record_request(request)
+
+
+async def record_response_async(response):
+    record_response(response)
+
+
+def finish_run(run, timings):
+    """
+    Stores the stage durations of a finished run and adds them to the
+    process-wide latency histograms. The wall time counts towards
+    "pipeline" and, when timings name the run's profile, towards
+    "pipeline:<profile>" as well.
+
+    Args:
+        run (RunMetrics): The run's metrics, from collect().
+        timings (dict): Timings returned by main.run_stages.
+    """
+    restored = set(timings.get("restored_stages", ()))
+    for name, seconds in timings["stages"].items():
+        run.set_seconds(name, seconds)
+        if name not in restored:
+            observe(name, seconds)
+    run.wall_seconds = timings["wall_seconds"]
+    observe("pipeline", timings["wall_seconds"])
+    if timings.get("profile"):
+        observe(f"pipeline:{timings['profile']}", timings["wall_seconds"])
+
+
+def finish_background(run, name, timings):
+    """
+    Like finish_run, for stages a run finishes after it has returned
+    (e.g. deferred visuals): their wall time counts towards `name`.
+    Restored stages keep the durations the run already recorded.
+    """
+    restored = set(timings.get("restored_stages", ()))
+    for stage_name, seconds in timings["stages"].items():
+        if stage_name not in restored:
+            run.set_seconds(stage_name, seconds)
+            observe(stage_name, seconds)
+    observe(name, timings["wall_seconds"])
+
+
+def observe(stage_name, seconds):
+    """Adds one latency observation to a stage's histogram."""
+    with _lock:
+        histogram = _histograms.setdefault(
+            stage_name, [0] * (len(LATENCY_BUCKETS) + 1) + [0.0])
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                histogram[i] += 1
+        histogram[len(LATENCY_BUCKETS)] += 1
+        histogram[-1] += seconds
+
+
+def percentile(values, q):
+    """
+    Returns the q-th percentile of values, interpolating linearly between
+    the closest ranks, or None for no values.
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    position = (len(values) - 1) * q / 100.0
+    low = math.floor(position)
+    high = math.ceil(position)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+class LatencySketch:
+    """
+    Streaming percentile estimate over any number of latencies in fixed
+    memory: values are counted in logarithmic buckets, so every estimate
+    is within `relative_accuracy` of a value of the right rank.
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._buckets = {}
+        self._zeros = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = None
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = seconds if self.max is None else max(self.max, seconds)
+        # Sub-microsecond values are reported as zero
+        if seconds <= 1e-6:
+            self._zeros += 1
+            return
+        index = math.ceil(math.log(seconds) / self._log_gamma)
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+
+    def percentile(self, q):
+        """Returns the estimated q-th percentile, or None for no values."""
+        if not self.count:
+            return None
+        rank = (self.count - 1) * q / 100.0
+        seen = self._zeros
+        if rank < seen:
+            return 0.0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if rank < seen:
+                return min(2 * self._gamma ** index / (self._gamma + 1),
+                           self.max)
+        return self.max
+
+    def summary(self):
+        """Returns count, mean, p50, p95, p99 and max in seconds."""
+        summary = {"count": self.count,
+                   "mean": round(self.total / self.count, 3)
+                   if self.count else None}
+        for q in QUANTILES:
+            value = self.percentile(q)
+            summary[f"p{q}"] = round(value, 3) if value is not None else None
+        summary["max"] = round(self.max, 3) if self.max is not None else None
+        return summary
+
+
+def summarize_latencies(timings_list):
+    """
+    Aggregates the stage timings of many runs.
+
+    Args:
+        timings_list (list): Timings dicts returned by main.run_stages.
+
+    Returns:
+        dict: Stage name (plus "pipeline" for the wall time, and
+            "pipeline:<profile>" per pipeline profile) -> count, p50, p95,
+            p99 and max in seconds.
+    """
+    samples = {}
+    for timings in timings_list:
+        restored = set(timings.get("restored_stages", ()))
+        for name, seconds in timings["stages"].items():
+            if name not in restored:
+                samples.setdefault(name, []).append(seconds)
+        samples.setdefault("pipeline", []).append(timings["wall_seconds"])
+        if timings.get("profile"):
+            samples.setdefault(f"pipeline:{timings['profile']}",
+                               []).append(timings["wall_seconds"])
+    summary = {}
+    for name, values in samples.items():
+        summary[name] = {"count": len(values)}
+        for q in QUANTILES:
+            summary[name][f"p{q}"] = round(percentile(values, q), 3)
+        summary[name]["max"] = round(max(values), 3)
+    return summary
+
+
+def get_totals():
+    """Returns the process-wide counters per stage."""
+    with _lock:
+        return {name: dict(counters) for name, counters in _totals.items()}
+
+
+def prometheus_text():
+    """
+    Renders the process-wide counters and stage latency histograms in the
+    Prometheus text exposition format.
+
+    Returns:
+        str: The exposition, ending with a newline.
+    """
+    with _lock:
+        totals = {name: dict(counters) for name, counters in _totals.items()}
+        histograms = {name: list(histogram)
+                      for name, histogram in _histograms.items()}
+
+    lines = [
+        "# HELP complaint_stage_seconds Wall time of each pipeline stage.",
+        "# TYPE complaint_stage_seconds histogram",
+    ]
+    for name, histogram in sorted(histograms.items()):
+        for bound, count in zip(LATENCY_BUCKETS, histogram):
+            lines.append(f'complaint_stage_seconds_bucket{{stage="{name}",'
+                         f'le="{bound}"}} {count}')
+        count = histogram[len(LATENCY_BUCKETS)]
+        lines.append(f'complaint_stage_seconds_bucket{{stage="{name}",'
+                     f'le="+Inf"}} {count}')
+        lines.append(f'complaint_stage_seconds_sum{{stage="{name}"}} '
+                     f'{histogram[-1]:.6f}')
+        lines.append(f'complaint_stage_seconds_count{{stage="{name}"}} '
+                     f'{count}')
+    for counter in COUNTERS:
+        metric = f"complaint_{counter}_total"
+        lines.append(f"# TYPE {metric} counter")
+        for name, counters in sorted(totals.items()):
+            lines.append(f'{metric}{{stage="{name}"}} {counters[counter]}')
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path):
+    """
+    Writes prometheus_text() to a file atomically, e.g. for the node
+    exporter's textfile collector.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(prometheus_text())
+    os.replace(tmp_path, path)
@@ -0,0 +1,409 @@
+# mock_server.py
+
+import argparse
+import base64
+import json
+import math
+import random
+import re
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Latency per route, drawn from a distribution:
+#   {"distribution": "fixed", "seconds": s}
+#   {"distribution": "uniform", "low": a, "high": b}
+#   {"distribution": "lognormal", "median": m, "sigma": s}
+#   {"distribution": "exponential", "mean": m}
+# Routes are "chat", "vision" (chat requests carrying an image), "images",
+# "transcriptions" and "download" (fetching a generated image).
+DEFAULT_CONFIG = {
+    "latency": {
+        "chat": {"distribution": "lognormal", "median": 0.6, "sigma": 0.4},
+        "vision": {"distribution": "lognormal", "median": 2.0,
+                   "sigma": 0.4},
+        "images": {"distribution": "lognormal", "median": 8.0,
+                   "sigma": 0.3},
+        "transcriptions": {"distribution": "lognormal", "median": 1.5,
+                           "sigma": 0.4},
+        "download": {"distribution": "fixed", "seconds": 0.05},
+    },
+    # Multiplies every latency, e.g. 0.01 for quick smoke runs
+    "latency_scale": 1.0,
+    # Fraction of model requests answered with 500 / 429
+    "error_rate": 0.0,
+    "rate_limit_rate": 0.0,
+    "retry_after_ms": 500,
+    # Canned response content
+    "payloads": {
+        "chat": "Category: Electronics\nSubcategory: "
+                "Mobile Phones & Accessories",
+        "vision": "A smartphone with a large crack across the center of "
+                  "its screen. The damage is in the center and the top-left "
+                  "corner of the display.",
+        "analysis": {
+            "description": "A smartphone with a cracked screen.",
+            "defects": [{"type": "crack", "location": "center",
+                         "size": "large", "part": "screen",
+                         "box": [0.3, 0.3, 0.7, 0.7]}],
+        },
+        "transcription": "I ordered a smartphone last week, but when it "
+                         "arrived the screen was cracked and the device "
+                         "would not turn on. I need a refund.",
+    },
+}
+
+IMAGE_SIZE = 256
+
+_ROUTE_PATTERN = re.compile(
+    r"^/openai/deployments/(?P<deployment>[^/]+)/"
+    r"(?P<route>chat/completions|images/generations|audio/transcriptions)$"
+)
+_ROUTE_NAMES = {
+    "chat/completions": "chat",
+    "images/generations": "images",
+    "audio/transcriptions": "transcriptions",
+}
+
+
+def placeholder_png(size=IMAGE_SIZE, color=(200, 200, 200)):
+    """Returns a solid-color RGB PNG, built without PIL."""
+    def chunk(kind, data):
+        return (struct.pack(">I", len(data)) + kind + data
+                + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff))
+
+    row = b"\x00" + bytes(color) * size
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 2, 0,
+                                         0, 0))
+            + chunk(b"IDAT", zlib.compress(row * size))
+            + chunk(b"IEND", b""))
+
+
+def load_config(path=None, overrides=None):
+    """
+    Builds the server configuration: DEFAULT_CONFIG, updated with a JSON
+    file and then with overrides. "latency" and "payloads" are merged per
+    route instead of replaced.
+
+    Returns:
+        dict: The configuration.
+    """
+    config = json.loads(json.dumps(DEFAULT_CONFIG))
+    updates = []
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            updates.append(json.load(f))
+    if overrides:
+        updates.append(overrides)
+    for update in updates:
+        for key, value in update.items():
+            if key in ("latency", "payloads"):
+                config[key].update(value)
+            else:
+                config[key] = value
+    return config
+
+
+def sample_latency(spec, rng=random):
+    """Draws one latency in seconds from a distribution spec."""
+    if not spec:
+        return 0.0
+    distribution = spec.get("distribution", "fixed")
+    if distribution == "fixed":
+        return float(spec.get("seconds", 0.0))
+    if distribution == "uniform":
+        return rng.uniform(spec["low"], spec["high"])
+    if distribution == "lognormal":
+        return rng.lognormvariate(math.log(spec["median"]),
+                                  spec.get("sigma", 0.5))
+    if distribution == "exponential":
+        return rng.expovariate(1.0 / spec["mean"])
+    raise ValueError(f"Unknown latency distribution '{distribution}'")
+
+
+def schema_instance(schema):
+    """
+    Returns a small value satisfying a JSON schema, for structured-output
+    requests: the first enum value or anyOf branch, one array item, and
+    every property of an object.
+    """
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "const" in schema:
+        return schema["const"]
+    if "anyOf" in schema:
+        return schema_instance(schema["anyOf"][0])
+    kind = schema.get("type")
+    if isinstance(kind, list):
+        kind = kind[0]
+    if kind == "object":
+        return {name: schema_instance(value)
+                for name, value in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [schema_instance(schema.get("items", {}))]
+    if kind in ("number", "integer"):
+        return 0
+    if kind == "boolean":
+        return False
+    if kind == "null":
+        return None
+    return "mock"
+
+
+class MockServer:
+    """
+    Local stand-in for the Azure OpenAI chat completions, image generation
+    and audio transcription routes, with configurable latency, error and
+    429 rates and canned payloads.
+
+    Point AZURE_OPENAI_ENDPOINT at `url` and any key and deployment names
+    are accepted.
+    """
+
+    def __init__(self, config=None, host=DEFAULT_HOST, port=0, seed=None):
+        """
+        Args:
+            config (dict, optional): See load_config. Defaults to
+                DEFAULT_CONFIG.
+            host (str): Interface to listen on.
+            port (int): Port to listen on; 0 picks a free port.
+            seed (int, optional): Seed for latency and error sampling.
+        """
+        self.config = config or load_config()
+        self.rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {}
+        self._thread = None
+        self._httpd = ThreadingHTTPServer((host, port), _handler(self))
+        self._httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        """str: Base URL to use as AZURE_OPENAI_ENDPOINT."""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serves requests on a background thread."""
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        """Stops serving and closes the socket."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def count(self, route, outcome):
+        with self._stats_lock:
+            counts = self.stats.setdefault(route, {})
+            counts[outcome] = counts.get(outcome, 0) + 1
+
+    def get_stats(self):
+        """Returns request counts per route and outcome."""
+        with self._stats_lock:
+            return {route: dict(counts)
+                    for route, counts in self.stats.items()}
+
+    def latency(self, route):
+        with self._rng_lock:
+            seconds = sample_latency(self.config["latency"].get(route),
+                                     self.rng)
+        return seconds * self.config.get("latency_scale", 1.0)
+
+    def failure(self):
+        """Returns 429, 500 or None, drawn from the configured rates."""
+        with self._rng_lock:
+            draw = self.rng.random()
+        rate_limit_rate = self.config.get("rate_limit_rate", 0.0)
+        if draw < rate_limit_rate:
+            return 429
+        if draw < rate_limit_rate + self.config.get("error_rate", 0.0):
+            return 500
+        return None
+
+
+def _handler(server):
+    """Builds the request handler class bound to a MockServer."""
+    png = placeholder_png()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body, content_type="application/json",
+                  headers=None):
+            if not isinstance(body, bytes):
+                body = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path.startswith("/mock/images/"):
+                time.sleep(server.latency("download"))
+                server.count("download", "ok")
+                self._send(200, png, "image/png")
+            elif path == "/mock/stats":
+                self._send(200, server.get_stats())
+            else:
+                self._send(404, {"error": {"code": "NotFound",
+                                           "message": path}})
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length",
+                                                         0)))
+            match = _ROUTE_PATTERN.match(urlparse(self.path).path)
+            if not match:
+                self._send(404, {"error": {"code": "DeploymentNotFound",
+                                           "message": self.path}})
+                return
+            route = _ROUTE_NAMES[match.group("route")]
+            request = {}
+            if route != "transcriptions":
+                request = json.loads(body or b"{}")
+            if route == "chat" and _has_image(request):
+                route = "vision"
+
+            time.sleep(server.latency(route))
+            status = server.failure()
+            if status == 429:
+                server.count(route, "rate_limited")
+                self._send(429, {"error": {
+                    "code": "429",
+                    "message": "Rate limit is exceeded (mock server)."}},
+                    headers={"retry-after-ms":
+                             str(server.config.get("retry_after_ms", 500))})
+                return
+            if status == 500:
+                server.count(route, "error")
+                self._send(500, {"error": {
+                    "code": "InternalServerError",
+                    "message": "Injected failure (mock server)."}})
+                return
+
+            server.count(route, "ok")
+            deployment = match.group("deployment")
+            if route == "transcriptions":
+                self._send(200, {
+                    "text": server.config["payloads"]["transcription"]})
+            elif route == "images":
+                self._send(200, self._image_response(request))
+            else:
+                self._send(200, _chat_response(server, deployment, route,
+                                               request, len(body)))
+
+        def _image_response(self, request):
+            if request.get("response_format") == "b64_json":
+                image = {"b64_json": base64.b64encode(png).decode("ascii")}
+            else:
+                host = self.headers.get("Host") or server.url[7:]
+                image = {"url": f"http://{host}/mock/images/"
+                                f"{time.time_ns()}.png"}
+            image["revised_prompt"] = request.get("prompt", "")
+            return {"created": int(time.time()), "data": [image]}
+
+    return Handler
+
+
+def _has_image(request):
+    for message in request.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, list) and any(
+                part.get("type") == "image_url" for part in content):
+            return True
+    return False
+
+
+def _chat_response(server, deployment, route, request, request_bytes):
+    """Builds a chat completion with a canned or schema-derived answer."""
+    payloads = server.config["payloads"]
+    response_format = request.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        schema = response_format.get("json_schema", {}).get("schema", {})
+        content = json.dumps(schema_instance(schema))
+    elif response_format.get("type") == "json_object":
+        content = json.dumps(payloads["analysis"])
+    else:
+        content = payloads[route]
+    prompt_tokens = request_bytes // 4
+    completion_tokens = max(1, len(content) // 4)
+    return {
+        "id": f"chatcmpl-mock-{time.time_ns()}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": deployment,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve a local mock of the Azure OpenAI routes used by "
+                    "the complaint pipeline."
+    )
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--config", default=None,
+                        help="JSON file overriding DEFAULT_CONFIG")
+    parser.add_argument("--latency-scale", type=float, default=None,
+                        help="Multiply every latency (e.g. 0.1)")
+    parser.add_argument("--error-rate", type=float, default=None,
+                        help="Fraction of requests failing with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=None,
+                        help="Fraction of requests failing with 429")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    overrides = {}
+    if args.latency_scale is not None:
+        overrides["latency_scale"] = args.latency_scale
+    if args.error_rate is not None:
+        overrides["error_rate"] = args.error_rate
+    if args.rate_limit_rate is not None:
+        overrides["rate_limit_rate"] = args.rate_limit_rate
+    mock = MockServer(load_config(args.config, overrides), args.host,
+                      args.port, args.seed)
+    print(f"Mock Azure OpenAI listening on {mock.url}")
+    print(f"Set AZURE_OPENAI_ENDPOINT={mock.url} and any "
+          f"AZURE_OPENAI_API_KEY")
+    try:
+        mock.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,360 @@
+# resilience.py
+
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from openai import (
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+    RateLimitError
+)
+from metrics import record, record_usage
+
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_BASE = 0.5  # seconds
+DEFAULT_BACKOFF_MAX = 30.0  # seconds
+
+# HTTP status codes worth retrying besides 429 and 5xx
+RETRYABLE_STATUS_CODES = {408, 409}
+
+# Rough token cost of one image in a vision request
+IMAGE_TOKEN_ESTIMATE = 1000
+
+_stats_lock = threading.Lock()
+_stats = {
+    "calls": 0,
+    "retries": 0,
+    "rate_limited": 0,
+    "throttled_seconds": 0.0,
+    "backoff_seconds": 0.0,
+}
+
+
+def get_stats():
+    """
+    Returns a snapshot of the resilience counters.
+
+    Returns:
+        dict: calls, retries, rate_limited (429 responses),
+            throttled_seconds (time waiting on token buckets) and
+            backoff_seconds (time sleeping between retries).
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["throttled_seconds"] = round(stats["throttled_seconds"], 3)
+    stats["backoff_seconds"] = round(stats["backoff_seconds"], 3)
+    return stats
+
+
+def reset_stats():
+    """Resets all resilience counters to zero."""
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] = 0
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at a steady per-minute rate.
+
+    The level may go negative when a request turns out to cost more than
+    was reserved for it; later requests then wait for the debt to refill.
+    """
+
+    def __init__(self, per_minute, capacity=None):
+        """
+        Args:
+            per_minute (float): Refill rate, in units per minute.
+            capacity (float, optional): Maximum burst. Defaults to one
+                minute's worth.
+        """
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity,
+                         self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        """
+        Takes `amount` units and returns how long the caller must wait
+        before using them (0 if they were available).
+        """
+        # A single request larger than the bucket can never fit; cap it so
+        # it waits for a full bucket instead of forever
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            self.level -= amount
+            if self.level >= 0:
+                return 0.0
+            return -self.level / self.rate
+
+    def adjust(self, amount):
+        """Returns (positive) or charges (negative) units after the fact."""
+        with self._lock:
+            self._refill()
+            self.level = min(self.capacity, self.level + amount)
+
+
+_limits_lock = threading.Lock()
+_buckets = {}  # deployment -> (requests bucket or None, tokens bucket or None)
+_limit_overrides = {}
+
+
+def set_deployment_limits(deployment, rpm=None, tpm=None):
+    """
+    Sets the requests-per-minute and tokens-per-minute quota for a
+    deployment, replacing limits from environment.
+
+    Args:
+        deployment (str): Deployment name.
+        rpm (float, optional): Requests per minute. None for unlimited.
+        tpm (float, optional): Tokens per minute. None for unlimited.
+    """
+    with _limits_lock:
+        _limit_overrides[deployment] = {"rpm": rpm, "tpm": tpm}
+        _buckets.pop(deployment, None)
+
+
+def _configured_limits(deployment):
+    """
+    Looks up a deployment's quota. DEPLOYMENT_RATE_LIMITS may hold JSON
+    such as {"gpt-4o": {"rpm": 60, "tpm": 30000}}; DEFAULT_RPM and
+    DEFAULT_TPM apply to deployments not listed there.
+    """
+    if deployment in _limit_overrides:
+        return _limit_overrides[deployment]
+    limits = {
+        "rpm": os.getenv('DEFAULT_RPM'),
+        "tpm": os.getenv('DEFAULT_TPM'),
+    }
+    configured = os.getenv('DEPLOYMENT_RATE_LIMITS')
+    if configured:
+        limits.update(json.loads(configured).get(deployment, {}))
+    return {name: float(value) if value else None
+            for name, value in limits.items()}
+
+
+def _get_buckets(deployment):
+    with _limits_lock:
+        if deployment not in _buckets:
+            limits = _configured_limits(deployment)
+            _buckets[deployment] = (
+                TokenBucket(limits["rpm"]) if limits.get("rpm") else None,
+                TokenBucket(limits["tpm"]) if limits.get("tpm") else None,
+            )
+        return _buckets[deployment]
+
+
+def burst_limit(deployment):
+    """
+    Returns how many requests the deployment's requests-per-minute bucket
+    admits at once, or None if its requests are not limited.
+    """
+    requests_bucket, _ = _get_buckets(deployment)
+    if requests_bucket is None:
+        return None
+    return max(1, int(requests_bucket.capacity))
+
+
+def _reserve(deployment, estimated_tokens):
+    """Reserves quota for one request and returns the wait in seconds."""
+    requests_bucket, tokens_bucket = _get_buckets(deployment)
+    wait = 0.0
+    if requests_bucket:
+        wait = max(wait, requests_bucket.reserve(1))
+    if tokens_bucket and estimated_tokens:
+        wait = max(wait, tokens_bucket.reserve(estimated_tokens))
+    return wait
+
+
+def _settle_tokens(deployment, estimated_tokens, response):
+    """Corrects the token bucket with the usage reported by the response."""
+    _, tokens_bucket = _get_buckets(deployment)
+    usage = getattr(response, "usage", None)
+    total_tokens = getattr(usage, "total_tokens", None)
+    if tokens_bucket and isinstance(total_tokens, int):
+        tokens_bucket.adjust(estimated_tokens - total_tokens)
+
+
+def _refund_tokens(deployment, estimated_tokens):
+    """
+    Returns the reservation of a failed attempt to the token bucket: a
+    rejected or failed request has no usage to settle, and each retry
+    reserves again.
+    """
+    _, tokens_bucket = _get_buckets(deployment)
+    if tokens_bucket and estimated_tokens:
+        tokens_bucket.adjust(estimated_tokens)
+
+
+def estimate_tokens(messages, max_tokens, images=0):
+    """
+    Roughly estimates the tokens a chat request will use, for throttling.
+
+    Args:
+        messages (list): Chat messages; text parts count ~4 chars/token.
+        max_tokens (int): Completion limit of the request.
+        images (int): Number of images attached to the request.
+
+    Returns:
+        int: Estimated prompt plus completion tokens.
+    """
+    chars = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            chars += sum(len(part.get("text", "")) for part in content)
+    return chars // 4 + max_tokens + images * IMAGE_TOKEN_ESTIMATE
+
+
+def _retry_after(error):
+    """Returns the server's requested delay in seconds, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000.0
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp()
+                           - time.time())
+            except (TypeError, ValueError):
+                pass
+    return None
+
+
+def _is_retryable(error):
+    if isinstance(error, (RateLimitError, APIConnectionError,
+                          APITimeoutError)):
+        return True
+    if isinstance(error, APIStatusError):
+        status = error.status_code
+        return status >= 500 or status in RETRYABLE_STATUS_CODES
+    return False
+
+
+def _backoff_delay(attempt, error):
+    """Full-jitter exponential backoff, never shorter than Retry-After."""
+    base = float(os.getenv('MODEL_BACKOFF_BASE', DEFAULT_BACKOFF_BASE))
+    cap = float(os.getenv('MODEL_BACKOFF_MAX', DEFAULT_BACKOFF_MAX))
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    retry_after = _retry_after(error)
+    if retry_after is not None:
+        delay = retry_after + random.uniform(0, base)
+    return delay
+
+
+def _max_retries():
+    return int(os.getenv('MODEL_MAX_RETRIES', DEFAULT_MAX_RETRIES))
+
+
+def call_with_retry(deployment, func, *args, estimated_tokens=0, **kwargs):
+    """
+    Calls a model API function under the deployment's rate limits,
+    retrying 429s, timeouts, connection errors and 5xx responses with
+    jittered exponential backoff that honors Retry-After.
+
+    Args:
+        deployment (str): Deployment name the quota applies to.
+        func (callable): Client method to call, e.g.
+            client.chat.completions.create.
+        *args: Positional arguments for func.
+        estimated_tokens (int): Tokens to reserve from the deployment's
+            tokens-per-minute bucket (see estimate_tokens).
+        **kwargs: Keyword arguments for func.
+
+    Returns:
+        The response from func.
+    """
+    max_retries = _max_retries()
+    attempt = 0
+    while True:
+        wait = _reserve(deployment, estimated_tokens)
+        if wait:
+            _count("throttled_seconds", wait)
+            time.sleep(wait)
+        _count("calls")
+        record(calls=1)
+        try:
+            response = func(*args, **kwargs)
+        except Exception as e:
+            _refund_tokens(deployment, estimated_tokens)
+            if isinstance(e, RateLimitError):
+                _count("rate_limited")
+            if attempt >= max_retries or not _is_retryable(e):
+                raise
+            delay = _backoff_delay(attempt, e)
+            _count("retries")
+            record(retries=1)
+            _count("backoff_seconds", delay)
+            time.sleep(delay)
+            attempt += 1
+            continue
+        _settle_tokens(deployment, estimated_tokens, response)
+        record_usage(response)
+        return response
+
+
+async def call_with_retry_async(deployment, func, *args, estimated_tokens=0,
+                                **kwargs):
+    """
+    Async counterpart of call_with_retry, for async client methods.
+
+    Returns:
+        The awaited response from func.
+    """
+    max_retries = _max_retries()
+    attempt = 0
+    while True:
+        wait = _reserve(deployment, estimated_tokens)
+        if wait:
+            _count("throttled_seconds", wait)
+            await asyncio.sleep(wait)
+        _count("calls")
+        record(calls=1)
+        try:
+            response = await func(*args, **kwargs)
+        except Exception as e:
+            _refund_tokens(deployment, estimated_tokens)
+            if isinstance(e, RateLimitError):
+                _count("rate_limited")
+            if attempt >= max_retries or not _is_retryable(e):
+                raise
+            delay = _backoff_delay(attempt, e)
+            _count("retries")
+            record(retries=1)
+            _count("backoff_seconds", delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        _settle_tokens(deployment, estimated_tokens, response)
+        record_usage(response)
+        return response
@@ -0,0 +1,498 @@
+# results_sink.py
+
+import argparse
+import atexit
+import json
+import os
+import threading
+import time
+from collections import Counter
+from artifacts import new_run_id
+from local_classifier import parse_label
+from metrics import COUNTERS, LatencySketch
+
+DEFAULT_ROW_GROUP_SIZE = 10000
+# Rows per batch read back from Parquet while summarizing
+READ_BATCH_SIZE = 65536
+
+# Pipeline stages with a latency column, "<stage>_seconds"
+STAGES = (
+    "transcription",
+    "prompt",
+    "image_path",
+    "image_analysis",
+    "image_description",
+    "annotated_image_path",
+    "classification",
+)
+
+# One flat row per complaint: (column, type)
+FIELDS = (
+    [
+        ("run_id", "string"),
+        ("recorded_at", "float"),
+        ("audio_file_path", "string"),
+        ("output_dir", "string"),
+        ("profile", "string"),
+        ("status", "string"),
+        ("error", "string"),
+        ("category", "string"),
+        ("subcategory", "string"),
+        ("classification", "string"),
+        ("classification_source", "string"),
+        ("speculative_classification", "string"),
+        # 1 if the image-based classification revised the speculative one
+        ("classification_revised", "int"),
+        ("wall_seconds", "float"),
+        ("critical_path_seconds", "float"),
+    ]
+    + [(f"{stage}_seconds", "float") for stage in STAGES]
+    + [(counter, "int") for counter in COUNTERS]
+)
+COLUMNS = tuple(name for name, _ in FIELDS)
+# Columns that tell a sink file apart from other JSONL or Parquet files
+KEY_COLUMNS = ("run_id", "recorded_at", "status", "wall_seconds")
+
+_sink = None
+_sink_configured = False
+_lock = threading.Lock()
+
+
+def build_record(results=None, audio_file_path=None, run_id=None,
+                 output_dir=None, error=None):
+    """
+    Flattens one pipeline run into a results sink row.
+
+    Args:
+        results (dict, optional): Results returned by main.main, or a
+            record written by batch.py. None for a failed run.
+        audio_file_path (str, optional): The complaint's recording.
+        run_id (str, optional): Run id, when results is None.
+        output_dir (str, optional): Output directory, when results is None.
+        error (str, optional): Why the run failed.
+
+    Returns:
+        dict: Every column of FIELDS. Stages that did not run, or whose
+            result was restored from a checkpoint, have no latency.
+    """
+    results = results or {}
+    record = dict.fromkeys(COLUMNS)
+    record.update(
+        run_id=results.get("run_id", run_id),
+        recorded_at=round(time.time(), 3),
+        audio_file_path=results.get("audio_file_path", audio_file_path),
+        output_dir=results.get("output_dir", output_dir),
+        profile=results.get("profile"),
+        status=results.get("status") or ("error" if error else "ok"),
+        error=results.get("error", error),
+        classification=results.get("classification"),
+        classification_source=results.get("classification_source"),
+        speculative_classification=results.get(
+            "speculative_classification"),
+    )
+    if results.get("classification_revised") is not None:
+        record["classification_revised"] = int(
+            results["classification_revised"])
+    label = parse_label(record["classification"])
+    if label:
+        record["category"], record["subcategory"] = label
+
+    timings = results.get("timings")
+    if timings:
+        restored = set(timings.get("restored_stages", ()))
+        record["wall_seconds"] = timings["wall_seconds"]
+        record["critical_path_seconds"] = timings.get(
+            "critical_path_seconds")
+        stages = dict(timings["stages"])
+        # Image stages a deferred-visuals run finished in the background
+        visuals = timings.get("visuals")
+        if visuals:
+            restored.update(visuals.get("restored_stages", ()))
+            stages.update(visuals["stages"])
+        for stage, seconds in stages.items():
+            if stage in STAGES and stage not in restored:
+                record[f"{stage}_seconds"] = seconds
+    totals = (results.get("metrics") or {}).get("totals", {})
+    for counter in COUNTERS:
+        record[counter] = totals.get(counter)
+    return record
+
+
+def _arrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ValueError("Parquet output needs pyarrow. Install it with "
+                         "'pip install pyarrow', or use JSONL only.")
+    return pyarrow, pyarrow.parquet
+
+
+def arrow_schema():
+    """Returns the pyarrow schema of a results sink row."""
+    pa, _ = _arrow()
+    types = {"string": pa.string(), "float": pa.float64(),
+             "int": pa.int64()}
+    return pa.schema([(name, types[kind]) for name, kind in FIELDS])
+
+
+class ResultsSink:
+    """
+    Append-only store of one flat row per complaint, for analytics over
+    many runs.
+
+    Rows are appended to a JSONL file as they arrive, and/or buffered and
+    written to a Parquet file in row groups. Every sink writes its own
+    Parquet part file in the dataset directory, so processes never share
+    a file; a part is named *.tmp until close() finishes it, so readers
+    only ever see complete parts.
+    """
+
+    def __init__(self, jsonl_path=None, parquet_dir=None,
+                 row_group_size=None):
+        """
+        Args:
+            jsonl_path (str, optional): JSONL file receiving every row.
+            parquet_dir (str, optional): Directory of Parquet part files.
+                Needs pyarrow.
+            row_group_size (int, optional): Rows per Parquet row group.
+                Defaults to RESULTS_ROW_GROUP_SIZE from environment or
+                10000.
+        """
+        if not jsonl_path and not parquet_dir:
+            raise ValueError("A results sink needs a JSONL path, a Parquet "
+                             "directory or both")
+        self.jsonl_path = jsonl_path
+        self.parquet_dir = parquet_dir
+        self.row_group_size = row_group_size or int(
+            os.getenv('RESULTS_ROW_GROUP_SIZE', DEFAULT_ROW_GROUP_SIZE))
+        self._lock = threading.Lock()
+        self._jsonl = None
+        self._rows = []
+        self._writer = None
+        self._part_path = None
+        self.rows_written = 0
+
+        if jsonl_path:
+            directory = os.path.dirname(jsonl_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        if parquet_dir:
+            _arrow()
+            os.makedirs(parquet_dir, exist_ok=True)
+
+    def append(self, record):
+        """Appends one row (see build_record)."""
+        row = {column: record.get(column) for column in COLUMNS}
+        with self._lock:
+            if self.jsonl_path:
+                if self._jsonl is None:
+                    self._jsonl = open(self.jsonl_path, "a",
+                                       encoding="utf-8")
+                self._jsonl.write(json.dumps(row, ensure_ascii=False) + "\n")
+                self._jsonl.flush()
+            if self.parquet_dir:
+                self._rows.append(row)
+                if len(self._rows) >= self.row_group_size:
+                    self._write_row_group()
+            self.rows_written += 1
+
+    def _write_row_group(self):
+        if not self._rows:
+            return
+        pa, pq = _arrow()
+        schema = arrow_schema()
+        if self._writer is None:
+            # A new part per writer; appends after close() start another
+            self._part_path = os.path.join(
+                self.parquet_dir,
+                f"part-{new_run_id()}-{os.getpid()}.parquet")
+            self._writer = pq.ParquetWriter(self._part_path + ".tmp", schema)
+        self._writer.write_table(pa.Table.from_pylist(self._rows, schema),
+                                 row_group_size=self.row_group_size)
+        self._rows = []
+
+    def close(self):
+        """Writes the buffered rows and finishes the Parquet part file."""
+        with self._lock:
+            if self._jsonl is not None:
+                self._jsonl.close()
+                self._jsonl = None
+            if self.parquet_dir:
+                self._write_row_group()
+                if self._writer is not None:
+                    self._writer.close()
+                    self._writer = None
+                    os.replace(self._part_path + ".tmp", self._part_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def set_sink(sink):
+    """
+    Sets the sink main.main appends every run to, replacing
+    RESULTS_SINK_JSONL / RESULTS_SINK_PARQUET from environment. Pass None
+    to stop recording.
+    """
+    global _sink, _sink_configured
+    with _lock:
+        _sink = sink
+        _sink_configured = True
+    if sink is not None:
+        atexit.register(sink.close)
+
+
+def get_sink():
+    """
+    Returns the process-wide results sink, created on first use from
+    RESULTS_SINK_JSONL and RESULTS_SINK_PARQUET, or None if neither is set.
+    """
+    global _sink, _sink_configured
+    with _lock:
+        if not _sink_configured:
+            _sink_configured = True
+            jsonl_path = os.getenv('RESULTS_SINK_JSONL')
+            parquet_dir = os.getenv('RESULTS_SINK_PARQUET')
+            if jsonl_path or parquet_dir:
+                _sink = ResultsSink(jsonl_path, parquet_dir)
+                atexit.register(_sink.close)
+        return _sink
+
+
+def _data_files(sources):
+    for source in sources:
+        if os.path.isdir(source):
+            for root, _, files in os.walk(source):
+                for name in sorted(files):
+                    if name.endswith((".jsonl", ".parquet")):
+                        yield os.path.join(root, name)
+        else:
+            yield source
+
+
+def _is_sink_file(path):
+    """Returns whether a JSONL or Parquet file holds results sink rows."""
+    if path.endswith(".parquet"):
+        _, pq = _arrow()
+        columns = pq.read_schema(path).names
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            line = next((line for line in f if line.strip()), None)
+        if line is None:
+            return True
+        try:
+            columns = json.loads(line)
+        except ValueError:
+            return False
+        if not isinstance(columns, dict):
+            return False
+    return all(column in columns for column in KEY_COLUMNS)
+
+
+def _sink_files(sources):
+    """
+    Returns the sink files among sources. Other files found in
+    directories are skipped; other files named explicitly are an error.
+    """
+    paths = []
+    for source in sources:
+        for path in _data_files([source]):
+            if _is_sink_file(path):
+                paths.append(path)
+            elif not os.path.isdir(source):
+                raise ValueError(
+                    f"{path} is not a results sink file. Convert batch.py "
+                    f"results first with 'results_sink.py convert'.")
+    return paths
+
+
+def iter_records(sources):
+    """
+    Reads rows back one at a time from JSONL and Parquet sink files, or
+    directories searched recursively for both. Unfinished Parquet parts
+    (*.tmp) and files that do not hold sink rows are skipped.
+
+    A sink writing both formats stores every row twice; when the sources
+    mix JSONL and Parquet, rows already read in the other format (same
+    run_id and recorded_at) are skipped. Only then do the keys of the rows
+    read stay in memory.
+
+    Yields:
+        dict: One row per complaint.
+
+    Raises:
+        ValueError: If a file named in sources is not a sink file.
+    """
+    paths = _sink_files(sources)
+    formats = {path.endswith(".parquet") for path in paths}
+    seen = set() if len(formats) > 1 else None
+    for record in _read_rows(paths):
+        if seen is not None:
+            key = (record.get("run_id"), record.get("recorded_at"))
+            if key in seen:
+                continue
+            seen.add(key)
+        yield record
+
+
+def _read_rows(paths):
+    for path in paths:
+        if path.endswith(".parquet"):
+            _, pq = _arrow()
+            parquet_file = pq.ParquetFile(path)
+            for batch in parquet_file.iter_batches(
+                    batch_size=READ_BATCH_SIZE):
+                yield from batch.to_pylist()
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+
+def summarize(sources):
+    """
+    Aggregates results sink rows in one streaming pass, in memory that
+    does not grow with the number of rows (unless JSONL and Parquet are
+    read together, see iter_records).
+
+    Args:
+        sources (list): Files or directories, see iter_records.
+
+    Returns:
+        dict: "rows", "status" counts, "categories" and "subcategories"
+            counts (most common first), "latency" per stage, for the
+            whole pipeline and per pipeline profile (see
+            metrics.LatencySketch.summary), summed "counters", and
+            "speculative": how often the image-based classification
+            agreed with the speculative one.
+    """
+    rows = 0
+    statuses = Counter()
+    categories = Counter()
+    subcategories = Counter()
+    sketches = {}
+    counters = dict.fromkeys(COUNTERS, 0)
+    speculative = Counter()
+    for record in iter_records(sources):
+        rows += 1
+        if record.get("classification_revised") is not None:
+            speculative["revised" if record["classification_revised"]
+                        else "agreed"] += 1
+        statuses[record.get("status") or "ok"] += 1
+        if record.get("category"):
+            categories[record["category"]] += 1
+            subcategories[f"{record['category']} / "
+                          f"{record.get('subcategory')}"] += 1
+        for stage in STAGES + ("pipeline",):
+            column = "wall_seconds" if stage == "pipeline" \
+                else f"{stage}_seconds"
+            seconds = record.get(column)
+            if seconds is not None:
+                sketches.setdefault(stage, LatencySketch()).add(seconds)
+        if record.get("profile") and record.get("wall_seconds") is not None:
+            sketches.setdefault(f"pipeline:{record['profile']}",
+                                LatencySketch()).add(record["wall_seconds"])
+        for counter in COUNTERS:
+            counters[counter] += record.get(counter) or 0
+    return {
+        "rows": rows,
+        "status": dict(statuses),
+        "categories": dict(categories.most_common()),
+        "subcategories": dict(subcategories.most_common()),
+        "latency": {stage: sketch.summary()
+                    for stage, sketch in sketches.items()},
+        "counters": counters,
+        "speculative": {
+            "agreed": speculative["agreed"],
+            "revised": speculative["revised"],
+            "agreement_rate": round(
+                speculative["agreed"] / sum(speculative.values()), 3)
+            if speculative else None,
+        },
+    }
+
+
+def _print_summary(summary, top):
+    print(f"{summary['rows']} complaint(s): " + ", ".join(
+        f"{count} {status}" for status, count in summary["status"].items()))
+    classified = sum(summary["categories"].values())
+    if classified:
+        print("Categories:")
+        for category, count in list(summary["categories"].items())[:top]:
+            print(f"  {category}: {count} ({count / classified:.1%})")
+        print("Subcategories:")
+        for label, count in list(summary["subcategories"].items())[:top]:
+            print(f"  {label}: {count} ({count / classified:.1%})")
+    if summary["latency"]:
+        print("Stage latency (p50 / p95 / p99):")
+        for stage, latency in summary["latency"].items():
+            print(f"  {stage}: {latency['p50']:.2f}s / "
+                  f"{latency['p95']:.2f}s / {latency['p99']:.2f}s "
+                  f"(n={latency['count']})")
+    speculative = summary["speculative"]
+    if speculative["agreement_rate"] is not None:
+        print(f"Speculative classification: {speculative['agreed']} agreed, "
+              f"{speculative['revised']} revised "
+              f"({speculative['agreement_rate']:.1%} agreement)")
+    counters = summary["counters"]
+    print(f"Model calls: {counters['calls']}, retries: "
+          f"{counters['retries']}, tokens: {counters['prompt_tokens']} "
+          f"prompt / {counters['completion_tokens']} completion")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Append-only complaint results: summarize them, or "
+                    "convert batch.py results into sink rows."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    summary_parser = commands.add_parser(
+        "summary", help="Category distribution and stage latency "
+                        "percentiles, in one streaming pass")
+    summary_parser.add_argument(
+        "sources", nargs="+",
+        help="Sink JSONL files, Parquet files or directories. Pass one "
+             "format per sink: the other holds the same rows")
+    summary_parser.add_argument("--top", type=int, default=20,
+                                help="Categories to print (default: 20)")
+    summary_parser.add_argument("--output", default=None,
+                                help="Also write the summary as JSON")
+
+    convert_parser = commands.add_parser(
+        "convert", help="Append batch.py results.jsonl records to a sink")
+    convert_parser.add_argument("sources", nargs="+")
+    convert_parser.add_argument("--jsonl", default=None,
+                                help="Sink JSONL file")
+    convert_parser.add_argument("--parquet", default=None,
+                                help="Sink Parquet directory")
+
+    args = parser.parse_args()
+    if args.command == "summary":
+        try:
+            results_summary = summarize(args.sources)
+        except ValueError as e:
+            parser.error(str(e))
+        _print_summary(results_summary, args.top)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(results_summary, f, indent=2)
+            print(f"Summary written to {args.output}")
+    else:
+        if not args.jsonl and not args.parquet:
+            parser.error("convert needs --jsonl, --parquet or both")
+        with ResultsSink(args.jsonl, args.parquet) as results_sink:
+            for path in _data_files(args.sources):
+                if not path.endswith(".jsonl") or _is_sink_file(path):
+                    continue
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            results_sink.append(
+                                build_record(json.loads(line)))
+        print(f"Appended {results_sink.rows_written} row(s)")
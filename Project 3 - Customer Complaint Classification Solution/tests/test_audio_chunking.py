@@ -0,0 +1,89 @@
+# test_audio_chunking.py
+
+import io
+import wave
+import numpy as np
+import audio_chunking
+from audio_chunking import (
+    find_split_points, load_pcm, split_audio, stitch_transcripts
+)
+
+RATE = 8000
+
+
+def _write_wav(path, samples, rate=RATE):
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(samples.astype(np.int16).tobytes())
+
+
+def _tone(seconds, rate=RATE):
+    t = np.arange(int(seconds * rate)) / rate
+    return (np.sin(2 * np.pi * 440 * t) * 8000).astype(np.int16)
+
+
+def test_stitch_drops_repeated_overlap():
+    texts = ["the phone arrived with a cracked",
+             "a cracked screen and it will",
+             "it will not turn on"]
+    assert stitch_transcripts(texts) == (
+        "the phone arrived with a cracked screen and it will not turn on")
+
+
+def test_stitch_ignores_case_punctuation_and_cut_first_word():
+    texts = ["My order never arrived. I called twice,",
+             "ice, I called twice and nobody answered."]
+    assert stitch_transcripts(texts) == (
+        "My order never arrived. I called twice, and nobody answered.")
+
+
+def test_stitch_keeps_text_without_overlap():
+    assert stitch_transcripts(["hello there", "general kenobi"]) == (
+        "hello there general kenobi")
+    assert stitch_transcripts([]) == ""
+
+
+def test_split_points_fall_in_pauses():
+    silence = np.zeros(RATE // 2, dtype=np.int16)
+    samples = np.concatenate([_tone(9), silence, _tone(9), silence,
+                              _tone(5)])
+    points = find_split_points(samples, RATE, chunk_seconds=10)
+    assert points[0] == 0 and points[-1] == len(samples)
+    assert len(points) == 4
+    for point in points[1:-1]:
+        assert not samples[point - 80:point + 80].any()
+    assert all(b - a <= 10 * RATE for a, b in zip(points, points[1:]))
+
+
+def test_split_audio_overlaps_chunks(tmp_path):
+    path = tmp_path / "call.wav"
+    _write_wav(path, _tone(25))
+    chunks = split_audio(str(path), chunk_seconds=10, overlap_seconds=1)
+    assert [name for name, _ in chunks] == [
+        "call_000.wav", "call_001.wav", "call_002.wav"]
+    lengths = []
+    for _, data in chunks:
+        with wave.open(io.BytesIO(data)) as wav:
+            lengths.append(wav.getnframes())
+    # Every boundary adds one second of overlap to both neighbors
+    assert sum(lengths) == 25 * RATE + 4 * RATE
+
+
+def test_wav_layout_skips_large_chunks_before_data(tmp_path):
+    path = tmp_path / "broadcast.wav"
+    _write_wav(path, _tone(1))
+    raw = path.read_bytes()
+    junk = b"JUNK" + (100001).to_bytes(4, "little") + b"\0" * 100002
+    body = raw[8:12] + junk + raw[12:]
+    path.write_bytes(b"RIFF" + len(body).to_bytes(4, "little") + body)
+    assert audio_chunking._wav_layout(str(path)) == (1, 2, RATE, 100054)
+    samples, rate = load_pcm(str(path))
+    assert rate == RATE and len(samples) == RATE
+
+
+def test_wav_layout_of_unfinished_header(tmp_path):
+    path = tmp_path / "growing.wav"
+    path.write_bytes(b"RIFF\0\0\0\0WAVEfmt ")
+    assert audio_chunking._wav_layout(str(path)) is None
@@ -0,0 +1,59 @@
+# test_catalog_index.py
+
+import pytest
+from catalog_index import CatalogIndex, normalize
+
+CATEGORIES = {
+    "Electronics": ["Mobile Phones & Accessories", "Computers & Tablets",
+                    "Audio & Headphones"],
+    "Fashion": ["Shoes & Accessories", "Men's Clothing"],
+    "Home & Kitchen": ["Small Appliances", "Cookware"],
+}
+
+
+@pytest.fixture
+def index():
+    return CatalogIndex(CATEGORIES)
+
+
+def test_normalize():
+    assert normalize("  Men's  Clothing & Shoes!") == (
+        "men s clothing and shoes")
+
+
+def test_resolve_exact_label(index):
+    assert index.resolve("Electronics", "Computers & Tablets") == (
+        ("Electronics", "Computers & Tablets"), 1.0)
+
+
+def test_resolve_near_miss(index):
+    label, confidence = index.resolve("electronics",
+                                      "Mobile Phones and Accessories")
+    assert label == ("Electronics", "Mobile Phones & Accessories")
+    assert confidence == 1.0
+    label, confidence = index.resolve("Electronic", "Mobile Phone Accessory")
+    assert label == ("Electronics", "Mobile Phones & Accessories")
+    assert 0.6 <= confidence < 1.0
+
+
+def test_resolve_under_wrong_category_is_penalized(index):
+    label, confidence = index.resolve("Electronics", "Cookware")
+    assert label == ("Home & Kitchen", "Cookware")
+    assert confidence == pytest.approx(0.8)
+    # Without a category, the subcategory alone is trusted
+    assert index.resolve(None, "Cookware") == (
+        ("Home & Kitchen", "Cookware"), 1.0)
+
+
+def test_resolve_prefers_the_stated_category(index):
+    # "Accessories" appears under two categories
+    label, _ = index.resolve("Fashion", "Accessories")
+    assert label == ("Fashion", "Shoes & Accessories")
+    label, _ = index.resolve("Electronics", "Accessories")
+    assert label == ("Electronics", "Mobile Phones & Accessories")
+
+
+def test_resolve_rejects_unrelated_answers(index):
+    assert index.resolve("Groceries", "Fresh Vegetables") == (None, 0.0)
+    assert index.resolve("Electronics", "") == (None, 0.0)
+    assert index.match_category("Garden") == (None, 0.0)
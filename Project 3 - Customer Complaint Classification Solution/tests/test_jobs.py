@@ -0,0 +1,118 @@
+# test_jobs.py
+
+import time
+import pytest
+from jobs import JobStore
+from main import Stage, run_stages
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.db"), max_attempts=2,
+                    lease_seconds=60)
+
+
+def test_enqueue_keeps_existing_job(store):
+    first = store.enqueue("a.wav", "out/a", {"profile": "text-only"})
+    assert store.enqueue("a.wav", "out/a", {"profile": "full"}) == first
+    assert store.enqueue("b.wav", "out/b") != first
+    assert store.progress()["jobs"]["queued"] == 2
+
+
+def test_claim_takes_oldest_queued_job_once(store):
+    first = store.enqueue("a.wav", "out/a", {"profile": "text-only"})
+    second = store.enqueue("b.wav", "out/b")
+    job = store.claim("w1")
+    assert job["id"] == first
+    assert job["attempts"] == 1
+    assert job["options"] == {"profile": "text-only"}
+    assert store.claim("w2")["id"] == second
+    # Both leases are live
+    assert store.claim("w3") is None
+
+
+def test_claim_reclaims_expired_lease(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"), lease_seconds=0.05)
+    job_id = store.enqueue("a.wav", "out/a")
+    assert store.claim("w1")["id"] == job_id
+    assert store.claim("w2") is None
+    time.sleep(0.1)
+    job = store.claim("w2")
+    assert job["id"] == job_id
+    assert job["attempts"] == 2
+    assert store.list_jobs()[0]["worker"] == "w2"
+
+
+def test_save_stage_renews_lease(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"), lease_seconds=0.5)
+    job_id = store.enqueue("a.wav", "out/a")
+    store.claim("w1")
+    time.sleep(0.3)
+    store.save_stage(job_id, "transcription", "hello", 1.0)
+    time.sleep(0.3)
+    assert store.claim("w2") is None
+
+
+def test_fail_requeues_until_max_attempts(store):
+    job_id = store.enqueue("a.wav", "out/a")
+    store.claim("w1")
+    assert store.fail(job_id, "timeout") == "queued"
+    assert store.claim("w1")["attempts"] == 2
+    assert store.fail(job_id, "timeout again") == "failed"
+    assert store.claim("w1") is None
+    job = store.list_jobs(status="failed")[0]
+    assert job["error"] == "timeout again"
+
+    assert store.retry_failed() == 1
+    assert store.claim("w1")["attempts"] == 1
+    store.finish(job_id)
+    job = store.list_jobs()[0]
+    assert job["status"] == "done" and job["error"] is None
+
+
+def test_completed_stages_drop_missing_files(store, tmp_path):
+    image = tmp_path / "image.png"
+    image.write_bytes(b"png")
+    job_id = store.enqueue("a.wav", "out/a")
+    on_stage = store.checkpointer(job_id)
+    on_stage("transcription", "hello", 1.0)
+    on_stage("image_path", str(image), 2.0)
+    on_stage("missing_path", str(tmp_path / "gone.png"), 2.0)
+    assert store.completed_stages(job_id) == {
+        "transcription": "hello", "image_path": str(image)}
+    assert [row[0] for row in store.job_stages(job_id)] == [
+        "transcription", "image_path", "missing_path"]
+    assert store.list_jobs()[0]["stages"] == 3
+
+
+def test_resume_reruns_stages_after_a_dropped_checkpoint(store, tmp_path):
+    calls = []
+
+    def stage(name, value):
+        def func(**kwargs):
+            calls.append(name)
+            return value
+        return func
+
+    image = str(tmp_path / "image.png")
+    stages = [
+        Stage("transcription", stage("transcription", "text"), []),
+        Stage("image_path", stage("image_path", image), ["transcription"]),
+        Stage("description", stage("description", "cracked"),
+              ["image_path"]),
+    ]
+    job_id = store.enqueue("a.wav", "out/a")
+    open(image, "wb").close()
+    run_stages(stages, on_complete=store.checkpointer(job_id))
+    assert calls == ["transcription", "image_path", "description"]
+
+    calls.clear()
+    results, _ = run_stages(
+        stages, completed=store.completed_stages(job_id))
+    assert calls == []
+    assert results["description"] == "cracked"
+
+    # The image is gone: it and the description built from it run again
+    (tmp_path / "image.png").unlink()
+    run_stages(stages, completed=store.completed_stages(job_id))
+    assert calls == ["image_path", "description"]
@@ -0,0 +1,92 @@
+# test_metrics.py
+
+import random
+import httpx
+import pytest
+import metrics
+from metrics import LatencySketch, percentile
+
+
+def test_percentile_interpolates_between_ranks():
+    assert percentile([], 50) is None
+    assert percentile([3.0], 99) == 3.0
+    assert percentile([4.0, 1.0, 3.0, 2.0], 50) == 2.5
+    assert percentile([1.0, 2.0, 3.0, 4.0, 5.0], 100) == 5.0
+
+
+def test_sketch_is_within_relative_accuracy():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(0, 1.5) for _ in range(20000)]
+    sketch = LatencySketch(relative_accuracy=0.01)
+    for value in values:
+        sketch.add(value)
+    for q in (50, 95, 99):
+        exact = percentile(values, q)
+        assert sketch.percentile(q) == pytest.approx(exact, rel=0.02)
+    assert sketch.count == len(values)
+    assert sketch.max == max(values)
+
+
+def test_sketch_summary_of_zeros_and_empty():
+    assert LatencySketch().summary()["p50"] is None
+    sketch = LatencySketch()
+    for _ in range(3):
+        sketch.add(0.0)
+    sketch.add(2.0)
+    summary = sketch.summary()
+    assert summary["p50"] == 0.0
+    assert summary["max"] == 2.0
+    assert summary["count"] == 4
+
+
+def test_summarize_latencies_skips_restored_stages():
+    timings = [
+        {"stages": {"transcription": 1.0, "classification": 0.0},
+         "restored_stages": ["classification"], "wall_seconds": 1.5,
+         "profile": "full"},
+        {"stages": {"transcription": 3.0, "classification": 2.0},
+         "wall_seconds": 5.0, "profile": "full"},
+    ]
+    summary = metrics.summarize_latencies(timings)
+    assert summary["transcription"]["count"] == 2
+    assert summary["classification"]["count"] == 1
+    assert summary["pipeline:full"]["max"] == 5.0
+
+
+def _client(handler):
+    return httpx.Client(
+        transport=httpx.MockTransport(handler),
+        event_hooks={"request": [metrics.record_request],
+                     "response": [metrics.record_response]})
+
+
+def test_counts_bytes_without_content_length():
+    def handler(request):
+        request.read()
+
+        def body():
+            yield b"a" * 1000
+            yield b"b" * 500
+        return httpx.Response(200, content=body())
+
+    with metrics.collect() as run, metrics.stage("download"):
+        with _client(handler) as client:
+            with client.stream("GET", "http://test/") as response:
+                for _ in response.iter_bytes(100):
+                    pass
+            client.post("http://test/", content=iter([b"12345", b"678"]))
+    counters = run.as_dict()["stages"]["download"]
+    assert counters["response_bytes"] == 3000
+    assert counters["request_bytes"] == 8
+
+
+def test_counts_bytes_from_content_length():
+    def handler(request):
+        return httpx.Response(200, content=b"x" * 10)
+
+    with metrics.collect() as run, metrics.stage("call"):
+        with _client(handler) as client:
+            client.post("http://test/", json={"a": 1})
+    counters = run.as_dict()["stages"]["call"]
+    assert counters["response_bytes"] == 10
+    assert counters["request_bytes"] == len(b'{"a":1}')
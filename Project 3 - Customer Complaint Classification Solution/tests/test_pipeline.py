@@ -0,0 +1,93 @@
+# test_pipeline.py
+
+import os
+import pytest
+import batch
+import gpt
+import main
+from benchmark import MOCK_ENVIRONMENT, _write_fixtures
+from mock_server import MockServer, load_config
+
+
+@pytest.fixture
+def audio_path(tmp_path, monkeypatch):
+    """Points every client at an in-process mock server."""
+    server = MockServer(load_config(overrides={"latency_scale": 0.02}),
+                        seed=1).start()
+    for name, value in MOCK_ENVIRONMENT.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setenv("AZURE_OPENAI_ENDPOINT", server.url)
+    monkeypatch.setenv("WHISPER_ENDPOINT", server.url)
+    monkeypatch.setenv("ARTIFACT_ROOT", str(tmp_path / "runs"))
+    for name in ("RESULTS_SINK_JSONL", "RESULTS_SINK_PARQUET",
+                 "PIPELINE_PROFILE", "CLASSIFICATION_SPECULATIVE"):
+        monkeypatch.delenv(name, raising=False)
+    audio, _ = _write_fixtures(str(tmp_path / "fixtures"))
+    yield audio
+    server.stop()
+
+
+def test_full_run_writes_its_own_run_directory(audio_path, tmp_path):
+    first = main.main(audio_path, verbose=False, profile="full")
+    second = main.main(audio_path, verbose=False, profile="full")
+    assert first["run_id"] != second["run_id"]
+    assert first["classification"]
+    for results in (first, second):
+        assert results["output_dir"].startswith(str(tmp_path / "runs"))
+        assert os.path.exists(results["image_path"])
+
+
+def test_batch_record_waits_for_deferred_visuals(audio_path, tmp_path):
+    record = batch.process_file(audio_path, str(tmp_path / "out"),
+                                profile="deferred-visuals")
+    assert record["status"] == "ok"
+    assert record["visuals"] == "done"
+    assert os.path.exists(record["image_path"])
+
+
+def test_failed_visuals_fail_the_batch_record(audio_path, tmp_path,
+                                              monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError("no image")
+    monkeypatch.setattr(main, "generate_image", broken)
+    record = batch.process_file(audio_path, str(tmp_path / "out"),
+                                profile="deferred-visuals")
+    assert record["status"] == "error"
+    assert record["error"] == "RuntimeError: no image"
+    assert record["classification"]
+
+
+def test_speculative_answer_is_checkpointed_and_counted_once(audio_path,
+                                                             tmp_path):
+    checkpoints = {}
+
+    def on_stage(name, value, seconds):
+        checkpoints[name] = value
+
+    def compared():
+        stats = gpt.get_stats()
+        return stats["speculative_agreed"] + stats["speculative_revised"]
+
+    before = compared()
+    output_dir = str(tmp_path / "out")
+    early = main.main(audio_path, output_dir=output_dir, verbose=False,
+                      on_stage=on_stage, profile="deferred-visuals",
+                      speculative=True)
+    final = main.wait_for_visuals(early["run_id"])
+    assert final["speculative_classification"] == early["classification"]
+    assert checkpoints["speculative_classification"] == (
+        early["classification"])
+    assert checkpoints["classification"] == final["classification"]
+    assert compared() == before + 1
+
+    # Resuming from every checkpoint restores the comparison too
+    resumed = main.main(audio_path, output_dir=output_dir, verbose=False,
+                        completed=dict(checkpoints),
+                        profile="deferred-visuals", speculative=True)
+    main.wait_for_visuals(resumed["run_id"])
+    assert compared() == before + 1
+
+
+def test_full_profile_rejects_speculative():
+    with pytest.raises(ValueError):
+        main.check_speculative("full", True)
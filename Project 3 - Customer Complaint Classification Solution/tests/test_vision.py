@@ -0,0 +1,42 @@
+# test_vision.py
+
+import json
+from vision import _normalize_box, parse_analysis
+
+
+def test_normalize_box_clamps_and_orders():
+    assert _normalize_box([0.5, 0.6, 0.1, 0.2]) == [0.1, 0.2, 0.5, 0.6]
+    assert _normalize_box([-1, 0.2, 2, "0.9"]) == [0.0, 0.2, 1.0, 0.9]
+
+
+def test_normalize_box_rejects_malformed():
+    assert _normalize_box(None) is None
+    assert _normalize_box([0.1, 0.2, 0.3]) is None
+    assert _normalize_box([0.1, "a", 0.3, 0.4]) is None
+    # Degenerate once clamped
+    assert _normalize_box([0.2, 0.2, 0.2, 0.8]) is None
+    assert _normalize_box([1.5, 0.1, 2.0, 0.5]) is None
+
+
+def test_parse_analysis_reads_fenced_json():
+    text = "```json\n" + json.dumps({
+        "description": "A cracked phone screen.",
+        "defects": [
+            {"type": "crack", "location": "center", "size": "large",
+             "part": "screen", "box": [0.2, 0.3, 0.8, 0.7]},
+            {"type": "scratch", "box": [0.1]},
+            "not a defect",
+        ],
+    }) + "\n```"
+    analysis = parse_analysis(text)
+    assert analysis["description"] == "A cracked phone screen."
+    assert len(analysis["defects"]) == 2
+    assert analysis["defects"][0]["box"] == [0.2, 0.3, 0.8, 0.7]
+    assert analysis["defects"][1] == {"type": "scratch", "location": "",
+                                      "size": "", "part": "", "box": None}
+
+
+def test_parse_analysis_falls_back_to_text():
+    assert parse_analysis("Just a description.") == {
+        "description": "Just a description.", "defects": []}
+    assert parse_analysis("[1, 2]")["defects"] == []
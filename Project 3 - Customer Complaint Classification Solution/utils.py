@@ -1,10 +1,27 @@
-from openai import AzureOpenAI
+from openai import AzureOpenAI, AsyncAzureOpenAI
+import asyncio
+import httpx
 import json
 import base64
 import os
+import threading
+import weakref
 from pathlib import Path
 from mimetypes import guess_type
 from dotenv import load_dotenv
+from cache import get_cache, hash_key, file_digest
+from image_preprocessing import image_data_url, preprocess_settings
+from resilience import (
+    call_with_retry,
+    call_with_retry_async,
+    estimate_tokens
+)
+from metrics import (
+    record_request,
+    record_request_async,
+    record_response,
+    record_response_async
+)
 
 # Load environment variables from .env file
 env_path = Path(__file__).parent / '.env'
@@ -12,27 +29,193 @@ if env_path.exists():
     load_dotenv(env_path)
 
 
-def create_openai_client(api_version, api_key, api_endpoint):
-    """Create an Azure OpenAI client."""
-    client = AzureOpenAI(
-        api_version=api_version,
-        api_key=api_key,
-        azure_endpoint=api_endpoint
+# Connection pool limits shared by every Azure OpenAI client
+DEFAULT_HTTP_MAX_CONNECTIONS = 100
+DEFAULT_HTTP_MAX_KEEPALIVE = 20
+DEFAULT_HTTP_KEEPALIVE_EXPIRY = 60.0
+
+HTTP_TIMEOUT = httpx.Timeout(600.0, connect=10.0)
+
+_http_client = None
+_clients = {}
+_clients_lock = threading.Lock()
+
+# Async connection pools are bound to the event loop that uses them, so
+# each running loop gets its own pool and clients.
+_async_pools = weakref.WeakKeyDictionary()
+
+
+def _pool_limits():
+    """
+    Reads the connection pool limits from HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE and HTTP_KEEPALIVE_EXPIRY (seconds).
+    """
+    return httpx.Limits(
+        max_connections=int(os.getenv(
+            'HTTP_MAX_CONNECTIONS', DEFAULT_HTTP_MAX_CONNECTIONS)),
+        max_keepalive_connections=int(os.getenv(
+            'HTTP_MAX_KEEPALIVE', DEFAULT_HTTP_MAX_KEEPALIVE)),
+        keepalive_expiry=float(os.getenv(
+            'HTTP_KEEPALIVE_EXPIRY', DEFAULT_HTTP_KEEPALIVE_EXPIRY)),
     )
-    return client
 
 
-def create_azure_openai_client(api_version=None):
+def _get_http_client():
     """
-    Create an Azure OpenAI client from environment variables.
-    Reads from AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT, and GPT_VERSION.
+    Returns the process-wide keep-alive HTTP client used by all Azure
+    OpenAI clients. Call with _clients_lock held.
+    """
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.Client(
+            limits=_pool_limits(), timeout=HTTP_TIMEOUT,
+            # Request and response sizes for the per-stage metrics
+            event_hooks={"request": [record_request],
+                         "response": [record_response]})
+    return _http_client
+
+
+def get_openai_client(api_endpoint, api_version, api_key):
+    """
+    Returns the shared Azure OpenAI client for an endpoint, API version and
+    key, creating it on first use.
+
+    All clients share one keep-alive connection pool, so each endpoint
+    costs one TLS handshake per process rather than one per call.
 
     Args:
-        api_version (str, optional): API version to use. If not provided,
-            uses GPT_VERSION from environment or default.
+        api_endpoint (str): Base endpoint URL (without /openai).
+        api_version (str): API version to use.
+        api_key (str): API key for the endpoint.
 
     Returns:
-        AzureOpenAI: Configured Azure OpenAI client.
+        AzureOpenAI: Shared Azure OpenAI client.
+    """
+    key = (api_endpoint, api_version, api_key)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = AzureOpenAI(
+                api_key=api_key,
+                api_version=api_version,
+                azure_endpoint=api_endpoint,
+                http_client=_get_http_client(),
+                # Retries are handled by resilience.call_with_retry
+                max_retries=0
+            )
+            _clients[key] = client
+        return client
+
+
+def get_http_client():
+    """
+    Returns the process-wide keep-alive HTTP client shared by the Azure
+    OpenAI clients, for other requests such as image downloads.
+
+    Returns:
+        httpx.Client: Shared HTTP client.
+    """
+    with _clients_lock:
+        return _get_http_client()
+
+
+def close_clients():
+    """Closes the shared connection pool and forgets all cached clients."""
+    global _http_client
+    with _clients_lock:
+        _clients.clear()
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
+
+
+def get_async_http_client():
+    """
+    Returns the keep-alive async HTTP client for the running event loop.
+
+    It is shared by every async Azure OpenAI client on that loop and can
+    also be used for other downloads (e.g. generated images).
+
+    Returns:
+        httpx.AsyncClient: Shared async HTTP client.
+    """
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        pool = _async_pools.get(loop)
+        if pool is None:
+            pool = {
+                "http_client": httpx.AsyncClient(
+                    limits=_pool_limits(), timeout=HTTP_TIMEOUT,
+                    event_hooks={"request": [record_request_async],
+                                 "response": [record_response_async]}),
+                "clients": {},
+            }
+            _async_pools[loop] = pool
+        return pool["http_client"]
+
+
+def get_async_openai_client(api_endpoint, api_version, api_key):
+    """
+    Async counterpart of get_openai_client, shared per event loop.
+
+    Args:
+        api_endpoint (str): Base endpoint URL (without /openai).
+        api_version (str): API version to use.
+        api_key (str): API key for the endpoint.
+
+    Returns:
+        AsyncAzureOpenAI: Shared async Azure OpenAI client.
+    """
+    http_client = get_async_http_client()
+    key = (api_endpoint, api_version, api_key)
+    with _clients_lock:
+        clients = _async_pools[asyncio.get_running_loop()]["clients"]
+        client = clients.get(key)
+        if client is None:
+            client = AsyncAzureOpenAI(
+                api_key=api_key,
+                api_version=api_version,
+                azure_endpoint=api_endpoint,
+                http_client=http_client,
+                max_retries=0
+            )
+            clients[key] = client
+        return client
+
+
+async def close_async_clients():
+    """Closes the running event loop's connection pool and clients."""
+    with _clients_lock:
+        pool = _async_pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool["http_client"].aclose()
+
+
+def _clean_endpoint(endpoint):
+    """Strips quotes and any /openai or /deployments path from an endpoint."""
+    endpoint = endpoint.strip().strip('"').strip("'")
+
+    # Ensure endpoint doesn't have trailing /openai or /deployments paths
+    # The SDK will add those automatically
+    if '/openai' in endpoint:
+        endpoint = endpoint.split('/openai')[0]
+    if '/deployments' in endpoint:
+        endpoint = endpoint.split('/deployments')[0]
+    # Remove trailing slash
+    return endpoint.rstrip('/')
+
+
+def create_openai_client(api_version, api_key, api_endpoint):
+    """Create an Azure OpenAI client."""
+    return get_openai_client(api_endpoint, api_version, api_key)
+
+
+def _azure_openai_settings(api_version=None):
+    """
+    Reads the main endpoint, API version and key from environment.
+
+    Returns:
+        tuple: (endpoint, api_version, api_key), cleaned up.
     """
     api_key = os.getenv('AZURE_OPENAI_API_KEY')
     endpoint = os.getenv('AZURE_OPENAI_ENDPOINT')
@@ -53,38 +236,18 @@ def create_azure_openai_client(api_version=None):
 
     # Clean up the API key and endpoint (remove quotes if present)
     api_key = api_key.strip().strip('"').strip("'")
-    endpoint = endpoint.strip().strip('"').strip("'")
-
-    # Ensure endpoint doesn't have trailing /openai or /deployments paths
-    # The SDK will add those automatically
-    if '/openai' in endpoint:
-        endpoint = endpoint.split('/openai')[0]
-    if '/deployments' in endpoint:
-        endpoint = endpoint.split('/deployments')[0]
-    # Remove trailing slash
-    endpoint = endpoint.rstrip('/')
+    endpoint = _clean_endpoint(endpoint)
 
-    client = AzureOpenAI(
-        api_key=api_key,
-        api_version=api_version,
-        azure_endpoint=endpoint
-    )
-    return client
+    return endpoint, api_version, api_key
 
 
-def create_whisper_openai_client(api_version=None):
+def _whisper_openai_settings(api_version=None):
     """
-    Create an Azure OpenAI client specifically for Whisper.
-    Uses WHISPER_ENDPOINT and WHISPER_API_KEY if available,
-    otherwise falls back to main AZURE_OPENAI_ENDPOINT and
-    AZURE_OPENAI_API_KEY.
-
-    Args:
-        api_version (str, optional): API version to use. If not provided,
-            uses WHISPER_VERSION or GPT_VERSION from environment or default.
+    Reads the Whisper endpoint, API version and key from environment,
+    falling back to the main endpoint and key.
 
     Returns:
-        AzureOpenAI: Configured Azure OpenAI client for Whisper.
+        tuple: (endpoint, api_version, api_key), cleaned up.
     """
     # Try Whisper-specific endpoint and API key first
     whisper_api_key = os.getenv('WHISPER_API_KEY')
@@ -114,26 +277,82 @@ def create_whisper_openai_client(api_version=None):
 
     # Clean up the API key and endpoint (remove quotes if present)
     api_key = api_key.strip().strip('"').strip("'")
-    endpoint = endpoint.strip().strip('"').strip("'")
+    endpoint = _clean_endpoint(endpoint)
 
-    # Ensure endpoint doesn't have trailing /openai or /deployments paths
-    # The SDK will add those automatically
-    if '/openai' in endpoint:
-        endpoint = endpoint.split('/openai')[0]
-    if '/deployments' in endpoint:
-        endpoint = endpoint.split('/deployments')[0]
-    # Remove trailing slash
-    endpoint = endpoint.rstrip('/')
+    return endpoint, api_version, api_key
 
-    client = AzureOpenAI(
-        api_key=api_key,
-        api_version=api_version,
-        azure_endpoint=endpoint
-    )
-    return client
 
+def create_azure_openai_client(api_version=None):
+    """
+    Create an Azure OpenAI client from environment variables.
+    Reads from AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT, and GPT_VERSION.
+
+    Clients are shared per (endpoint, API version, key), so repeated calls
+    reuse the same client and connection pool.
+
+    Args:
+        api_version (str, optional): API version to use. If not provided,
+            uses GPT_VERSION from environment or default.
+
+    Returns:
+        AzureOpenAI: Configured Azure OpenAI client.
+    """
+    return get_openai_client(*_azure_openai_settings(api_version))
+
+
+def create_whisper_openai_client(api_version=None):
+    """
+    Create an Azure OpenAI client specifically for Whisper.
+    Uses WHISPER_ENDPOINT and WHISPER_API_KEY if available,
+    otherwise falls back to main AZURE_OPENAI_ENDPOINT and
+    AZURE_OPENAI_API_KEY.
+
+    Clients are shared per (endpoint, API version, key), so repeated calls
+    reuse the same client and connection pool.
+
+    Args:
+        api_version (str, optional): API version to use. If not provided,
+            uses WHISPER_VERSION or GPT_VERSION from environment or default.
+
+    Returns:
+        AzureOpenAI: Configured Azure OpenAI client for Whisper.
+    """
+    return get_openai_client(*_whisper_openai_settings(api_version))
+
+
+def create_async_azure_openai_client(api_version=None):
+    """
+    Async counterpart of create_azure_openai_client. Must be called from
+    a running event loop.
+
+    Returns:
+        AsyncAzureOpenAI: Configured async Azure OpenAI client.
+    """
+    return get_async_openai_client(*_azure_openai_settings(api_version))
+
+
+def create_async_whisper_openai_client(api_version=None):
+    """
+    Async counterpart of create_whisper_openai_client. Must be called from
+    a running event loop.
+
+    Returns:
+        AsyncAzureOpenAI: Configured async Azure OpenAI client for Whisper.
+    """
+    return get_async_openai_client(*_whisper_openai_settings(api_version))
+
+
+def local_image_to_data_url(image_path, preprocess=True):
+    """
+    Encodes a local image as a data URL for the vision API.
+
+    Unless preprocess is False or VISION_IMAGE_FORMAT is "original", the
+    image is first downscaled, stripped of metadata and re-encoded (see
+    image_preprocessing), and the result is cached per image hash.
+    """
+    if preprocess and preprocess_settings()[0] != "original":
+        return image_data_url(image_path)
 
-def local_image_to_data_url(image_path):
     mime_type, _ = guess_type(image_path)
     if mime_type is None:
         mime_type = 'application/octet-stream'
@@ -144,101 +363,265 @@ def local_image_to_data_url(image_path):
     return f"data:{mime_type};base64,{base64_encoded_data}"
 
 
-def describe_local_image(client, image_path, deployment_name, prompt):
+def _vision_detail(detail):
+    """Returns the requested image detail level (low, high or auto)."""
+    detail = detail or os.getenv('VISION_DETAIL')
+    if detail and detail not in ("low", "high", "auto"):
+        raise ValueError(
+            f"Unsupported vision detail '{detail}'. Use low, high or auto."
+        )
+    return detail
+
+
+def _vision_messages(prompt, image_url, detail=None):
+    """Builds the chat messages asking the model about one image."""
+    image = {"url": image_url}
+    if detail:
+        image["detail"] = detail
+    return [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {"type": "image_url", "image_url": image}
+            ]
+        }
+    ]
+
+
+def _vision_cache_key(image_path, deployment_name, prompt,
+                      response_format=None, detail=None):
+    # The preprocessing settings change what the model sees, so they are
+    # part of the key
+    return hash_key(file_digest(image_path), prompt, deployment_name,
+                    json.dumps(response_format, sort_keys=True),
+                    repr(preprocess_settings()), detail)
+
+
+def _vision_params(deployment_name, messages, response_format):
+    params = {
+        "model": deployment_name,
+        "messages": messages,
+        "max_tokens": 1024
+    }
+    if response_format is not None:
+        params["response_format"] = response_format
+    return params
+
+
+def describe_local_image(client, image_path, deployment_name, prompt,
+                         use_cache=True, response_format=None, detail=None):
+    """
+    Asks the vision model about a local image.
+
+    Args:
+        client: OpenAI client instance.
+        image_path (str): Path to the image.
+        deployment_name (str): Model/deployment name.
+        prompt (str): Question about the image.
+        use_cache (bool): Reuse a cached answer for the same image bytes,
+            prompt and settings.
+        response_format (dict, optional): e.g. {"type": "json_object"}.
+        detail (str, optional): Vision detail level: low, high or auto.
+            Defaults to VISION_DETAIL from environment.
+
+    Returns:
+        str: Response content.
+    """
+    detail = _vision_detail(detail)
+
+    # Reuse an earlier answer for the same image bytes and prompt
+    cache = get_cache() if use_cache else None
+    if cache:
+        cache_key = _vision_cache_key(image_path, deployment_name, prompt,
+                                      response_format, detail)
+        cached = cache.get_text("vision", cache_key)
+        if cached is not None:
+            return cached
+
     data_url = local_image_to_data_url(image_path)
 
-    response = client.chat.completions.create(
+    messages = _vision_messages(prompt, data_url, detail)
+    response = call_with_retry(
+        deployment_name,
+        client.chat.completions.create,
+        estimated_tokens=estimate_tokens(messages, 1024, images=1),
+        **_vision_params(deployment_name, messages, response_format)
+    )
+    description = response.choices[0].message.content
+    if cache and description is not None:
+        cache.put_text("vision", cache_key, description)
+    return description
+
+
+async def describe_local_image_async(client, image_path, deployment_name,
+                                     prompt, use_cache=True,
+                                     response_format=None, detail=None):
+    """
+    Async counterpart of describe_local_image, for an AsyncAzureOpenAI
+    client. Hashing and encoding the file run in a worker thread.
+    """
+    detail = _vision_detail(detail)
+
+    cache = get_cache() if use_cache else None
+    if cache:
+        cache_key = await asyncio.to_thread(
+            _vision_cache_key, image_path, deployment_name, prompt,
+            response_format, detail)
+        cached = cache.get_text("vision", cache_key)
+        if cached is not None:
+            return cached
+
+    data_url = await asyncio.to_thread(local_image_to_data_url, image_path)
+
+    messages = _vision_messages(prompt, data_url, detail)
+    response = await call_with_retry_async(
+        deployment_name,
+        client.chat.completions.create,
+        estimated_tokens=estimate_tokens(messages, 1024, images=1),
+        **_vision_params(deployment_name, messages, response_format)
+    )
+    description = response.choices[0].message.content
+    if cache and description is not None:
+        cache.put_text("vision", cache_key, description)
+    return description
+
+
+def describe_online_image(client, image_url, deployment_name, prompt,
+                          detail=None):
+    messages = _vision_messages(prompt, image_url, _vision_detail(detail))
+    response = call_with_retry(
+        deployment_name,
+        client.chat.completions.create,
+        estimated_tokens=estimate_tokens(messages, 1024, images=1),
         model=deployment_name,
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant."},
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                    {"type": "image_url", "image_url": {"url": data_url}}
-                ]
-            }
-        ],
+        messages=messages,
         max_tokens=1024
     )
     return response.choices[0].message.content
 
 
-def describe_online_image(client, image_url, deployment_name, prompt):
-    response = client.chat.completions.create(
+async def describe_online_image_async(client, image_url, deployment_name,
+                                      prompt, detail=None):
+    """Async counterpart of describe_online_image."""
+    messages = _vision_messages(prompt, image_url, _vision_detail(detail))
+    response = await call_with_retry_async(
+        deployment_name,
+        client.chat.completions.create,
+        estimated_tokens=estimate_tokens(messages, 1024, images=1),
         model=deployment_name,
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant."},
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                    {"type": "image_url", "image_url": {"url": image_url}}
-                ]
-            }
-        ],
+        messages=messages,
         max_tokens=1024
     )
     return response.choices[0].message.content
 
 
+def _image_connection_error(error, client, model):
+    """
+    Wraps a DNS/connection failure from image generation in a
+    ConnectionError with troubleshooting steps, or returns None for any
+    other error.
+    """
+    error_msg = str(error)
+    if ("getaddrinfo failed" in error_msg or
+            "Connection error" in error_msg):
+        # Get endpoint from environment for better error message
+        endpoint = os.getenv('AZURE_OPENAI_ENDPOINT', 'not set')
+        api_version = getattr(client, '_api_version', 'unknown')
+        return ConnectionError(
+            f"Failed to connect to Azure OpenAI endpoint for DALL-E. "
+            f"Please verify:\n"
+            f"1. AZURE_OPENAI_ENDPOINT is correct in your .env file\n"
+            f"   Current value: {endpoint}\n"
+            f"2. The endpoint URL is accessible from your network\n"
+            f"3. The endpoint format is correct "
+            f"(should be base URL without /openai)\n"
+            f"   Example: https://your-resource.openai.azure.com\n"
+            f"4. DALLE_VERSION is set correctly "
+            f"(if different from GPT_VERSION)\n"
+            f"   API Version being used: {api_version}\n"
+            f"5. Model deployment name: {model}\n"
+            f"Original error: {error_msg}"
+        )
+    return None
+
+
 def generate_image(client, prompt, model, size,
                    quality,
-                   style):
+                   style, response_format="url"):
+    """
+    Generates one image with DALL-E.
+
+    Args:
+        client: OpenAI client instance.
+        prompt (str): Image prompt.
+        model (str): DALL-E deployment name.
+        size (str): Image size, e.g. "1024x1024".
+        quality (str): Image quality.
+        style (str): Image style.
+        response_format (str): "url" to get a download URL, or "b64_json"
+            to get the image inline and skip the download.
+
+    Returns:
+        str: The image URL, or the base64-encoded image for "b64_json".
+    """
     try:
-        result = client.images.generate(
+        result = call_with_retry(
+            model,
+            client.images.generate,
             model=model,
             prompt=prompt,
             size=size,
             quality=quality,
-            style=style
+            style=style,
+            response_format=response_format
         )
 
-        json_response = json.loads(result.model_dump_json())
-        image_url = json_response["data"][0]["url"]
-
-        return image_url
+        image = result.data[0]
+        if response_format == "b64_json":
+            return image.b64_json
+        return image.url
     except Exception as e:
-        error_msg = str(e)
-        if ("getaddrinfo failed" in error_msg or
-                "Connection error" in error_msg):
-            # Get endpoint from environment for better error message
-            endpoint = os.getenv('AZURE_OPENAI_ENDPOINT', 'not set')
-            api_version = getattr(client, '_api_version', 'unknown')
-            raise ConnectionError(
-                f"Failed to connect to Azure OpenAI endpoint for DALL-E. "
-                f"Please verify:\n"
-                f"1. AZURE_OPENAI_ENDPOINT is correct in your .env file\n"
-                f"   Current value: {endpoint}\n"
-                f"2. The endpoint URL is accessible from your network\n"
-                f"3. The endpoint format is correct "
-                f"(should be base URL without /openai)\n"
-                f"   Example: https://your-resource.openai.azure.com\n"
-                f"4. DALLE_VERSION is set correctly "
-                f"(if different from GPT_VERSION)\n"
-                f"   API Version being used: {api_version}\n"
-                f"5. Model deployment name: {model}\n"
-                f"Original error: {error_msg}"
-            ) from e
+        connection_error = _image_connection_error(e, client, model)
+        if connection_error:
+            raise connection_error from e
         raise
 
 
-def chat(gpt_client, deployment_name, prompt, system_message=None,
-         temperature=None, max_tokens=1000):
+async def generate_image_async(client, prompt, model, size, quality, style,
+                               response_format="url"):
     """
-    Chat completion using GPT model.
-
-    Args:
-        gpt_client: OpenAI client instance.
-        deployment_name: Model/deployment name.
-        prompt: User prompt.
-        system_message: Optional custom system message.
-        temperature: Optional temperature setting.
-        max_tokens: Maximum tokens in response.
+    Async counterpart of generate_image.
 
     Returns:
-        str: Response content.
+        str: The image URL, or the base64-encoded image for "b64_json".
     """
+    try:
+        result = await call_with_retry_async(
+            model,
+            client.images.generate,
+            model=model,
+            prompt=prompt,
+            size=size,
+            quality=quality,
+            style=style,
+            response_format=response_format
+        )
+        image = result.data[0]
+        if response_format == "b64_json":
+            return image.b64_json
+        return image.url
+    except Exception as e:
+        connection_error = _image_connection_error(e, client, model)
+        if connection_error:
+            raise connection_error from e
+        raise
+
+
+def _chat_params(deployment_name, prompt, system_message, temperature,
+                 max_tokens, response_format=None):
+    """Builds the chat completion request shared by chat and chat_async."""
     if system_message is None:
         system_message = "You are a helpful assistant."
 
@@ -261,8 +644,106 @@ def chat(gpt_client, deployment_name, prompt, system_message=None,
 
     if temperature is not None:
         params["temperature"] = temperature
+    if response_format is not None:
+        params["response_format"] = response_format
 
-    response = gpt_client.chat.completions.create(**params)
+    return params
+
+
+def chat(gpt_client, deployment_name, prompt, system_message=None,
+         temperature=None, max_tokens=1000, response_format=None):
+    """
+    Chat completion using GPT model.
+
+    Args:
+        gpt_client: OpenAI client instance.
+        deployment_name: Model/deployment name.
+        prompt: User prompt.
+        system_message: Optional custom system message.
+        temperature: Optional temperature setting.
+        max_tokens: Maximum tokens in response.
+        response_format: Optional response format, e.g. a JSON schema.
+
+    Returns:
+        str: Response content.
+    """
+    params = _chat_params(deployment_name, prompt, system_message,
+                          temperature, max_tokens, response_format)
+
+    response = call_with_retry(
+        deployment_name,
+        gpt_client.chat.completions.create,
+        estimated_tokens=estimate_tokens(params["messages"], max_tokens),
+        **params
+    )
 
     result = response.choices[0].message.content
     return result
+
+
+async def chat_async(gpt_client, deployment_name, prompt, system_message=None,
+                     temperature=None, max_tokens=1000, response_format=None):
+    """
+    Async counterpart of chat, for an AsyncAzureOpenAI client.
+
+    Returns:
+        str: Response content.
+    """
+    params = _chat_params(deployment_name, prompt, system_message,
+                          temperature, max_tokens, response_format)
+
+    response = await call_with_retry_async(
+        deployment_name,
+        gpt_client.chat.completions.create,
+        estimated_tokens=estimate_tokens(params["messages"], max_tokens),
+        **params
+    )
+
+    return response.choices[0].message.content
+
+
+async def transcribe_file_async(client, audio_file_path, deployment_name):
+    """
+    Transcribes an audio file with an async Whisper client.
+
+    The file is read in a worker thread so the event loop isn't blocked.
+
+    Returns:
+        str: The transcribed text.
+    """
+    def read_audio():
+        with open(audio_file_path, "rb") as audio_file:
+            return audio_file.read()
+
+    audio_bytes = await asyncio.to_thread(read_audio)
+    return await transcribe_bytes_async(
+        client, os.path.basename(audio_file_path), audio_bytes,
+        deployment_name)
+
+
+async def transcribe_bytes_async(client, file_name, audio_bytes,
+                                 deployment_name, prompt=None):
+    """
+    Transcribes in-memory audio with an async Whisper client.
+
+    Args:
+        client: AsyncAzureOpenAI client for the Whisper endpoint.
+        file_name (str): Name sent with the upload; its extension tells
+            Whisper the audio format.
+        audio_bytes (bytes): Encoded audio.
+        deployment_name (str): Whisper deployment name.
+        prompt (str, optional): Text preceding this audio, which helps
+            Whisper continue a sentence across segments.
+
+    Returns:
+        str: The transcribed text.
+    """
+    extra = {"prompt": prompt} if prompt else {}
+    result = await call_with_retry_async(
+        deployment_name,
+        client.audio.transcriptions.create,
+        file=(file_name, audio_bytes),
+        model=deployment_name,
+        **extra
+    )
+    return result.text
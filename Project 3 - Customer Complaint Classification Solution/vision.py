@@ -1,17 +1,68 @@
 # vision.py
 
+import asyncio
+import json
 import os
-from PIL import Image, ImageDraw, ImageFont
+from annotation import AnnotationJob, render_async, render_offloaded
+from artifacts import write_json, write_text
 from utils import (
     create_azure_openai_client,
-    describe_local_image
+    create_async_azure_openai_client,
+    describe_local_image,
+    describe_local_image_async
+)
+
+# Prompt for image description with location details
+DESCRIPTION_PROMPT = (
+    "Analyze this image in detail and describe any defects, issues, "
+    "or problems visible. For each defect, describe:\n"
+    "1. What the defect is (crack, damage, wrong item, etc.)\n"
+    "2. Where it is located in the image (center, top-left, bottom-right, "
+    "foreground, background, etc.)\n"
+    "3. The size and appearance of the defect\n"
+    "4. Any other notable visual elements\n"
+    "Be very specific about defect locations and appearances. "
+    "Focus on issues that would be part of a customer complaint."
+)
+
+# Prompt asking for defect locations in terms annotate_image understands
+LOCATION_PROMPT = (
+    "Analyze this image and identify ALL defects, damages, or issues. "
+    "For each defect, describe:\n"
+    "1. The type of defect (crack, break, damage, wrong item, etc.)\n"
+    "2. Its EXACT location using these terms: "
+    "'center', 'top', 'bottom', 'left', 'right', 'top-left', "
+    "'top-right', 'bottom-left', 'bottom-right', 'foreground', "
+    "'background'\n"
+    "3. Approximate size (small, medium, large)\n"
+    "4. What part of the product is affected\n"
+    "Be very specific about locations. List each defect separately."
+)
+
+# Prompt for a single call returning both the description and defect boxes
+ANALYSIS_PROMPT = (
+    "Analyze this image in detail and describe any defects, issues, "
+    "or problems visible. Respond with ONLY a JSON object of this form:\n"
+    '{"description": "<detailed description of the image and every defect: '
+    'what it is, where it is, its size and appearance, and any other '
+    'notable visual elements>", '
+    '"defects": [{"type": "<crack, break, damage, wrong item, etc.>", '
+    '"location": "<center, top, bottom, left, right, top-left, top-right, '
+    'bottom-left, bottom-right, foreground or background>", '
+    '"size": "<small, medium or large>", '
+    '"part": "<affected part of the product>", '
+    '"box": [x_min, y_min, x_max, y_max]}]}\n'
+    "Box coordinates are fractions of the image width and height between "
+    "0 and 1, with (0, 0) at the top-left corner. List each defect "
+    "separately and focus on issues that would be part of a customer "
+    "complaint."
 )
 
 # Function to describe the generated image and annotate issues
 
 
 def describe_image(image_path="output/generated_image.png",
-                   deployment_name=None):
+                   deployment_name=None, output_dir="output", analysis=None):
     """
     Describes an image and identifies key visual elements related to the
     customer complaint.
@@ -20,6 +71,10 @@ def describe_image(image_path="output/generated_image.png",
         image_path (str): Path to the generated image to describe.
         deployment_name (str, optional): Model/deployment name for vision API.
             If not provided, uses GPT_DEPLOYMENT from environment.
+        output_dir (str): Directory where the description is saved.
+        analysis (dict, optional): Result of analyze_image for this image.
+            If provided, its description is used and no vision call is
+            made.
 
     Returns:
         str: A description of the image, including the annotated details.
@@ -28,9 +83,191 @@ def describe_image(image_path="output/generated_image.png",
     if not os.path.exists(image_path):
         raise FileNotFoundError(f"Image file not found: {image_path}")
 
+    if analysis is not None:
+        _save_description(analysis["description"], output_dir)
+        return analysis["description"]
+
     # Create Azure OpenAI client
     client = create_azure_openai_client()
+    deployment_name = _resolve_deployment(deployment_name)
+
+    # Use utility function to describe the image
+    description = describe_local_image(
+        client=client,
+        image_path=image_path,
+        deployment_name=deployment_name,
+        prompt=DESCRIPTION_PROMPT
+    )
+
+    _save_description(description, output_dir)
+    return description
+
+
+async def describe_image_async(image_path="output/generated_image.png",
+                               deployment_name=None, output_dir="output",
+                               analysis=None):
+    """
+    Async counterpart of describe_image, using the async vision client.
+
+    Args:
+        image_path (str): Path to the generated image to describe.
+        deployment_name (str, optional): Model/deployment name for vision API.
+            If not provided, uses GPT_DEPLOYMENT from environment.
+        output_dir (str): Directory where the description is saved.
+        analysis (dict, optional): Result of analyze_image for this image.
+            If provided, its description is used and no vision call is
+            made.
+
+    Returns:
+        str: A description of the image, including the annotated details.
+    """
+    if not os.path.exists(image_path):
+        raise FileNotFoundError(f"Image file not found: {image_path}")
+
+    if analysis is not None:
+        await asyncio.to_thread(_save_description, analysis["description"],
+                                output_dir)
+        return analysis["description"]
+
+    client = create_async_azure_openai_client()
+    deployment_name = _resolve_deployment(deployment_name)
+
+    description = await describe_local_image_async(
+        client=client,
+        image_path=image_path,
+        deployment_name=deployment_name,
+        prompt=DESCRIPTION_PROMPT
+    )
+
+    await asyncio.to_thread(_save_description, description, output_dir)
+    return description
+
+
+def analyze_image(image_path="output/generated_image.png",
+                  deployment_name=None, output_dir="output"):
+    """
+    Describes the image and locates its defects with a single vision call,
+    so describe_image and annotate_image can share one upload and one
+    model round-trip.
+
+    Args:
+        image_path (str): Path to the generated image to analyze.
+        deployment_name (str, optional): Model/deployment name for vision API.
+            If not provided, uses GPT_DEPLOYMENT from environment.
+        output_dir (str): Directory where the analysis is saved.
+
+    Returns:
+        dict: {"description": str, "defects": list}, where each defect has
+            type, location, size, part and a normalized box
+            [x_min, y_min, x_max, y_max] (or None if the model gave none).
+    """
+    if not os.path.exists(image_path):
+        raise FileNotFoundError(f"Image file not found: {image_path}")
+
+    client = create_azure_openai_client()
+    deployment_name = _resolve_deployment(deployment_name)
+
+    analysis_text = describe_local_image(
+        client=client,
+        image_path=image_path,
+        deployment_name=deployment_name,
+        prompt=ANALYSIS_PROMPT,
+        response_format={"type": "json_object"}
+    )
+
+    analysis = parse_analysis(analysis_text)
+    _save_analysis(analysis, output_dir)
+    return analysis
+
+
+async def analyze_image_async(image_path="output/generated_image.png",
+                              deployment_name=None, output_dir="output"):
+    """Async counterpart of analyze_image."""
+    if not os.path.exists(image_path):
+        raise FileNotFoundError(f"Image file not found: {image_path}")
+
+    client = create_async_azure_openai_client()
+    deployment_name = _resolve_deployment(deployment_name)
+
+    analysis_text = await describe_local_image_async(
+        client=client,
+        image_path=image_path,
+        deployment_name=deployment_name,
+        prompt=ANALYSIS_PROMPT,
+        response_format={"type": "json_object"}
+    )
+
+    analysis = parse_analysis(analysis_text)
+    await asyncio.to_thread(_save_analysis, analysis, output_dir)
+    return analysis
 
+
+def parse_analysis(analysis_text):
+    """
+    Parses the JSON returned for ANALYSIS_PROMPT.
+
+    Boxes are clamped to the 0-1 range and dropped if malformed. If the
+    text isn't valid JSON, the whole text becomes the description and no
+    defects are returned, so annotation falls back to its default box.
+
+    Args:
+        analysis_text (str): Raw model response.
+
+    Returns:
+        dict: {"description": str, "defects": list}.
+    """
+    text = analysis_text.strip()
+    if text.startswith("```"):
+        # Strip a Markdown code fence around the JSON
+        text = text.strip("`")
+        if text.startswith("json"):
+            text = text[len("json"):]
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return {"description": analysis_text, "defects": []}
+    if not isinstance(data, dict):
+        return {"description": analysis_text, "defects": []}
+
+    defects = []
+    for defect in data.get("defects") or []:
+        if not isinstance(defect, dict):
+            continue
+        defects.append({
+            "type": str(defect.get("type", "")),
+            "location": str(defect.get("location", "")),
+            "size": str(defect.get("size", "")),
+            "part": str(defect.get("part", "")),
+            "box": _normalize_box(defect.get("box")),
+        })
+
+    return {
+        "description": str(data.get("description") or analysis_text),
+        "defects": defects,
+    }
+
+
+def _normalize_box(box):
+    """Returns [x1, y1, x2, y2] clamped to 0-1, or None if invalid."""
+    if not isinstance(box, (list, tuple)) or len(box) != 4:
+        return None
+    try:
+        x1, y1, x2, y2 = (min(1.0, max(0.0, float(v))) for v in box)
+    except (TypeError, ValueError):
+        return None
+    x1, x2 = sorted((x1, x2))
+    y1, y2 = sorted((y1, y2))
+    if x2 - x1 <= 0 or y2 - y1 <= 0:
+        return None
+    return [x1, y1, x2, y2]
+
+
+def _save_analysis(analysis, output_dir):
+    # Save intermediate result
+    write_json(os.path.join(output_dir, "image_analysis.json"), analysis)
+
+
+def _resolve_deployment(deployment_name):
     # Use deployment name from environment if not provided
     if not deployment_name:
         deployment_name = os.getenv('GPT_DEPLOYMENT')
@@ -39,34 +276,13 @@ def describe_image(image_path="output/generated_image.png",
                 "GPT_DEPLOYMENT environment variable not set. "
                 "Please set it in your .env file or provide deployment_name."
             )
+    return deployment_name
 
-    # Create prompt for image description with location details
-    prompt = (
-        "Analyze this image in detail and describe any defects, issues, "
-        "or problems visible. For each defect, describe:\n"
-        "1. What the defect is (crack, damage, wrong item, etc.)\n"
-        "2. Where it is located in the image (center, top-left, bottom-right, "
-        "foreground, background, etc.)\n"
-        "3. The size and appearance of the defect\n"
-        "4. Any other notable visual elements\n"
-        "Be very specific about defect locations and appearances. "
-        "Focus on issues that would be part of a customer complaint."
-    )
-
-    # Use utility function to describe the image
-    description = describe_local_image(
-        client=client,
-        image_path=image_path,
-        deployment_name=deployment_name,
-        prompt=prompt
-    )
 
+def _save_description(description, output_dir):
     # Save intermediate result
-    os.makedirs("output", exist_ok=True)
-    with open("output/image_description.txt", "w", encoding="utf-8") as f:
-        f.write(description)
-
-    return description
+    write_text(os.path.join(output_dir, "image_description.txt"),
+               description)
 
 
 def get_defect_locations(image_path, deployment_name=None):
@@ -80,46 +296,44 @@ def get_defect_locations(image_path, deployment_name=None):
     Returns:
         str: Description with location information.
     """
-    if not deployment_name:
-        deployment_name = os.getenv('GPT_DEPLOYMENT')
-        if not deployment_name:
-            raise ValueError(
-                "GPT_DEPLOYMENT environment variable not set."
-            )
-
+    deployment_name = _resolve_deployment(deployment_name)
     client = create_azure_openai_client()
 
-    location_prompt = (
-        "Analyze this image and identify ALL defects, damages, or issues. "
-        "For each defect, describe:\n"
-        "1. The type of defect (crack, break, damage, wrong item, etc.)\n"
-        "2. Its EXACT location using these terms: "
-        "'center', 'top', 'bottom', 'left', 'right', 'top-left', "
-        "'top-right', 'bottom-left', 'bottom-right', 'foreground', "
-        "'background'\n"
-        "3. Approximate size (small, medium, large)\n"
-        "4. What part of the product is affected\n"
-        "Be very specific about locations. List each defect separately."
-    )
-
     location_info = describe_local_image(
         client=client,
         image_path=image_path,
         deployment_name=deployment_name,
-        prompt=location_prompt
+        prompt=LOCATION_PROMPT
     )
 
     return location_info
 
 
+async def get_defect_locations_async(image_path, deployment_name=None):
+    """Async counterpart of get_defect_locations."""
+    deployment_name = _resolve_deployment(deployment_name)
+    client = create_async_azure_openai_client()
+
+    return await describe_local_image_async(
+        client=client,
+        image_path=image_path,
+        deployment_name=deployment_name,
+        prompt=LOCATION_PROMPT
+    )
+
+
 def annotate_image(image_path="output/generated_image.png",
-                   deployment_name=None):
+                   deployment_name=None, output_dir="output", analysis=None):
     """
     Annotates the image with bounding boxes highlighting defect areas.
 
     Args:
         image_path (str): Path to the generated image.
         deployment_name (str, optional): Model/deployment name for vision API.
+        output_dir (str): Directory where the annotated image is saved.
+        analysis (dict, optional): Result of analyze_image for this image.
+            If provided, its defect boxes are drawn and no vision call is
+            made.
 
     Returns:
         str: Path to the annotated image.
@@ -127,116 +341,83 @@ def annotate_image(image_path="output/generated_image.png",
     if not os.path.exists(image_path):
         raise FileNotFoundError(f"Image file not found: {image_path}")
 
+    if analysis is not None:
+        return render_offloaded(_analysis_job(image_path, analysis,
+                                              output_dir))
+
     # Get detailed location information from vision API
     location_info = get_defect_locations(image_path, deployment_name)
 
-    # Load the image
-    img = Image.open(image_path)
-    draw = ImageDraw.Draw(img)
-    width, height = img.size
-
-    # Analyze location info to identify defect areas
-    defect_areas = []
-    location_info_lower = location_info.lower()
-
-    # Define location mappings to coordinates
-    location_coords = {
-        'center': (width * 0.25, height * 0.25, width * 0.75, height * 0.75),
-        'top': (width * 0.2, height * 0.05, width * 0.8, height * 0.35),
-        'bottom': (width * 0.2, height * 0.65, width * 0.8, height * 0.95),
-        'left': (width * 0.05, height * 0.2, width * 0.45, height * 0.8),
-        'right': (width * 0.55, height * 0.2, width * 0.95, height * 0.8),
-        'top-left': (width * 0.05, height * 0.05,
-                     width * 0.45, height * 0.35),
-        'top-right': (width * 0.55, height * 0.05,
-                      width * 0.95, height * 0.35),
-        'bottom-left': (width * 0.05, height * 0.65,
-                        width * 0.45, height * 0.95),
-        'bottom-right': (width * 0.55, height * 0.65,
-                         width * 0.95, height * 0.95),
-        'foreground': (width * 0.15, height * 0.3, width * 0.85, height * 0.7),
-    }
+    return render_offloaded(_annotation_job(image_path, location_info,
+                                            output_dir))
 
-    # Find all mentioned locations
-    found_locations = []
-    for loc_name, coords in location_coords.items():
-        # Check for location mentions (with word boundaries)
-        if (f' {loc_name} ' in location_info_lower or
-                location_info_lower.startswith(f'{loc_name} ') or
-                location_info_lower.endswith(f' {loc_name}')):
-            found_locations.append((loc_name, coords))
-
-    # If specific locations found, use them
-    if found_locations:
-        defect_areas = [coords for _, coords in found_locations]
-    else:
-        # Fallback: check for defect keywords and use center
-        defect_keywords = [
-            'crack', 'damage', 'broken', 'defect', 'issue', 'problem',
-            'screen', 'surface', 'foreground'
-        ]
-        has_defect = any(keyword in location_info_lower
-                         for keyword in defect_keywords)
-        if has_defect:
-            defect_areas.append(location_coords['center'])
-        else:
-            # Default to center for main subject
-            defect_areas.append(location_coords['center'])
-
-    # Draw bounding boxes for each defect area
-    box_color = (255, 0, 0)  # Red color for bounding boxes
-    box_width = 5  # Thickness of the bounding box lines
-
-    for i, (x1, y1, x2, y2) in enumerate(defect_areas):
-        # Draw rectangle
-        draw.rectangle(
-            [x1, y1, x2, y2],
-            outline=box_color,
-            width=box_width
-        )
-
-        # Add label if possible
-        try:
-            # Try to use default font, fallback to basic if not available
-            try:
-                font = ImageFont.truetype("arial.ttf", 20)
-            except (OSError, IOError):
-                try:
-                    font = ImageFont.truetype(
-                        "C:/Windows/Fonts/arial.ttf", 20)
-                except (OSError, IOError):
-                    font = ImageFont.load_default()
-
-            label = f"Defect Area {i+1}"
-            # Get text bounding box
-            bbox = draw.textbbox((0, 0), label, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-
-            # Draw background for text
-            draw.rectangle(
-                [x1, y1 - text_height - 5, x1 + text_width + 10,
-                 y1],
-                fill=box_color
-            )
 
-            # Draw text
-            draw.text(
-                (x1 + 5, y1 - text_height - 2),
-                label,
-                fill=(255, 255, 255),  # White text
-                font=font
-            )
-        except (OSError, IOError, AttributeError):
-            # If font loading fails, just draw the box
-            pass
+async def annotate_image_async(image_path="output/generated_image.png",
+                               deployment_name=None, output_dir="output",
+                               analysis=None):
+    """
+    Async counterpart of annotate_image. The vision call runs on the event
+    loop and the drawing runs in the annotation process pool, or a worker
+    thread if none is configured.
+
+    Args:
+        image_path (str): Path to the generated image.
+        deployment_name (str, optional): Model/deployment name for vision API.
+        output_dir (str): Directory where the annotated image is saved.
+        analysis (dict, optional): Result of analyze_image for this image.
+            If provided, its defect boxes are drawn and no vision call is
+            made.
+
+    Returns:
+        str: Path to the annotated image.
+    """
+    if not os.path.exists(image_path):
+        raise FileNotFoundError(f"Image file not found: {image_path}")
+
+    if analysis is not None:
+        return await render_async(_analysis_job(image_path, analysis,
+                                                output_dir))
 
-    # Save annotated image
-    os.makedirs("output", exist_ok=True)
-    annotated_path = "output/annotated_image.png"
-    img.save(annotated_path)
+    location_info = await get_defect_locations_async(image_path,
+                                                     deployment_name)
+
+    return await render_async(_annotation_job(image_path, location_info,
+                                              output_dir))
+
+
+def _analysis_job(image_path, analysis, output_dir):
+    """Builds the job drawing analyze_image boxes, with locations as
+    fallback."""
+    defect_boxes = [defect["box"] for defect in analysis["defects"]
+                    if defect.get("box")]
+    location_info = " ".join(
+        f"{defect['type']} {defect['location']}"
+        for defect in analysis["defects"]
+    )
+    return _annotation_job(image_path, location_info, output_dir,
+                           defect_boxes=defect_boxes)
+
+
+def _annotation_job(image_path, location_info, output_dir,
+                    defect_boxes=None):
+    """
+    Describes the annotated image to render.
+
+    Args:
+        image_path (str): Path to the image to annotate.
+        location_info (str): Text mentioning defect locations, used when
+            no explicit boxes are given.
+        output_dir (str): Directory where the annotated image is saved.
+        defect_boxes (list, optional): Normalized [x1, y1, x2, y2] boxes.
+
+    Returns:
+        AnnotationJob: Job for annotation.render.
+    """
+    annotated_path = os.path.join(output_dir, "annotated_image.png")
+    return AnnotationJob(image_path, annotated_path,
+                         [tuple(box) for box in defect_boxes or []],
+                         location_info)
 
-    return annotated_path
 
 # Example Usage (for testing purposes, remove/comment when deploying):
 # if __name__ == "__main__":
@@ -1,13 +1,39 @@
 # whisper.py
 
+import asyncio
+import contextvars
 import os
-from utils import create_whisper_openai_client
+from concurrent.futures import ThreadPoolExecutor
+from utils import (
+    create_whisper_openai_client,
+    create_async_whisper_openai_client,
+    transcribe_bytes_async
+)
+from cache import get_cache, hash_key, file_digest
+from resilience import burst_limit, call_with_retry
+from audio_chunking import (
+    append_transcript,
+    chunk_settings,
+    split_audio,
+    stitch_transcripts,
+    tail_wav
+)
+from audio_preprocessing import prepare_upload, preprocess_settings
+from artifacts import write_text
+
+# Whisper rejects uploads above 25 MB; larger files are always chunked
+MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+# Trailing words of the transcript so far sent as the prompt for the next
+# live segment
+STREAM_PROMPT_WORDS = 50
+DEFAULT_STREAM_WINDOW = 10.0
 
 # Function to transcribe customer audio complaints using the Whisper model
 
 
 def transcribe_audio(audio_file_path="audio/complaint.mp3",
-                     deployment_name=None):
+                     deployment_name=None, output_dir="output",
+                     use_cache=True, chunked=None):
     """
     Transcribes an audio file into text using Azure OpenAI's Whisper model.
 
@@ -15,6 +41,13 @@ def transcribe_audio(audio_file_path="audio/complaint.mp3",
         audio_file_path (str): Path to the audio file to transcribe.
         deployment_name (str, optional): Whisper deployment name.
             If not provided, uses WHISPER_DEPLOYMENT from environment.
+        output_dir (str): Directory where the transcription is saved.
+        use_cache (bool): Reuse a cached transcription of the same audio
+            bytes and deployment instead of calling Whisper again.
+        chunked (bool, optional): Split the recording at pauses into
+            overlapping chunks and transcribe them concurrently. Defaults
+            to WHISPER_CHUNKED from environment, and is always used for
+            files over Whisper's 25 MB upload limit.
 
     Returns:
         str: The transcribed text of the audio file.
@@ -23,6 +56,117 @@ def transcribe_audio(audio_file_path="audio/complaint.mp3",
     if not os.path.exists(audio_file_path):
         raise FileNotFoundError(f"Audio file not found: {audio_file_path}")
 
+    whisper_deployment = _resolve_deployment(deployment_name)
+    chunked = _use_chunking(chunked, audio_file_path)
+
+    # Reuse an earlier transcription of the same recording if cached
+    cache = get_cache() if use_cache else None
+    transcription_text = None
+    if cache:
+        cache_key = _cache_key(file_digest(audio_file_path),
+                               whisper_deployment, chunked)
+        transcription_text = cache.get_text("transcription", cache_key)
+
+    if transcription_text is None:
+        if chunked:
+            transcription_text = _transcribe_chunks(audio_file_path,
+                                                    whisper_deployment)
+        else:
+            transcription_text = _request_transcription(audio_file_path,
+                                                        whisper_deployment)
+        if cache:
+            cache.put_text("transcription", cache_key, transcription_text)
+
+    _save_transcription(transcription_text, output_dir)
+    return transcription_text
+
+
+async def transcribe_audio_async(audio_file_path="audio/complaint.mp3",
+                                 deployment_name=None, output_dir="output",
+                                 use_cache=True, chunked=None):
+    """
+    Async counterpart of transcribe_audio, using the async Whisper client.
+
+    Args:
+        audio_file_path (str): Path to the audio file to transcribe.
+        deployment_name (str, optional): Whisper deployment name.
+            If not provided, uses WHISPER_DEPLOYMENT from environment.
+        output_dir (str): Directory where the transcription is saved.
+        use_cache (bool): Reuse a cached transcription of the same audio
+            bytes and deployment instead of calling Whisper again.
+        chunked (bool, optional): Split the recording at pauses into
+            overlapping chunks and transcribe them concurrently. Defaults
+            to WHISPER_CHUNKED from environment, and is always used for
+            files over Whisper's 25 MB upload limit.
+
+    Returns:
+        str: The transcribed text of the audio file.
+    """
+    if not os.path.exists(audio_file_path):
+        raise FileNotFoundError(f"Audio file not found: {audio_file_path}")
+
+    whisper_deployment = _resolve_deployment(deployment_name)
+    chunked = _use_chunking(chunked, audio_file_path)
+
+    cache = get_cache() if use_cache else None
+    transcription_text = None
+    if cache:
+        audio_digest = await asyncio.to_thread(file_digest, audio_file_path)
+        cache_key = _cache_key(audio_digest, whisper_deployment, chunked)
+        transcription_text = cache.get_text("transcription", cache_key)
+
+    if transcription_text is None:
+        client = create_async_whisper_openai_client(
+            api_version=_whisper_api_version())
+        try:
+            if chunked:
+                transcription_text = await _transcribe_chunks_async(
+                    client, audio_file_path, whisper_deployment)
+            else:
+                file_name, audio_bytes = await asyncio.to_thread(
+                    prepare_upload, audio_file_path)
+                transcription_text = await transcribe_bytes_async(
+                    client, file_name, audio_bytes, whisper_deployment)
+        except Exception as e:
+            deployment_error = _deployment_error(e, whisper_deployment)
+            if deployment_error:
+                raise deployment_error from e
+            raise
+        if cache:
+            cache.put_text("transcription", cache_key, transcription_text)
+
+    await asyncio.to_thread(_save_transcription, transcription_text,
+                            output_dir)
+    return transcription_text
+
+
+def _use_chunking(chunked, audio_file_path):
+    """Decides whether to split the recording, see transcribe_audio."""
+    if os.path.getsize(audio_file_path) > MAX_UPLOAD_BYTES:
+        return True
+    if chunked is None:
+        value = os.getenv('WHISPER_CHUNKED', '').strip().lower()
+        chunked = value in ("1", "true", "yes")
+    return chunked
+
+
+def _cache_key(audio_digest, whisper_deployment, chunked):
+    # Chunk boundaries and preprocessing can change the text slightly, so
+    # their results are cached separately per setting. Chunks are sent as
+    # plain WAV without upload preprocessing, so only the chunk settings
+    # matter for chunked transcriptions
+    parts = [audio_digest, whisper_deployment]
+    if chunked:
+        parts += ["chunked", *map(str, chunk_settings())]
+        return hash_key(*parts)
+    settings = preprocess_settings()
+    if settings[0] != "original":
+        parts += ["preprocessed", *map(str, settings)]
+    return hash_key(*parts)
+
+
+def _resolve_deployment(deployment_name):
+    """Returns the Whisper deployment name, defaulting to the environment."""
     # Use deployment name if provided, otherwise get from environment
     whisper_deployment = deployment_name or os.getenv('WHISPER_DEPLOYMENT')
     if not whisper_deployment:
@@ -35,49 +179,216 @@ def transcribe_audio(audio_file_path="audio/complaint.mp3",
         )
 
     # Clean up deployment name (remove quotes if present)
-    whisper_deployment = whisper_deployment.strip().strip('"').strip("'")
+    return whisper_deployment.strip().strip('"').strip("'")
+
 
+def _whisper_api_version():
     # Use Whisper-specific API version if available, otherwise use default
     # Whisper typically uses API version 2024-06-01 or later
-    whisper_api_version = (
+    return (
         os.getenv('WHISPER_VERSION') or
         os.getenv('GPT_VERSION') or
         '2024-06-01'  # Default API version for Whisper
     )
 
+
+def _deployment_error(error, whisper_deployment):
+    """
+    Wraps a DeploymentNotFound error in a ValueError with troubleshooting
+    steps, or returns None for any other error.
+    """
+    error_msg = str(error)
+    if "DeploymentNotFound" in error_msg:
+        return ValueError(
+            f"Whisper deployment '{whisper_deployment}' not found. "
+            f"Please verify:\n"
+            f"1. The deployment name is correct in your .env file\n"
+            f"2. The deployment exists in your Azure OpenAI resource\n"
+            f"3. The deployment is active and accessible\n"
+            f"Original error: {error_msg}"
+        )
+    return None
+
+
+def _save_transcription(transcription_text, output_dir):
+    # Save intermediate result
+    write_text(os.path.join(output_dir, "transcription.txt"),
+               transcription_text)
+
+
+def _request_transcription(audio_file_path, whisper_deployment):
+    """Sends an audio file to the Whisper deployment and returns the text."""
     # Call the Whisper model to transcribe the audio file.
     # This uses WHISPER_ENDPOINT and WHISPER_API_KEY if available,
     # otherwise falls back to main endpoint/key
-    client = create_whisper_openai_client(api_version=whisper_api_version)
+    # Read (and optionally shrink) the audio up front so a retried
+    # request can resend it
+    file_name, audio_bytes = prepare_upload(audio_file_path)
+
+    return _request_bytes(file_name, audio_bytes, whisper_deployment)
+
+
+def _request_bytes(file_name, audio_bytes, whisper_deployment, prompt=None):
+    """Sends in-memory audio to Whisper and returns the text."""
+    client = create_whisper_openai_client(api_version=_whisper_api_version())
+    extra = {"prompt": prompt} if prompt else {}
 
     try:
-        with open(audio_file_path, "rb") as audio_file:
-            result = client.audio.transcriptions.create(
-                file=audio_file,
-                model=whisper_deployment
-            )
+        result = call_with_retry(
+            whisper_deployment,
+            client.audio.transcriptions.create,
+            file=(file_name, audio_bytes),
+            model=whisper_deployment,
+            **extra
+        )
     except Exception as e:
-        error_msg = str(e)
-        if "DeploymentNotFound" in error_msg:
-            raise ValueError(
-                f"Whisper deployment '{whisper_deployment}' not found. "
-                f"Please verify:\n"
-                f"1. The deployment name is correct in your .env file\n"
-                f"2. The deployment exists in your Azure OpenAI resource\n"
-                f"3. The deployment is active and accessible\n"
-                f"Original error: {error_msg}"
-            ) from e
+        deployment_error = _deployment_error(e, whisper_deployment)
+        if deployment_error:
+            raise deployment_error from e
         raise
 
     # Extract the transcription and return it.
-    transcription_text = result.text
+    return result.text
 
-    # Save intermediate result
-    os.makedirs("output", exist_ok=True)
-    with open("output/transcription.txt", "w", encoding="utf-8") as f:
-        f.write(transcription_text)
 
-    return transcription_text
+def _transcribe_chunks(audio_file_path, whisper_deployment):
+    """
+    Splits a recording into overlapping chunks, transcribes them
+    concurrently and stitches the text back together.
+    """
+    chunks = split_audio(audio_file_path)
+    # Each worker runs in a copy of this context, so its requests are
+    # counted towards the calling stage
+    contexts = [contextvars.copy_context() for _ in chunks]
+    concurrency = _chunk_concurrency(len(chunks), whisper_deployment)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        texts = list(executor.map(
+            lambda context, chunk: context.run(
+                _request_bytes, chunk[0], chunk[1], whisper_deployment),
+            contexts, chunks
+        ))
+    return stitch_transcripts(texts)
+
+
+async def _transcribe_chunks_async(client, audio_file_path,
+                                   whisper_deployment):
+    """Async counterpart of _transcribe_chunks."""
+    chunks = await asyncio.to_thread(split_audio, audio_file_path)
+    semaphore = asyncio.Semaphore(
+        _chunk_concurrency(len(chunks), whisper_deployment))
+
+    async def transcribe(file_name, audio_bytes):
+        async with semaphore:
+            return await transcribe_bytes_async(client, file_name,
+                                                audio_bytes,
+                                                whisper_deployment)
+
+    texts = await asyncio.gather(*(transcribe(name, audio_bytes)
+                                   for name, audio_bytes in chunks))
+    return stitch_transcripts(texts)
+
+
+def transcribe_stream(source, deployment_name=None, output_dir=None,
+                      window_seconds=None, overlap_seconds=1.0):
+    """
+    Transcribes a call while it is still being recorded, yielding the
+    transcript so far after every new window of audio.
+
+    Args:
+        source (str or iterable): Path to a WAV file that is still
+            growing, followed with audio_chunking.tail_wav, or an iterable
+            of (file name, audio bytes) segments pushed by the caller, in
+            order, e.g. iter(queue.get, None). Pushed segments may be in
+            any format Whisper accepts.
+        deployment_name (str, optional): Whisper deployment name.
+            If not provided, uses WHISPER_DEPLOYMENT from environment.
+        output_dir (str, optional): Directory where transcription.txt is
+            rewritten after every segment.
+        window_seconds (float, optional): Audio per window when tailing a
+            file. Defaults to WHISPER_STREAM_WINDOW from environment or 10.
+        overlap_seconds (float): Audio shared by consecutive windows when
+            tailing a file; the repeated words are dropped.
+
+    Yields:
+        str: The partial transcription, growing with each segment. The
+            last value is the full transcription.
+    """
+    whisper_deployment = _resolve_deployment(deployment_name)
+    words = []
+    for file_name, audio_bytes in _stream_segments(source, window_seconds,
+                                                   overlap_seconds):
+        text = _request_bytes(file_name, audio_bytes, whisper_deployment,
+                              prompt=" ".join(words[-STREAM_PROMPT_WORDS:]))
+        append_transcript(words, text)
+        partial = " ".join(words)
+        if output_dir:
+            _save_transcription(partial, output_dir)
+        yield partial
+
+
+async def transcribe_stream_async(segments, deployment_name=None,
+                                  output_dir=None):
+    """
+    Async counterpart of transcribe_stream for segments pushed from async
+    code.
+
+    Args:
+        segments (async iterable): (file name, audio bytes) segments, in
+            order, e.g. read from an asyncio.Queue by an async generator.
+        deployment_name (str, optional): Whisper deployment name.
+            If not provided, uses WHISPER_DEPLOYMENT from environment.
+        output_dir (str, optional): Directory where transcription.txt is
+            rewritten after every segment.
+
+    Yields:
+        str: The partial transcription, growing with each segment.
+    """
+    whisper_deployment = _resolve_deployment(deployment_name)
+    client = create_async_whisper_openai_client(
+        api_version=_whisper_api_version())
+    words = []
+    async for file_name, audio_bytes in segments:
+        try:
+            text = await transcribe_bytes_async(
+                client, file_name, audio_bytes, whisper_deployment,
+                prompt=" ".join(words[-STREAM_PROMPT_WORDS:]))
+        except Exception as e:
+            deployment_error = _deployment_error(e, whisper_deployment)
+            if deployment_error:
+                raise deployment_error from e
+            raise
+        append_transcript(words, text)
+        partial = " ".join(words)
+        if output_dir:
+            await asyncio.to_thread(_save_transcription, partial, output_dir)
+        yield partial
+
+
+def _stream_segments(source, window_seconds, overlap_seconds):
+    """Returns the segments to transcribe, see transcribe_stream."""
+    if not isinstance(source, str):
+        return source
+    if window_seconds is None:
+        window_seconds = float(os.getenv('WHISPER_STREAM_WINDOW',
+                                         DEFAULT_STREAM_WINDOW))
+    return tail_wav(source, window_seconds, overlap_seconds)
+
+
+def _chunk_concurrency(chunk_count, whisper_deployment):
+    """
+    Returns how many chunks to transcribe at once: all of them, so a call
+    takes about as long as its slowest chunk, but no more than the
+    deployment's RPM bucket admits at once (more would only queue in the
+    rate limiter) or WHISPER_CHUNK_CONCURRENCY from environment, if set.
+    """
+    concurrency = chunk_count
+    limit = burst_limit(whisper_deployment)
+    if limit is not None:
+        concurrency = min(concurrency, limit)
+    configured = os.getenv('WHISPER_CHUNK_CONCURRENCY')
+    if configured:
+        concurrency = min(concurrency, int(configured))
+    return max(1, concurrency)
 
 
 # Example Usage (for testing purposes, remove/comment when deploying):